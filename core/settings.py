@@ -40,6 +40,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'matrix.middleware.RequestMetricsMiddleware',
 ]
 
 ROOT_URLCONF = 'core.urls'
@@ -126,3 +127,73 @@ LOGIN_URL = 'login'
 
 
 
+
+# Placement/cycle work goes to the MatrixJob queue (run `manage.py run_matrix_worker`).
+# Set to True to run it inside the request instead, e.g. locally without a worker.
+MATRIX_PLACEMENT_INLINE = False
+
+# Per-member dashboard context cache (seconds), also the lifetime of the board
+# version behind /api/matrix/ ETags. Placement, cycle, upgrade and withdrawal
+# events drop a member's entries; this only bounds anything they miss.
+MATRIX_DASHBOARD_CACHE_SECONDS = 300
+
+# AdminRevenue counters are spread over this many rows; totals are their sum,
+# cached until the next write, for at most MATRIX_REVENUE_CACHE_SECONDS
+# (admin summary and revenue admin).
+MATRIX_REVENUE_SHARDS = 8
+MATRIX_REVENUE_CACHE_SECONDS = 30
+
+# reconcile_ledger folds Transaction rows into the running ledger totals once
+# they are this old (seconds); younger rows are summed live on every run.
+MATRIX_LEDGER_SETTLE_SECONDS = 300
+
+# Request timing (matrix.middleware): this share of requests is timed into a
+# rolling per-view window of MATRIX_METRICS_WINDOW samples per process, shown
+# at /system-admin/metrics/. A non-zero flush interval also writes one
+# RequestMetric row per view and period.
+MATRIX_METRICS_SAMPLE_RATE = 0.1
+MATRIX_METRICS_WINDOW = 500
+MATRIX_METRICS_FLUSH_SECONDS = 0
+
+# Tracing spans around placement, cycle and payout code (matrix.tracing). This
+# share of top-level calls is traced and written as one JSON line per trace to
+# MATRIX_TRACE_FILE; `manage.py slowest_traces` summarizes the file. Off by
+# default (nothing is written, tests included); e.g. 0.05 to trace 5%.
+MATRIX_TRACE_SAMPLE_RATE = 0
+MATRIX_TRACE_FILE = BASE_DIR / 'traces.log'
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'message': {'format': '%(message)s'},
+    },
+    'handlers': {
+        'traces': {
+            'class': 'logging.FileHandler',
+            'filename': MATRIX_TRACE_FILE,
+            'formatter': 'message',
+            'delay': True,
+        },
+    },
+    'loggers': {
+        'matrix.trace': {'handlers': ['traces'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
+# Admin summary counters (matrix.stats): the snapshot is cached this long
+# (seconds), and the matrix worker recounts them from the tables this often.
+MATRIX_STATS_CACHE_SECONDS = 30
+MATRIX_STATS_RECOMPUTE_SECONDS = 3600
+
+# Cached downline analytics per member (/api/downline/, seconds); a
+# registration, activation or board move below a member drops their entry.
+MATRIX_DOWNLINE_CACHE_SECONDS = 600
+
+# Append every MemberProfile/MatrixNode write to the matrix event log
+# (matrix.events) in the same transaction; replay_events rebuilds from it.
+# Off by default: it costs about a dozen extra queries per activation. After
+# switching it on for an existing database, start the log with
+# `manage.py replay_events --baseline`.
+MATRIX_EVENT_LOG = False
+
@@ -0,0 +1,251 @@
+from collections import Counter, defaultdict
+from decimal import Decimal
+from django.db import models, transaction
+from django.db.models import Case, F, Value, When
+from .models import MemberProfile, MatrixNode, Transaction
+from .frontier import next_open_slot, record_fill
+from .board_index import child_frame
+from .logic import BOARD_CONFIGS, place_member_with_spillover
+from .stats import members_moved
+from .downline import forget_uplines
+from .tracing import traced
+from . import cascade
+
+BATCH_SIZE = 200
+BOARD = 1
+COUNT_ATTR = 'board_1_count_value'
+LEFT_ATTR, RIGHT_ATTR = f'left_child_b{BOARD}', f'right_child_b{BOARD}'
+
+
+@traced()
+def activate_one(profile):
+    """The one-member path (status save, then spillover placement with its own recount)."""
+    with transaction.atomic():
+        profile.payment_status = 'paid'
+        profile.is_active = True
+        profile.is_already_placed_in_b1 = True # Prevent signal double-firing
+        profile.save()
+
+        if profile.sponser:
+            place_member_with_spillover(profile, profile.sponser, BOARD)
+
+
+class _BatchPlan:
+    """
+    In-memory Board 1 state for the members one batch touches. Placements that
+    cannot set off an upgrade or a cycle are applied here and written in bulk
+    by flush(); anything else goes through activate_one() after a flush.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.kids = {}        # profile pk -> [left pk, right pk]
+        self.count = {}       # profile pk -> board_1_count_value
+        self.board = {}       # profile pk -> current_board
+        self.node = {}        # profile pk -> its Board 1 MatrixNode (saved or planned), None if not placed
+        self.tree_roots = set()
+        self.frontier_built = set()
+        self._clear_pending()
+
+    def _clear_pending(self):
+        self.filled = set()
+        self.new_nodes = []
+        self.locked = []
+        self.recounted = set()
+        self.bonus = defaultdict(Decimal)
+        self.transactions = []
+
+    def load(self, pks):
+        missing = [pk for pk in set(pks) if pk is not None and pk not in self.kids]
+        if not missing:
+            return
+        rows = MemberProfile.objects.filter(pk__in=missing).values_list(
+            'pk', f'{LEFT_ATTR}_id', f'{RIGHT_ATTR}_id', COUNT_ATTR, 'current_board'
+        )
+        for pk, left_id, right_id, count, board in rows:
+            self.kids[pk] = [left_id, right_id]
+            self.count[pk] = count
+            self.board[pk] = board
+            self.node[pk] = None
+
+        nodes = MatrixNode.objects.filter(board=BOARD, user__memberprofile__in=missing).order_by('-pk').values_list(
+            'pk', 'user__memberprofile__id', 'parent_profile_id', 'tree_root_id', 'slot_index'
+        )
+        # Ordered newest first so the oldest node wins, like MatrixNode...first()
+        for pk, profile_id, parent_id, root_id, slot_index in nodes:
+            self.node[profile_id] = MatrixNode(pk=pk, parent_profile_id=parent_id, tree_root_id=root_id, slot_index=slot_index)
+
+        self.tree_roots.update(
+            MatrixNode.objects.filter(board=BOARD, tree_root__in=missing).values_list('tree_root_id', flat=True)
+        )
+
+    def fill(self, pk):
+        """Same l1 + l2 as MemberProfile._check_and_cycle, from the planned FKs."""
+        children = [kid for kid in self.kids[pk] if kid]
+        self.load(children)
+        return len(children) + sum(1 for child in children for kid in self.kids[child] if kid)
+
+    def place(self, member):
+        """Plans member's placement. Returns False (nothing planned) when it has to run one by one."""
+        self.load([member.pk])
+        if self.node[member.pk] is not None:
+            # place_member_with_spillover returns early for an already placed member
+            return True
+        if member.pk in self.tree_roots:
+            # Members already hang below it; place_node has to renumber them
+            return False
+
+        if member.sponser_id not in self.frontier_built or any(self.kids[member.pk]):
+            # next_open_slot / record_fill may rebuild a frontier from the FK columns
+            self.write_slots()
+        parent, position = next_open_slot(member.sponser, BOARD)
+        if parent is None:
+            return True
+        self.frontier_built.add(member.sponser_id)
+        if parent.pk == member.pk:
+            return False
+
+        self.load([parent.pk])
+        before = self.kids[parent.pk][position - 1]
+        self.kids[parent.pk][position - 1] = member.pk
+        parent_fill = self.fill(parent.pk)
+
+        parent_node = self.node[parent.pk]
+        grandparent = parent_node.parent_profile_id if parent_node else None
+        self.load([grandparent])
+        safe = self.board[parent.pk] == BOARD and parent_fill < 6
+        if safe and grandparent is not None:
+            safe = (
+                grandparent != parent.pk and self.board[grandparent] == BOARD and
+                self.count[grandparent] + 1 < 6 and self.fill(grandparent) < 6
+            )
+        if not safe:
+            self.kids[parent.pk][position - 1] = before
+            return False
+
+        self.filled.add(parent.pk)
+        record_fill(parent, position, member, BOARD)
+
+        root_id, base = child_frame(parent.pk, parent_node)
+        node = MatrixNode(
+            user_id=member.user_id, board=BOARD, parent_profile_id=parent.pk, position=position,
+            tree_root_id=root_id, slot_index=2 * base + position - 1
+        )
+        self.new_nodes.append(node)
+        self.node[member.pk] = node
+        self.tree_roots.add(root_id)
+        self.locked.append(member.pk)
+
+        # update_ancestor_counts: +1 for both, then _check_and_cycle re-counts from the tree
+        self.count[parent.pk] = parent_fill
+        self.recounted.add(parent.pk)
+        if grandparent is not None:
+            total_fill = self.count[grandparent] + 1
+            if 3 <= total_fill <= 6:
+                reward_amount = BOARD_CONFIGS[BOARD]['base']
+                self.bonus[grandparent] += reward_amount
+                self.transactions.append(Transaction(
+                    profile_id=grandparent,
+                    tx_type='CYCLE',
+                    amount=reward_amount,
+                    detail=f"Board {BOARD} payline bonus from {member.user.username}"
+                ))
+            self.count[grandparent] = self.fill(grandparent)
+            self.recounted.add(grandparent)
+        return True
+
+    def write_slots(self):
+        if self.filled:
+            MemberProfile.objects.bulk_update(
+                [MemberProfile(pk=pk, **{f'{LEFT_ATTR}_id': self.kids[pk][0], f'{RIGHT_ATTR}_id': self.kids[pk][1]})
+                 for pk in self.filled],
+                [LEFT_ATTR, RIGHT_ATTR], batch_size=BATCH_SIZE
+            )
+            cascade.touch_ids(self.filled)
+            self.filled = set()
+
+    def flush(self):
+        """Writes everything planned so far. Returns how many payline bonuses were paid."""
+        self.write_slots()
+        MatrixNode.objects.bulk_create(self.new_nodes, batch_size=BATCH_SIZE)
+        if self.locked:
+            MemberProfile.objects.filter(pk__in=self.locked).update(is_position_locked=True)
+        if self.recounted:
+            MemberProfile.objects.bulk_update(
+                [MemberProfile(pk=pk, **{COUNT_ATTR: self.count[pk]}) for pk in self.recounted],
+                [COUNT_ATTR], batch_size=BATCH_SIZE
+            )
+        if self.bonus:
+            payout = Case(
+                *[When(pk=pk, then=Value(amount)) for pk, amount in self.bonus.items()],
+                output_field=models.DecimalField(max_digits=12, decimal_places=2)
+            )
+            MemberProfile.objects.filter(pk__in=list(self.bonus)).update(
+                wallet=F('wallet') + payout,
+                balance=F('balance') + payout,
+                board_1_earned=F('board_1_earned') + payout
+            )
+        Transaction.objects.bulk_create(self.transactions, batch_size=BATCH_SIZE)
+        cascade.touch_ids(self.locked + list(self.recounted) + list(self.bonus))
+        paid = len(self.transactions)
+        self._clear_pending()
+        return paid
+
+
+def _activate_batch(pks):
+    summary = {'activated': 0, 'planned': 0, 'one_by_one': 0, 'bonuses': 0, 'cycles': 0}
+    plan = _BatchPlan()
+
+    with transaction.atomic():
+        members = list(
+            MemberProfile.objects.filter(pk__in=pks).exclude(payment_status='paid').select_related('user', 'sponser').order_by('pk')
+        )
+        for member in members:
+            if not member.ref_id or not member.payment_order_id:
+                # save() fills these in; the bulk update below would not
+                member.save()
+        MemberProfile.objects.filter(pk__in=[m.pk for m in members]).update(
+            payment_status='paid', is_active=True, is_already_placed_in_b1=True
+        )
+        joined = Counter(m.current_board for m in members if not m.is_active)
+        for board_level, count in joined.items():
+            members_moved(joined=board_level, count=count)
+        forget_uplines([m.pk for m in members])
+        cascade.touch_ids([m.pk for m in members])
+
+        for member in members:
+            summary['activated'] += 1
+            if not member.sponser_id:
+                continue
+            if plan.place(member):
+                summary['planned'] += 1
+                continue
+
+            summary['bonuses'] += plan.flush()
+            member.refresh_from_db()
+            activate_one(member)
+            summary['one_by_one'] += 1
+            summary['cycles'] += cascade.last_stats()['cycles']
+            # A cycle or upgrade can move anyone; start from the database again
+            plan.reset()
+
+        summary['bonuses'] += plan.flush()
+    return summary
+
+
+@traced()
+def bulk_activate(queryset, batch_size=BATCH_SIZE):
+    """
+    Activates and places every pending member of queryset in pk order, the same
+    as activating them one at a time in that order. Each batch is one
+    transaction; returns a summary dict per batch.
+    """
+    pks = list(queryset.exclude(payment_status='paid').order_by('pk').values_list('pk', flat=True))
+    summaries = []
+    for start in range(0, len(pks), batch_size):
+        summary = _activate_batch(pks[start:start + batch_size])
+        summary['batch'] = start // batch_size + 1
+        summaries.append(summary)
+    return summaries
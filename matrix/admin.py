@@ -1,70 +1,68 @@
 from django.contrib import admin, messages
 from django.shortcuts import redirect, render
-from .models import MemberProfile, AdminRevenue, WithdrawalRequest, MatrixNode
+from .models import MemberProfile, AdminRevenue, WithdrawalRequest, MatrixNode, MatrixJob, ReconciliationRun, BalanceDrift, RequestMetric, MatrixEvent
 from django.utils.html import format_html 
 from django.db import transaction  # Needed for atomic balance deduction
-from .logic import  get_board_tree, sync_board_count, place_member_with_spillover
+from .logic import  get_board_tree, get_board_trees, sync_board_count, place_member_with_spillover
+from .sponsor_tree import annotate_team
+from .paginator import LargeTablePaginator
+from .withdrawals import approve_withdrawals, payout_csv_response
+from .recount import recount_boards
+from .activation import bulk_activate
+from .jobs import enqueue_many, placement_inline, queue_stats
+from .revenue import TOTAL_FIELDS, revenue_totals
 from decimal import Decimal
 from django.db.models import F, Q
-from django.urls import path
+from django.urls import path, reverse
+from django.contrib.auth.models import User
+from django.utils import timezone
 
 @admin.action(description='Verify Payment and Place in Matrix')
 def activate_members(modeladmin, request, queryset):
+    if not placement_inline():
+        jobs = enqueue_many('activate', queryset.exclude(payment_status='paid').order_by('pk'))
+        modeladmin.message_user(request, f"Queued {len(jobs)} members for activation and placement.")
+        return
+
+    # Placed in pk order, one transaction per batch so the database isn't locked the whole time
     count = 0
-    for profile in queryset:
-        if profile.payment_status != 'paid':
-          with transaction.atomic():
-            profile.payment_status = 'paid'
-            profile.is_active = True
-            profile.is_already_placed_in_b1 = True # Prevent signal double-firing
-            profile.save()
-            
-            # 2. Place and Trigger Counts
-            # This must find the sponsor and then call the counting logic
-            if profile.sponser:
-                place_member_with_spillover(profile, profile.sponser, 1)
-            count += 1
+    for summary in bulk_activate(queryset):
+        count += summary['activated']
+        modeladmin.message_user(
+            request,
+            f"Batch {summary['batch']}: activated {summary['activated']} "
+            f"({summary['planned']} placed in bulk, {summary['one_by_one']} one by one for cycles/upgrades), "
+            f"{summary['bonuses']} payline bonuses paid, {summary['cycles']} cycles triggered."
+        )
     modeladmin.message_user(request, f"Activated {count} members and updated board counts.")
 
 @admin.action(description='Approve Withdrawal: Deduct Balance & Mark PAID')
 def approve_withdrawal_action(modeladmin, request, queryset):
-    for withdrawal in queryset:
-        if withdrawal.status.lower() == 'pending':
-            try:
-                with transaction.atomic():
-                    profile = withdrawal.user.memberprofile
-                    if profile.balance >= withdrawal.amount:
-                        # 1. Deduct from User
-                        MemberProfile.objects.filter(pk=profile.pk).update(
-                            balance=F('balance') - withdrawal.amount,
-                            wallet=F('wallet') - withdrawal.amount
-                        )
-                        
-                        # 2. Update Platform Profit Tracking
-                        revenue, _ = AdminRevenue.objects.get_or_create(id=1)
-                        revenue.total_withdrawals_processed += withdrawal.amount
-                        revenue.save()
-
-                        # 3. Finalize Request
-                        withdrawal.status = 'Paid'
-                        withdrawal.save()
-                        
-                        modeladmin.message_user(request, f"Approved ${withdrawal.amount} for {profile.user.username}.")
-                    else:
-                        messages.error(request, f"Insufficient funds: {profile.user.username}")
-            except Exception as e:
-                messages.error(request, f"Error: {str(e)}")
+    # One batch: set-based deductions and ledger rows. Back to the changelist with
+    # what was skipped, and a link to the payout file of what was approved
+    batch, approved, total, skipped = approve_withdrawals(queryset)
+    for pk, username, amount in skipped:
+        messages.error(request, f"Insufficient funds: {username} (request #{pk}, ${amount}) stays Pending")
+    if not approved:
+        modeladmin.message_user(request, "No pending withdrawals were approved.", messages.WARNING)
+        return None
+    modeladmin.message_user(request, format_html(
+        'Approved {} withdrawals (${}). <a href="{}">Download the payout file</a>',
+        approved, total, reverse('admin:withdrawal-payout-file', args=[batch])
+    ))
+    return None
 
 @admin.action(description='Sync/Fix Board Counts from Actual Tree')
 def sync_counts_action(modeladmin, request, queryset):
-    for profile in queryset:
-        for i in range(1, 6):
-            sync_board_count(profile, i)
-    modeladmin.message_user(request, "Counts re-synchronized with actual database tree.")
+    # All five boards of the whole selection in one vectorized pass
+    report = recount_boards(queryset)
+    fixed = sum(len(wrong) for wrong in report.values())
+    modeladmin.message_user(request, f"Counts re-synchronized with actual database tree ({fixed} corrected).")
 
 @admin.register(WithdrawalRequest)
 class WithdrawalRequestAdmin(admin.ModelAdmin):
-    list_display = ('id','user', 'amount', 'fee', 'net_amount', 'status', 'created_at', 'wallet_address')
+    list_display = ('id','user', 'amount', 'fee', 'net_amount', 'status', 'created_at', 'wallet_address', 'payout_file')
+    list_select_related = ('user',)
     list_filter = ('status', 'created_at')
     search_fields = ('user__username', 'wallet_address')
     
@@ -76,18 +74,54 @@ class WithdrawalRequestAdmin(admin.ModelAdmin):
     # Link the action we defined above
     actions = [approve_withdrawal_action]
 
+    def get_urls(self):
+        urls = super().get_urls()
+        custom_urls = [
+            path('payouts/<str:batch>.csv', self.admin_site.admin_view(self.payout_file_view), name='withdrawal-payout-file'),
+        ]
+        return custom_urls + urls
+
+    def payout_file_view(self, request, batch):
+        # Download the payout file of an approved batch again
+        return payout_csv_response(batch)
+
+    def payout_file(self, obj):
+        if not obj.payout_batch:
+            return '-'
+        return format_html('<a href="{}">CSV</a>', reverse('admin:withdrawal-payout-file', args=[obj.payout_batch]))
+    payout_file.short_description = 'Payout batch'
+
+class CurrentBoardFilter(admin.SimpleListFilter):
+    # Fixed choices; the default filter runs SELECT DISTINCT over the whole table
+    title = 'current board'
+    parameter_name = 'current_board'
+
+    def lookups(self, request, model_admin):
+        return [(str(b), f'Board {b}') for b in range(1, 6)]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(current_board=self.value())
+        return queryset
+
 @admin.register(MemberProfile)
 class MemberProfileAdmin(admin.ModelAdmin):
     # Use 'direct_referrals' method name instead of a count field name
     list_display = (
-        'user', 'colored_status', 'full_name', 'ref_id', 'sponser',
-        'direct_referrals', 'is_active', 'nfg_balance', 'balance', 'wallet', 'transaction_hash',
+        'user', 'colored_status', 'full_name', 'ref_id', 'sponsor_name',
+        'direct_referrals', 'team_size', 'is_active', 'nfg_balance', 'balance', 'wallet', 'transaction_hash',
         'b1_display', 'b2_display', 'b3_display', 'b4_display', 'b5_display', 'view_matrix_button'
     )
-    list_filter = ('current_board', 'is_active', 'payment_status')
-    search_fields = ('user__username', 'ref_id', 'transaction_hash', 'sponser__user__username')
-    actions = [activate_members, sync_board_count]
+    list_filter = (CurrentBoardFilter, 'is_active', 'payment_status')
+    # Exact ref_id / tx hash / username, or a username prefix (see get_search_results)
+    search_fields = ('=ref_id', '=transaction_hash', '^user__username')
+    search_help_text = "Exact ref ID, transaction hash or username, or the start of a username."
+    actions = [activate_members, sync_counts_action]
     list_editable = ('is_active', 'balance', 'wallet', 'nfg_balance')
+    list_select_related = ('user',)
+    # Large table: estimated counts, pk-seek paging and no second full COUNT(*)
+    paginator = LargeTablePaginator
+    show_full_result_count = False
     
     # --- Custom Methods for List Display ---
     def get_readonly_fields(self, request, obj=None):
@@ -107,10 +141,33 @@ class MemberProfileAdmin(admin.ModelAdmin):
         ]
         return custom_urls + urls
      
+    def get_queryset(self, request):
+        # Sponsor username joined in, directs and whole-team sizes from the sponsor closure table
+        return annotate_team(super().get_queryset(request)).annotate(sponsor_username=F('sponser__user__username'))
+
+    def get_search_results(self, request, queryset, search_term):
+        # Each branch is served by a unique index; no LIKE '%term%' scan over every member
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        usernames = User.objects.filter(username__startswith=term).values('pk')
+        return queryset.filter(Q(ref_id=term) | Q(transaction_hash=term) | Q(user__in=usernames)), False
+
+    def sponsor_name(self, obj):
+        return obj.sponsor_username or '-'
+    sponsor_name.short_description = 'Sponser'
+    sponsor_name.admin_order_field = 'sponser__user__username'
+
     def direct_referrals(self, obj):
         # Counts how many people have this user as their sponsor
-        return obj.referrals.count()
+        return obj.direct_count
     direct_referrals.short_description = 'Directs'
+    direct_referrals.admin_order_field = 'direct_count'
+
+    def team_size(self, obj):
+        return obj.team_size
+    team_size.short_description = 'Team'
+    team_size.admin_order_field = 'team_size'
 
     def colored_status(self, obj):
         colors = {'paid': '#28a745', 'pending': '#ffc107'}
@@ -124,16 +181,15 @@ class MemberProfileAdmin(admin.ModelAdmin):
     # admin.py snippet
     def matrix_view(self, request, object_id):
         profile = self.get_object(request, object_id)
-    # Get tree data for all 5 boards
-        boards_data= []
-
-        for i in range(1, 6):
-            boards_data.append(get_board_tree(profile, i))
+    # Get tree data for all 5 boards (two queries in total)
+        trees = get_board_trees(profile)
+        boards_data = [trees[i] for i in range(1, 6)]
 
         context = {
             'profile': profile,
             'boards': boards_data,
-            'title': f"Matrix View: {profile.user.username}"
+            'admin_view': True,
+            'title': f"Matrix View: {boards_data[0]['root'].user.username}"
         }
         return render(request, 'matrix/matrix_tree.html', context)
     def view_matrix_button(self, obj):
@@ -197,16 +253,28 @@ def verify_and_activate(modeladmin, request, queryset):
 # 3. Track Platform Profit
 @admin.register(AdminRevenue)
 class AdminRevenueAdmin(admin.ModelAdmin):
-    list_display = ('total_fees_collected', 'total_withdrawals_processed', 'last_updated')
-    readonly_fields = ('total_fees_collected', 'last_updated')
+    list_display = ('shard', 'total_fees_collected', 'total_withdrawals_processed', 'last_updated')
+    readonly_fields = ('shard', 'total_fees_collected', 'last_updated')
     fields = (
+        'shard',
         'total_fees_collected', 
         'total_withdrawals_processed',
         ('b1_fees', 'b2_fees', 'b3_fees', 'b4_fees', 'b5_fees') # Grouped together
     )
     def has_add_permission(self, request):
-        # Prevent creating multiple revenue tracking rows
-        return not AdminRevenue.objects.exists()
+        # Shard rows are created on their first fee
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        # Platform totals (sum of the shards, cached) in the page title
+        totals = revenue_totals() or {field: 0 for field in TOTAL_FIELDS}
+        extra_context = extra_context or {}
+        extra_context['title'] = (
+            f"Platform revenue: ${totals['total_fees_collected']:.2f} fees, "
+            f"${totals['total_withdrawals_processed']:.2f} withdrawn | "
+            + ", ".join(f"B{b} ${totals[f'b{b}_fees']:.2f}" for b in range(1, 6))
+        )
+        return super().changelist_view(request, extra_context=extra_context)
 
 @admin.register(MatrixNode)
 class MatrixNodeAdmin(admin.ModelAdmin):
@@ -221,4 +289,96 @@ class MatrixNodeAdmin(admin.ModelAdmin):
 
     def remove_duplicates(self, request, queryset):
         # Logic to help you clean up if needed
-        pass
\ No newline at end of file
+        pass
+
+@admin.action(description='Retry selected jobs now')
+def retry_jobs(modeladmin, request, queryset):
+    updated = queryset.exclude(status='running').update(
+        status='pending', run_after=timezone.now(), attempts=0, claim_token='', last_error=''
+    )
+    modeladmin.message_user(request, f"{updated} jobs queued again.")
+
+@admin.register(MatrixJob)
+class MatrixJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'profile', 'board', 'status', 'attempts', 'created_at', 'run_after', 'wait_time', 'run_time')
+    list_filter = ('status', 'kind', 'board')
+    search_fields = ('profile__user__username', 'profile__ref_id')
+    readonly_fields = ('claim_token', 'claimed_at', 'created_at', 'started_at', 'finished_at', 'last_error')
+    list_select_related = ('profile__user',)
+    actions = [retry_jobs]
+
+    def changelist_view(self, request, extra_context=None):
+        # Queue depth and latency in the page title
+        stats = queue_stats()
+        extra_context = extra_context or {}
+        extra_context['title'] = (
+            f"Matrix jobs: {stats['pending']} queued (oldest {stats['oldest_wait']:.0f}s), "
+            f"{stats['running']} running, {stats['failed']} failed | last hour: {stats['finished']} done, "
+            f"avg wait {stats['avg_wait']:.1f}s, avg run {stats['avg_run']:.2f}s"
+        )
+        return super().changelist_view(request, extra_context=extra_context)
+
+    def wait_time(self, obj):
+        if obj.started_at:
+            return f"{(obj.started_at - obj.created_at).total_seconds():.1f}s"
+        return '-'
+    wait_time.short_description = 'Wait'
+
+    def run_time(self, obj):
+        if obj.started_at and obj.finished_at:
+            return f"{(obj.finished_at - obj.started_at).total_seconds():.2f}s"
+        return '-'
+    run_time.short_description = 'Run'
+
+@admin.register(ReconciliationRun)
+class ReconciliationRunAdmin(admin.ModelAdmin):
+    # Written by `manage.py reconcile_ledger`
+    list_display = ('id', 'started_at', 'full', 'high_water', 'transactions_read', 'members_checked', 'drifted')
+    list_filter = ('full',)
+    readonly_fields = [f.name for f in ReconciliationRun._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
+@admin.register(BalanceDrift)
+class BalanceDriftAdmin(admin.ModelAdmin):
+    list_display = ('profile', 'run', 'kind', 'balance_drift', 'wallet_drift', 'nfg_drift')
+    list_filter = ('kind', 'run')
+    list_select_related = ('profile__user', 'run')
+    search_fields = ('profile__user__username', 'profile__ref_id')
+    raw_id_fields = ('profile', 'run')
+
+    def has_add_permission(self, request):
+        return False
+
+@admin.register(RequestMetric)
+class RequestMetricAdmin(admin.ModelAdmin):
+    # Flushed by RequestMetricsMiddleware when MATRIX_METRICS_FLUSH_SECONDS is set
+    list_display = ('view_name', 'period_start', 'requests', 'p50_ms', 'p95_ms', 'p99_ms', 'db_p95_ms', 'queries_mean', 'queries_max')
+    list_filter = ('period_start',)
+    search_fields = ('view_name',)
+    ordering = ('-period_start', '-p95_ms')
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(MatrixEvent)
+class MatrixEventAdmin(admin.ModelAdmin):
+    # Append-only: replay_events rebuilds the matrix state from these rows
+    list_display = ('id', 'created_at', 'kind', 'target', 'op')
+    list_filter = ('kind', 'target', 'op')
+    ordering = ('-id',)
+    readonly_fields = ('created_at', 'kind', 'target', 'op', 'data')
+    paginator = LargeTablePaginator
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
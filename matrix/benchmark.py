@@ -0,0 +1,165 @@
+import random
+import subprocess
+import time
+import uuid
+from pathlib import Path
+
+import django
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.utils import timezone
+from .models import MemberProfile
+from .sponsor_tree import rebuild_sponsor_links
+from .activation import activate_one
+from .metrics import QueryTimer, percentile
+from . import cascade
+
+BATCH_SIZE = 500
+SHAPES = ('flat', 'deep', 'superuser', 'random')
+
+
+class _Rollback(Exception):
+    pass
+
+
+def _sponsor_index(shape, i, rng):
+    """
+    Index (into the members generated so far, 0 = the superuser) of member i's
+    sponsor. flat: a handful of top recruiters; deep: one long chain;
+    superuser: mostly the registration fallback (no referral link);
+    random: anyone who joined earlier.
+    """
+    if shape == 'flat':
+        return rng.randrange(min(i, 5)) if i > 1 else 0
+    if shape == 'deep':
+        return i - 1
+    if shape == 'superuser':
+        return 0 if rng.random() < 0.8 else rng.randrange(i)
+    return rng.randrange(i)
+
+
+def generate_network(size, shape, seed=0, prefix=None):
+    """
+    A fresh superuser plus size inactive members from bulk inserts (no signals),
+    sponsored according to shape, and the sponsor closure rebuilt once at the
+    end. Returns the member profiles in join order, superuser first.
+    """
+    if shape not in SHAPES:
+        raise ValueError(f"Unknown shape {shape!r}, expected one of {', '.join(SHAPES)}")
+    rng = random.Random(seed)
+    prefix = prefix or f"bench-{uuid.uuid4().hex[:6]}"
+    top = User.objects.create_superuser(f"{prefix}-root", password=None).memberprofile
+
+    names = [f"{prefix}-{i}" for i in range(1, size + 1)]
+    for start in range(0, size, BATCH_SIZE):
+        User.objects.bulk_create([User(username=name, password='!') for name in names[start:start + BATCH_SIZE]])
+    user_ids = dict(User.objects.filter(username__in=names).values_list('username', 'pk'))
+
+    profiles = []
+    for name in names:
+        token = uuid.uuid4().hex
+        profiles.append(MemberProfile(
+            user_id=user_ids[name], full_name=name,
+            ref_id=token[:10].upper(), payment_order_id=f"PAY-{token[10:18].upper()}"
+        ))
+    # bulk_create hands the pks back on SQLite and PostgreSQL
+    profiles = MemberProfile.objects.bulk_create(profiles, batch_size=BATCH_SIZE)
+    members = [top, *profiles]
+    for i, profile in enumerate(profiles, start=1):
+        profile.sponser = members[_sponsor_index(shape, i, rng)]
+    MemberProfile.objects.bulk_update(profiles, ['sponser'], batch_size=BATCH_SIZE)
+    rebuild_sponsor_links()
+    return members
+
+
+def replay_activations(members):
+    """
+    Activates members one by one through activate_one (spillover placement,
+    ancestor counts, cycles and upgrades) and measures every activation.
+    """
+    latencies, steps, pending, cycles, upgrades, placements = [], [], [], [], 0, 0
+    queries = QueryTimer()
+    for member in members:
+        member.refresh_from_db()
+        begin = time.perf_counter()
+        with connection.execute_wrapper(queries):
+            activate_one(member)
+        latencies.append(time.perf_counter() - begin)
+        stats = cascade.last_stats() or {}
+        placements += stats.get('placements', 0)
+        steps.append(stats.get('steps', 0))
+        pending.append(stats.get('max_pending', 0))
+        cycles.append(stats.get('cycles', 0))
+        upgrades += stats.get('upgrades', 0)
+    elapsed = sum(latencies)
+
+    ordered = sorted(latencies)
+    count = len(members)
+    return {
+        'activations': count,
+        'placements': placements,
+        'seconds': round(elapsed, 4),
+        'activations_per_sec': round(count / elapsed, 2) if elapsed else None,
+        'placements_per_sec': round(placements / elapsed, 2) if elapsed else None,
+        'queries_per_activation': round(queries.queries / count, 2) if count else None,
+        'queries_per_placement': round(queries.queries / placements, 2) if placements else None,
+        'latency_ms': {
+            'mean': round(1000 * elapsed / count, 3) if count else None,
+            'p50': round(1000 * percentile(ordered, 50), 3) if count else None,
+            'p99': round(1000 * percentile(ordered, 99), 3) if count else None,
+            'max': round(1000 * ordered[-1], 3) if count else None,
+        },
+        'cascade': {
+            'cycles': sum(cycles),
+            'upgrades': upgrades,
+            'max_cycles': max(cycles, default=0),
+            'max_steps': max(steps, default=0),
+            'max_pending': max(pending, default=0),
+        },
+    }
+
+
+def run_tier(size, shape, seed=0):
+    """
+    Generates one network and replays its activations inside a transaction
+    that is rolled back afterwards, so the database is left as it was.
+    """
+    result = {'shape': shape, 'size': size}
+    try:
+        with transaction.atomic():
+            started = time.perf_counter()
+            members = generate_network(size, shape, seed)
+            result['generate_seconds'] = round(time.perf_counter() - started, 4)
+            result.update(replay_activations(members[1:]))
+            raise _Rollback
+    except _Rollback:
+        pass
+    return result
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=Path(__file__).resolve().parent,
+            capture_output=True, text=True, timeout=5,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_benchmark(sizes=(100, 1000), shapes=SHAPES, seed=0, progress=None):
+    """Every shape at every size; the JSON-ready report (environment + one entry per tier)."""
+    tiers = []
+    for size in sizes:
+        for shape in shapes:
+            tiers.append(run_tier(size, shape, seed))
+            if progress:
+                progress(tiers[-1])
+    return {
+        'commit': _commit(),
+        'created_at': timezone.now().isoformat(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'seed': seed,
+        'tiers': tiers,
+    }
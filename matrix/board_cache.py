@@ -0,0 +1,93 @@
+from django.db.models import Count, Q
+from .models import BoardCycle, BoardReportCache, MemberProfile
+
+BOARDS = range(1, 6)
+BATCH_SIZE = 500
+
+
+def count_field(board_level):
+    # Board 1's column kept its old attribute name (db_column is board_1_count)
+    return 'board_1_count_value' if board_level == 1 else f'board_{board_level}_count'
+
+
+def child_fields(board_level):
+    return f'left_child_b{board_level}', f'right_child_b{board_level}'
+
+
+def earned_field(board_level):
+    return f'board_{board_level}_earned'
+
+
+def _columns():
+    columns = ['pk']
+    for b in BOARDS:
+        left, right = child_fields(b)
+        columns += [count_field(b), f'{left}_id', f'{right}_id', earned_field(b)]
+    return columns
+
+
+def _cycles(profile_ids):
+    rows = BoardCycle.objects.filter(profile_id__in=profile_ids).values('profile_id', 'board').annotate(
+        cycles=Count('pk')
+    ).values_list('profile_id', 'board', 'cycles')
+    return {(profile_id, board): cycles for profile_id, board, cycles in rows}
+
+
+def _reports(rows, cycles):
+    for row in rows:
+        for i, b in enumerate(BOARDS):
+            count, left_id, right_id, earned = row[1 + 4 * i:5 + 4 * i]
+            yield BoardReportCache(
+                profile_id=row[0], board=b, count=max(count or 0, 0), left_child_id=left_id,
+                right_child_id=right_id, earned=earned, cycles=cycles.get((row[0], b), 0)
+            )
+
+
+def refresh_board_cache(profile_ids):
+    """
+    Rewrites the report rows of these members (all five boards) from their
+    MemberProfile columns and BoardCycle rows: two reads and one upsert per
+    chunk. cascade.members_changed calls this for every member whose counts,
+    slots or earnings changed, inside the same transaction.
+    """
+    profile_ids = sorted({pk for pk in profile_ids if pk})
+    for start in range(0, len(profile_ids), BATCH_SIZE):
+        chunk = profile_ids[start:start + BATCH_SIZE]
+        rows = MemberProfile.objects.filter(pk__in=chunk).values_list(*_columns())
+        BoardReportCache.objects.bulk_create(
+            list(_reports(rows, _cycles(chunk))), batch_size=BATCH_SIZE, update_conflicts=True,
+            unique_fields=['profile', 'board'],
+            update_fields=['count', 'left_child', 'right_child', 'earned', 'cycles', 'updated_at']
+        )
+
+
+def record_cycle(profile, board_level):
+    # The structured record of a cycle; the report cache counts these rows
+    BoardCycle.objects.create(profile=profile, board=board_level)
+
+
+def rebuild_board_cache():
+    """
+    Rewrites the report rows of every member, for writes that bypassed
+    cascade.touch (a snapshot restore, raw SQL). Returns how many rows were written.
+    """
+    profile_ids = list(MemberProfile.objects.order_by('pk').values_list('pk', flat=True))
+    refresh_board_cache(profile_ids)
+    return len(profile_ids) * len(BOARDS)
+
+
+def board_reports(profile):
+    """{board: BoardReportCache} for profile, one query."""
+    return {report.board: report for report in BoardReportCache.objects.filter(profile=profile)}
+
+
+def nearly_full(board_level, count=5):
+    """Report rows on board_level at exactly count (5 = one away from cycling)."""
+    return BoardReportCache.objects.filter(board=board_level, count=count)
+
+
+def open_slots(board_level):
+    """Report rows on board_level with at least one free slot (partial index)."""
+    return BoardReportCache.objects.filter(board=board_level).filter(
+        Q(left_child__isnull=True) | Q(right_child__isnull=True)
+    )
@@ -0,0 +1,245 @@
+from django.db import transaction
+from django.db.models import Q
+from .models import MatrixNode
+
+# A member numbered past FRAME_LIMIT starts a fresh numbering (itself = 1) for
+# the people below it, so children (2x, 2x + 1) always fit in a BigIntegerField.
+FRAME_LIMIT = 2 ** 61
+SLOT_CAP = 2 ** 62
+BATCH_SIZE = 500
+
+
+def _node_of(user_id, board_level):
+    return MatrixNode.objects.filter(user_id=user_id, board=board_level).select_related('tree_root').first()
+
+
+def child_frame(profile_pk, node):
+    """(tree_root_id, slot_index) the children of this member are numbered from."""
+    if node is not None and node.slot_index is not None and node.slot_index < FRAME_LIMIT:
+        return node.tree_root_id, node.slot_index
+    return profile_pk, 1
+
+
+def _below(index):
+    """Q matching every slot under index in the same tree (one range per level)."""
+    below = Q()
+    width = 2
+    while index * width < SLOT_CAP:
+        below |= Q(slot_index__gte=index * width, slot_index__lt=index * width + width)
+        width *= 2
+    return below
+
+
+def _renumber(board_level, old_root_id, old_index, top_profile_id, new_root_id, new_index):
+    """Re-numbers everything hanging below (old_root_id, old_index) for its top now sitting at (new_root_id, new_index)."""
+    nodes = MatrixNode.objects.filter(board=board_level, tree_root_id=old_root_id).filter(_below(old_index))
+    rows = sorted(nodes.values_list('pk', 'slot_index', 'user__memberprofile__id'), key=lambda row: row[1])
+
+    placed = {old_index: (top_profile_id, new_root_id, new_index)}
+    moved = []
+    for pk, index, profile_id in rows:
+        if index >> 1 not in placed:
+            continue
+        parent_profile_id, parent_root_id, parent_index = placed[index >> 1]
+        if parent_index < FRAME_LIMIT:
+            root_id, slot_index = parent_root_id, 2 * parent_index + (index & 1)
+        else:
+            root_id, slot_index = parent_profile_id, 2 + (index & 1)
+        placed[index] = (profile_id, root_id, slot_index)
+        moved.append(MatrixNode(pk=pk, tree_root_id=root_id, slot_index=slot_index))
+
+        # Its children were numbered from itself because it sat past the limit;
+        # now that it moved up they belong to this tree again.
+        if index >= FRAME_LIMIT and slot_index < FRAME_LIMIT:
+            _renumber(board_level, profile_id, 1, profile_id, root_id, slot_index)
+
+    MatrixNode.objects.bulk_update(moved, ['tree_root', 'slot_index'], batch_size=BATCH_SIZE)
+
+
+@transaction.atomic
+def place_node(member, parent, position, board_level):
+    """Creates the MatrixNode for member in parent's left (1) or right (2) slot, already numbered."""
+    if parent.pk == member.pk:
+        # A member re-placed under itself (superuser cycling) has no place in the numbering
+        root_id, slot_index = member.pk, 1
+    else:
+        root_id, base = child_frame(parent.pk, _node_of(parent.user_id, board_level))
+        slot_index = 2 * base + position - 1
+
+    node = MatrixNode.objects.create(
+        user=member.user,
+        board=board_level,
+        parent_profile=parent,
+        position=position,
+        tree_root_id=root_id,
+        slot_index=slot_index
+    )
+
+    # People already placed below this member were numbered from the member;
+    # carry them over into the tree the member just joined.
+    if root_id != member.pk and slot_index < FRAME_LIMIT:
+        _renumber(board_level, member.pk, 1, member.pk, root_id, slot_index)
+    return node
+
+
+@transaction.atomic
+def detach_children(profile, board_level):
+    """
+    Called when profile's board is reset (handle_cycle): the members below it
+    become the tops of their own trees, exactly like the cleared FK slots.
+    """
+    root_id, _ = child_frame(profile.pk, _node_of(profile.user_id, board_level))
+    children = MatrixNode.objects.filter(board=board_level, parent_profile=profile).exclude(user_id=profile.user_id)
+    for child in children.select_related('user__memberprofile'):
+        child_profile = child.user.memberprofile
+        if child.tree_root_id == root_id and child.slot_index is not None:
+            _renumber(board_level, root_id, child.slot_index, child_profile.pk, child_profile.pk, 1)
+        MatrixNode.objects.filter(pk=child.pk).update(parent_profile=None, tree_root=child_profile, slot_index=1)
+
+
+def renumber_orphans(profile):
+    """
+    Called before profile is deleted: its own children's nodes go with it, so
+    the members below them start their own trees (numbered from those children).
+    The profile's own nodes stay behind with the user, but no longer hold a slot.
+    """
+    for board_level in range(1, 6):
+        root_id, _ = child_frame(profile.pk, _node_of(profile.user_id, board_level))
+        children = MatrixNode.objects.filter(board=board_level, parent_profile=profile).exclude(user_id=profile.user_id)
+        for child in children.select_related('user__memberprofile'):
+            child_profile = getattr(child.user, 'memberprofile', None)
+            if child_profile is None or child.tree_root_id != root_id or child.slot_index is None:
+                continue
+            _renumber(board_level, root_id, child.slot_index, child_profile.pk, child_profile.pk, 1)
+    MatrixNode.objects.filter(user_id=profile.user_id).update(tree_root=None, slot_index=None)
+
+
+def board_ancestors(member, board_level, levels=2):
+    """[parent, grandparent, ...] of member on this board, nearest first, None past the top."""
+    ancestors = []
+    node = _node_of(member.user_id, board_level)
+
+    while node is not None and len(ancestors) < levels:
+        index = node.slot_index
+        if index is None or index < 2:
+            # Top of its own tree: only the stored link can say who is above it
+            parent = node.parent_profile
+            ancestors.append(parent)
+            node = _node_of(parent.user_id, board_level) if parent else None
+            continue
+
+        wanted = []
+        shift = 1
+        while len(ancestors) + len(wanted) < levels and index >> shift >= 1:
+            wanted.append(index >> shift)
+            shift += 1
+
+        above = {
+            n.slot_index: n for n in MatrixNode.objects.filter(
+                board=board_level, tree_root_id=node.tree_root_id, slot_index__in=[w for w in wanted if w >= 2]
+            ).select_related('user__memberprofile')
+        }
+        for slot_index in wanted:
+            if slot_index == 1:
+                ancestors.append(node.tree_root)
+                node = _node_of(node.tree_root.user_id, board_level) if node.tree_root else None
+            elif slot_index in above:
+                ancestors.append(above[slot_index].user.memberprofile)
+                node = above[slot_index]
+            else:
+                # Numbering has a hole (e.g. a node deleted by hand): follow the stored links instead
+                parent = node.parent_profile
+                ancestors.append(parent)
+                node = _node_of(parent.user_id, board_level) if parent else None
+                break
+
+    return (ancestors + [None] * levels)[:levels]
+
+
+SUBTREE_FIELDS = (
+    'slot_index', 'user__memberprofile__id', 'user__username',
+    'user__memberprofile__is_active', 'user__memberprofile__current_board',
+)
+
+
+def board_subtree(profile, board_level, depth):
+    """
+    The profile's board tree `depth` levels down as {relative slot: row} (the
+    profile = 1, its left = 2, right = 3, ...), in one range query per chunk on
+    the (board, tree_root, slot_index) index. One extra level is read so every
+    returned row carries has_children; it is None where the numbering starts a
+    new frame and the next chunk has to look.
+    """
+    root_id, base = child_frame(profile.pk, _node_of(profile.user_id, board_level))
+    levels = Q()
+    fetched = 0
+    for level in range(1, depth + 2):
+        # Parents numbered past FRAME_LIMIT number their children from themselves
+        if (base + 1) << (level - 1) > FRAME_LIMIT:
+            break
+        levels |= Q(slot_index__gte=base << level, slot_index__lt=(base + 1) << level)
+        fetched = level
+
+    found = {}
+    if fetched:
+        rows = MatrixNode.objects.filter(board=board_level, tree_root_id=root_id).filter(levels).order_by('pk').values(*SUBTREE_FIELDS)
+        for row in rows:
+            level = row['slot_index'].bit_length() - base.bit_length()
+            found.setdefault((1 << level) + row['slot_index'] - (base << level), row)
+
+    subtree = {}
+    for slot, row in sorted(found.items()):
+        level = slot.bit_length() - 1
+        if level > depth or slot // 2 not in subtree and slot > 3:
+            continue
+        has_children = 2 * slot in found or 2 * slot + 1 in found
+        subtree[slot] = {**row, 'depth': level, 'has_children': has_children if level < fetched else None}
+    return subtree
+
+
+@transaction.atomic
+def rebuild_slot_index(board_level):
+    """
+    Re-numbers every node of one board from parent_profile/position. Returns how
+    many nodes were numbered.
+    """
+    nodes = list(MatrixNode.objects.filter(board=board_level).order_by('pk').values_list(
+        'pk', 'user__memberprofile__id', 'parent_profile_id', 'position'
+    ))
+    node_of = {}
+    children = {}
+    for pk, profile_id, parent_id, position in nodes:
+        if profile_id is None or profile_id in node_of:
+            continue
+        node_of[profile_id] = pk
+        children.setdefault(parent_id, []).append((position, pk, profile_id))
+
+    numbered = {}
+    # Tops: nodes with no parent, placed under themselves, or under a member without a node of their own
+    queue = []
+    for parent_id, kids in children.items():
+        for position, pk, profile_id in kids:
+            if parent_id is None or parent_id == profile_id:
+                numbered[pk] = (profile_id, 1)
+                queue.append((profile_id, profile_id, 1))
+        if parent_id is not None and parent_id not in node_of:
+            queue.append((parent_id, parent_id, 1))
+
+    while queue:
+        profile_id, root_id, index = queue.pop()
+        if index >= FRAME_LIMIT:
+            root_id, index = profile_id, 1
+        for position, pk, child_id in children.get(profile_id, []):
+            if pk in numbered or child_id == profile_id:
+                continue
+            numbered[pk] = (root_id, 2 * index + position - 1)
+            queue.append((child_id, root_id, 2 * index + position - 1))
+
+    # Anything not reached is caught in a parent loop and stays unnumbered
+    MatrixNode.objects.filter(board=board_level).update(tree_root=None, slot_index=None)
+    MatrixNode.objects.bulk_update(
+        [MatrixNode(pk=pk, tree_root_id=root_id, slot_index=slot_index) for pk, (root_id, slot_index) in numbered.items()],
+        ['tree_root', 'slot_index'],
+        batch_size=BATCH_SIZE
+    )
+    return len(numbered)
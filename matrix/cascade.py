@@ -0,0 +1,201 @@
+import threading
+from collections import defaultdict
+from decimal import Decimal
+from django.db import models, transaction
+from django.db.models import Case, F, Value, When
+
+# A single placement that sets off more steps than this is almost certainly a
+# corrupt tree (e.g. a loop in the FK columns); give up and roll back.
+MAX_STEPS = 100000
+BATCH_SIZE = 500
+MONEY_FIELDS = ('wallet', 'balance', 'nfg_balance', *[f'board_{b}_earned' for b in range(1, 6)])
+
+_local = threading.local()
+
+
+class CascadeLimitError(RuntimeError):
+    pass
+
+
+class _Cascade:
+    """
+    Work list for one placement and everything it sets off. Steps run last in,
+    first out, which is the same order the old recursive calls ran in. Money
+    moves and ledger rows are collected here and written once at the end.
+    """
+
+    def __init__(self):
+        self.steps = []
+        self.placed = set()
+        self.touched = set()
+        self.credits = defaultdict(lambda: defaultdict(Decimal))
+        self.transactions = []
+        self.revenue = defaultdict(Decimal)
+        self.admin_fees = defaultdict(Decimal)
+        self.stats = {'steps': 0, 'placements': 0, 'skipped': 0, 'cycles': 0, 'upgrades': 0, 'max_pending': 0}
+
+    def run(self):
+        result = None
+        first = True
+        while self.steps:
+            func, args = self.steps.pop()
+            self.stats['steps'] += 1
+            if self.stats['steps'] > MAX_STEPS:
+                raise CascadeLimitError(f"Cascade stopped after {MAX_STEPS} steps")
+            value = func(*args)
+            if first:
+                result, first = value, False
+            self.stats['max_pending'] = max(self.stats['max_pending'], len(self.steps))
+        self.flush()
+        return result
+
+    def flush(self):
+        from .models import MemberProfile, Transaction, AdminRevenue
+
+        for field in MONEY_FIELDS:
+            deltas = {pk: moves[field] for pk, moves in self.credits.items() if moves[field]}
+            if not deltas:
+                continue
+            pks = list(deltas)
+            for start in range(0, len(pks), BATCH_SIZE):
+                chunk = pks[start:start + BATCH_SIZE]
+                delta = Case(
+                    *[When(pk=pk, then=Value(deltas[pk])) for pk in chunk],
+                    output_field=models.DecimalField(max_digits=20, decimal_places=2)
+                )
+                MemberProfile.objects.filter(pk__in=chunk).update(**{field: F(field) + delta})
+
+        Transaction.objects.bulk_create(self.transactions, batch_size=BATCH_SIZE)
+
+        for board_level, amount in sorted(self.revenue.items()):
+            AdminRevenue.update_revenue(amount, board_level)
+        if self.admin_fees:
+            from .logic import track_admin_fee
+            for board_level, amount in sorted(self.admin_fees.items()):
+                track_admin_fee(amount, board_level)
+
+        members_changed(self.touched | set(self.credits))
+
+
+def active():
+    return getattr(_local, 'cascade', None)
+
+
+def run(func, *args):
+    """
+    Runs func(*args) as a cascade step. Inside a running cascade the step is
+    queued (and None returned); otherwise a new cascade starts, runs until
+    nothing is left and returns func's own return value.
+    """
+    cascade = active()
+    if cascade is not None:
+        cascade.steps.append((func, args))
+        return None
+
+    cascade = _Cascade()
+    cascade.steps.append((func, args))
+    _local.cascade = cascade
+    try:
+        with transaction.atomic():
+            return cascade.run()
+    finally:
+        _local.cascade = None
+        _local.last_stats = cascade.stats
+
+
+def last_stats():
+    """Counters of the last cascade run on this thread (steps, placements, cycles, upgrades, ...)."""
+    return getattr(_local, 'last_stats', None)
+
+
+def count(stat):
+    cascade = active()
+    if cascade is not None:
+        cascade.stats[stat] += 1
+
+
+def placed_earlier(profile, board_level):
+    """True if profile was already placed on board_level earlier in this cascade (no need to ask the database)."""
+    cascade = active()
+    if cascade is not None and (profile.pk, board_level) in cascade.placed:
+        cascade.stats['skipped'] += 1
+        return True
+    return False
+
+
+def mark_placed(profile, board_level):
+    cascade = active()
+    if cascade is not None:
+        cascade.placed.add((profile.pk, board_level))
+        cascade.stats['placements'] += 1
+
+
+def forget_placed(profile, board_level):
+    # Its node on this board was deleted (cycle), so it may be placed there again
+    cascade = active()
+    if cascade is not None:
+        cascade.placed.discard((profile.pk, board_level))
+
+
+def members_changed(profile_ids):
+    """Rewrites the board report cache rows and drops the cached dashboards of these members."""
+    from .board_cache import refresh_board_cache
+    from .dashboard import invalidate_dashboards
+    refresh_board_cache(profile_ids)
+    invalidate_dashboards(profile_ids)
+
+
+def touch(*profiles):
+    touch_ids([profile.pk for profile in profiles if profile])
+
+
+def touch_ids(profile_ids):
+    """Marks these members as changed (handled once the cascade is written, or right away outside one)."""
+    cascade = active()
+    if cascade is None:
+        members_changed(set(profile_ids))
+        return
+    cascade.touched.update(profile_ids)
+
+
+def credit(profile, **amounts):
+    """wallet/balance/nfg_balance/board_N_earned += amount for profile (deferred while a cascade runs)."""
+    cascade = active()
+    if cascade is None:
+        from .models import MemberProfile
+        MemberProfile.objects.filter(pk=profile.pk).update(
+            **{field: F(field) + amount for field, amount in amounts.items()}
+        )
+        touch(profile)
+        return
+    for field, amount in amounts.items():
+        cascade.credits[profile.pk][field] += Decimal(amount)
+
+
+def record_transaction(profile, tx_type, amount, detail=""):
+    from .models import Transaction
+    cascade = active()
+    if cascade is None:
+        Transaction.objects.create(profile=profile, tx_type=tx_type, amount=amount, detail=detail)
+        return
+    cascade.transactions.append(Transaction(profile_id=profile.pk, tx_type=tx_type, amount=amount, detail=detail))
+
+
+def add_revenue(amount, board_level):
+    """AdminRevenue.update_revenue, deferred while a cascade runs."""
+    cascade = active()
+    if cascade is None:
+        from .models import AdminRevenue
+        AdminRevenue.update_revenue(amount, board_level)
+        return
+    cascade.revenue[board_level] += amount
+
+
+def add_admin_fee(amount, board_level):
+    """track_admin_fee, deferred while a cascade runs."""
+    cascade = active()
+    if cascade is None:
+        from .logic import track_admin_fee
+        track_admin_fee(amount, board_level)
+        return
+    cascade.admin_fees[board_level] += Decimal(str(amount))
@@ -0,0 +1,110 @@
+import uuid
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from .models import MemberProfile
+from .sponsor_tree import team_counts
+
+BOARDS = range(1, 6)
+
+
+def cache_seconds():
+    return getattr(settings, 'MATRIX_DASHBOARD_CACHE_SECONDS', 300)
+
+
+def dashboard_key(user_id):
+    return f'matrix:dashboard:{user_id}'
+
+
+def board_version_key(user_id):
+    return f'matrix:boards:version:{user_id}'
+
+
+def board_version(user_id):
+    """
+    (token, last modified) of the member's boards, held in cache only: the
+    polling endpoint's ETag / Last-Modified. A missing entry simply starts a
+    new version, so this never reads the database.
+    """
+    key = board_version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        version = (uuid.uuid4().hex[:16], timezone.now().replace(microsecond=0))
+        if not cache.add(key, version, cache_seconds()):
+            version = cache.get(key) or version
+    return version
+
+
+def build_dashboard(user):
+    """
+    The dashboard context for user: the profile with its ten shoulders in one
+    query, directs and team figures in one aggregate.
+    """
+    profile = MemberProfile.objects.select_related(
+        'user', *[f'{side}_child_b{b}' for b in BOARDS for side in ('left', 'right')]
+    ).get(user=user)
+
+    # 1. Get total board counts (Total people in their 2x2 matrix)
+    counts = {
+        'b1': profile.board_1_count_value or 0,
+        'b2': profile.board_2_count or 0,
+        'b3': profile.board_3_count or 0,
+        'b4': profile.board_4_count or 0,
+        'b5': profile.board_5_count or 0,
+    }
+
+    # 2. Directs per board and the whole team (sponsor closure table, one query)
+    team = team_counts(profile)
+    direct_referrals = {
+        **{f'd{b}': team[f'd{b}'] for b in BOARDS},
+        'total_directs': team['directs'],
+        'team_total': team['total'],
+        'team_depth': team['max_depth'],
+        **{f't{b}': team[f'b{b}'] for b in BOARDS},
+    }
+
+    # 3. Progress percentages (Since it's a 2x2 matrix, the goal is 6 people.)
+    percents = {
+        f'{k}_percent': min((v / 6) * 100, 100) for k, v in counts.items()
+    }
+
+    return {
+        'profile': profile,
+        **counts,
+        **direct_referrals,
+        **percents,
+        # Tree Pointers for UI rendering (Shoulders)
+        'nodes': {
+            f'b{b}': {'l': getattr(profile, f'left_child_b{b}'), 'r': getattr(profile, f'right_child_b{b}')}
+            for b in BOARDS
+        },
+    }
+
+
+def get_dashboard(user):
+    """Cached build_dashboard(user); a hit costs no matrix queries at all."""
+    key = dashboard_key(user.pk)
+    context = cache.get(key)
+    if context is None:
+        context = build_dashboard(user)
+        cache.set(key, context, cache_seconds())
+    return context
+
+
+def forget_dashboard(user_id):
+    # After commit, so a concurrent page load cannot cache the old state again
+    transaction.on_commit(lambda: cache.delete_many([dashboard_key(user_id), board_version_key(user_id)]))
+
+
+def invalidate_dashboards(profile_ids):
+    """Drops the cached dashboards and board versions of these MemberProfile pks (placement, cycle, upgrade, payouts)."""
+    profile_ids = {pk for pk in profile_ids if pk}
+    if not profile_ids:
+        return
+
+    def drop():
+        user_ids = MemberProfile.objects.filter(pk__in=profile_ids).values_list('user_id', flat=True)
+        cache.delete_many([key for user_id in user_ids for key in (dashboard_key(user_id), board_version_key(user_id))])
+
+    transaction.on_commit(drop)
@@ -0,0 +1,87 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q
+from .models import SponsorLink
+
+BOARDS = range(1, 6)
+MAX_LEVELS = 100
+PAGE_SIZE = 50
+
+
+def cache_seconds():
+    return getattr(settings, 'MATRIX_DOWNLINE_CACHE_SECONDS', 600)
+
+
+def downline_key(profile_id):
+    return f'matrix:downline:{profile_id}'
+
+
+def build_downline(profile_id):
+    """
+    Whole sponsor-tree downline of a member in one grouped query over the
+    closure table: per level the members, active, pending (unpaid) and
+    current-board split, plus the totals. Levels past MAX_LEVELS are only in
+    the totals.
+    """
+    counts = {
+        'members': Count('pk'),
+        'active': Count('pk', filter=Q(descendant__is_active=True)),
+        'pending': Count('pk', filter=Q(descendant__payment_status='pending')),
+        **{f'b{b}': Count('pk', filter=Q(descendant__current_board=b)) for b in BOARDS},
+    }
+    rows = SponsorLink.objects.filter(ancestor_id=profile_id, depth__gte=1).values('depth').annotate(**counts).order_by('depth')
+
+    totals = {'members': 0, 'active': 0, 'pending': 0, 'boards': {b: 0 for b in BOARDS}, 'max_depth': 0}
+    levels = []
+    for row in rows:
+        totals['max_depth'] = row['depth']
+        boards = {b: row[f'b{b}'] for b in BOARDS}
+        for key in ('members', 'active', 'pending'):
+            totals[key] += row[key]
+        for b in BOARDS:
+            totals['boards'][b] += boards[b]
+        if len(levels) < MAX_LEVELS:
+            levels.append({
+                'depth': row['depth'], 'members': row['members'], 'active': row['active'],
+                'pending': row['pending'], 'boards': boards,
+            })
+    return {**totals, 'levels': levels}
+
+
+def get_downline(profile_id):
+    """Cached build_downline; dropped when anyone below registers, activates or moves board."""
+    key = downline_key(profile_id)
+    downline = cache.get(key)
+    if downline is None:
+        downline = build_downline(profile_id)
+        cache.set(key, downline, cache_seconds())
+    return downline
+
+
+def downline_members(profile_id, level=None, after=0, limit=PAGE_SIZE):
+    """
+    One page of the downline itself, in member pk order from `after` (keyset,
+    on the closure table's (ancestor, descendant) index), optionally one level only.
+    """
+    links = SponsorLink.objects.filter(ancestor_id=profile_id, descendant_id__gt=after)
+    links = links.filter(depth=level) if level else links.filter(depth__gte=1)
+    return list(links.order_by('descendant_id').values(
+        'descendant_id', 'depth', 'descendant__user__username', 'descendant__sponser__user__username',
+        'descendant__is_active', 'descendant__payment_status', 'descendant__current_board',
+    )[:limit])
+
+
+def forget_uplines(profile_ids, include_self=False):
+    """
+    Drops the cached downlines of everyone above these members (and their own
+    with include_self). The upline is looked up now, so this also works just
+    before a member is deleted; the cache entries go after commit.
+    """
+    profile_ids = {pk for pk in profile_ids if pk}
+    if not profile_ids:
+        return
+    links = SponsorLink.objects.filter(descendant_id__in=profile_ids, depth__gte=0 if include_self else 1)
+    keys = [downline_key(pk) for pk in set(links.values_list('ancestor_id', flat=True))]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
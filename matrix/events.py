@@ -0,0 +1,386 @@
+import datetime
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.color import no_style
+from django.db import connections, models, transaction
+from django.db.models import Case, F, Q, Value
+from django.db.models.expressions import CombinedExpression
+from django.db.models.functions import Cast
+from django.db.models.lookups import Exact, In
+
+BATCH_SIZE = 1000
+BOARDS = range(1, 6)
+SLOT_FIELDS = {f'{side}_child_b{b}_id' for b in BOARDS for side in ('left', 'right')}
+COUNT_FIELDS = {'board_1_count_value', *[f'board_{b}_count' for b in range(2, 6)], 'paid_referrals_count'}
+EARNED_FIELDS = {f'board_{b}_earned' for b in BOARDS}
+MONEY_FIELDS = {'balance', 'wallet', 'nfg_balance', 'pending_withdrawals'}
+# Deleting a member nulls these on the rows pointing at it without going
+# through a queryset (on_delete=SET_NULL), so replay does the same
+MEMBER_SET_NULL = SLOT_FIELDS | {'sponser_id'}
+
+
+def enabled():
+    return getattr(settings, 'MATRIX_EVENT_LOG', False)
+
+
+def _target(model):
+    return 'member' if model._meta.model_name == 'memberprofile' else 'node'
+
+
+def _fields(model):
+    return [f.attname for f in model._meta.concrete_fields if not f.primary_key]
+
+
+def _kind(target, op, rows):
+    if target == 'node':
+        return {'create': 'placement', 'delete': 'node_removed'}.get(op, 'renumber')
+    if op != 'update':
+        return {'create': 'member', 'delete': 'member_removed'}.get(op, op)
+    fields = {f for _, values, deltas in rows for f in [*values, *deltas]}
+    if 'current_board' in fields:
+        return 'upgrade'
+    if 'cycle_count' in fields:
+        return 'cycle'
+    if fields & SLOT_FIELDS:
+        filled = any(values.get(f) is not None for _, values, _ in rows for f in SLOT_FIELDS)
+        return 'slot_fill' if filled else 'slot_clear'
+    if fields & COUNT_FIELDS:
+        return 'count'
+    if fields & EARNED_FIELDS:
+        return 'bonus'
+    if fields & MONEY_FIELDS:
+        return 'balance'
+    return 'member'
+
+
+def _json(values):
+    # DjangoJSONEncoder cuts datetimes to milliseconds; replay needs them exact
+    return {f: v.isoformat() if isinstance(v, datetime.datetime) else v for f, v in values.items()}
+
+
+def _write(model, using, op, rows, kind=None):
+    """Appends rows ([[ids], {field: value}, {field: delta}]) as events, BATCH_SIZE rows per event."""
+    from .models import MatrixEvent
+    target = _target(model)
+    rows = [[ids, _json(values), deltas] for ids, values, deltas in rows]
+    MatrixEvent.objects.using(using).bulk_create([
+        MatrixEvent(
+            target=target, op=op, kind=kind or _kind(target, op, rows[start:start + BATCH_SIZE]),
+            data={'rows': rows[start:start + BATCH_SIZE]},
+        )
+        for start in range(0, len(rows), BATCH_SIZE)
+    ])
+
+
+def _plain(value):
+    return value.pk if isinstance(value, models.Model) else value
+
+
+def record_created(model, using, objs):
+    fields = _fields(model)
+    rows = [[[obj.pk], {f: getattr(obj, f) for f in fields}, {}] for obj in objs]
+    if rows:
+        _write(model, using, 'create', rows)
+
+
+def record_saved(instance, created, update_fields, using):
+    model = type(instance)
+    if created or update_fields is None:
+        fields = _fields(model)
+    else:
+        fields = [model._meta.get_field(name).attname for name in update_fields]
+    rows = [[[instance.pk], {f: getattr(instance, f) for f in fields}, {}]]
+    # A full save rewrites every column, so the fields say nothing about what happened
+    kind = 'save' if not created and update_fields is None else None
+    _write(model, using, 'create' if created else 'update', rows, kind=kind)
+
+
+def record_deleted(instance, using):
+    _write(type(instance), using, 'delete', [[[instance.pk], {}, {}]])
+
+
+def _target_pks(queryset):
+    """
+    The pks an update() is about to touch. filter(pk=...) and filter(pk__in=[...])
+    are read off the query; anything else costs one SELECT (rows locked where
+    the database can).
+    """
+    where = queryset.query.where
+    if where.connector == 'AND' and not where.negated and len(where.children) == 1:
+        lookup = where.children[0]
+        field = getattr(getattr(lookup, 'lhs', None), 'target', None)
+        if field is not None and field.primary_key and field.model is queryset.model:
+            if isinstance(lookup, Exact) and not hasattr(lookup.rhs, 'resolve_expression'):
+                return [_plain(lookup.rhs)]
+            if isinstance(lookup, In) and isinstance(lookup.rhs, (list, tuple, set)):
+                return [_plain(pk) for pk in lookup.rhs]
+    return list(queryset.select_for_update().values_list('pk', flat=True))
+
+
+def _by_pk(expression):
+    """{pk: value} of a Case(When(pk=..., then=value), ...) as bulk_update and the batch writers build, else None."""
+    if isinstance(expression, Cast):
+        expression = expression.get_source_expressions()[0]
+    if not isinstance(expression, Case) or not (isinstance(expression.default, Value) and expression.default.value is None):
+        return None
+    values = {}
+    for when in expression.cases:
+        condition = when.condition
+        if not isinstance(condition, Q) or condition.negated or len(condition.children) != 1:
+            return None
+        lookup, pk = condition.children[0]
+        if lookup not in ('pk', 'pk__exact', 'id') or not isinstance(when.result, Value):
+            return None
+        values[_plain(pk)] = _plain(when.result.value)
+    return values
+
+
+def _increment(expression, names):
+    """(sign, right-hand side) of F(field) +/- something on the same field, else None."""
+    if not isinstance(expression, CombinedExpression) or expression.connector not in ('+', '-'):
+        return None
+    if not isinstance(expression.lhs, F) or expression.lhs.name not in names:
+        return None
+    return (1 if expression.connector == '+' else -1), expression.rhs
+
+
+def record_update(model, using, pks, updates):
+    """
+    Logs queryset.update(**updates) on pks: plain values and F() +/- constant
+    as they are, per-row Case() values and deltas row by row, and anything
+    else by reading the written values back.
+    """
+    values, deltas, row_values, row_deltas, reread = {}, {}, {}, {}, []
+    for name, value in updates.items():
+        field = model._meta.get_field(name)
+        attname = field.attname
+        if not hasattr(value, 'resolve_expression'):
+            values[attname] = _plain(value)
+            continue
+        if isinstance(value, Value):
+            values[attname] = _plain(value.value)
+            continue
+        per_row = _by_pk(value)
+        if per_row is not None:
+            for pk, row_value in per_row.items():
+                row_values.setdefault(pk, {})[attname] = row_value
+            continue
+        increment = _increment(value, (name, attname))
+        if increment is not None:
+            sign, rhs = increment
+            if isinstance(rhs, Value):
+                deltas[attname] = sign * rhs.value
+                continue
+            per_row = _by_pk(rhs)
+            if per_row is not None:
+                for pk, delta in per_row.items():
+                    row_deltas.setdefault(pk, {})[attname] = sign * delta
+                continue
+        reread.append(attname)
+
+    if reread:
+        for row in model._base_manager.using(using).filter(pk__in=pks).values('pk', *reread):
+            pk = row.pop('pk')
+            row_values.setdefault(pk, {}).update(row)
+
+    if row_values or row_deltas:
+        rows = [[[pk], {**values, **row_values.get(pk, {})}, {**deltas, **row_deltas.get(pk, {})}] for pk in pks]
+    else:
+        rows = [[list(pks), values, deltas]]
+    _write(model, using, 'update', rows)
+
+
+class LoggedQuerySet(models.QuerySet):
+    """
+    QuerySet of MemberProfile and MatrixNode: update() and bulk_create() (and
+    so bulk_update()) append what they wrote to the matrix event log in the
+    same transaction. save() and delete() are logged by the model signals.
+    """
+
+    def update(self, **kwargs):
+        if not enabled():
+            return super().update(**kwargs)
+        with transaction.atomic(using=self.db, savepoint=False):
+            pks = _target_pks(self)
+            updated = super().update(**kwargs)
+            if updated:
+                record_update(self.model, self.db, pks, kwargs)
+        return updated
+
+    def bulk_create(self, objs, *args, **kwargs):
+        if not enabled():
+            return super().bulk_create(objs, *args, **kwargs)
+        with transaction.atomic(using=self.db, savepoint=False):
+            objs = super().bulk_create(objs, *args, **kwargs)
+            # bulk_create hands the pks back on SQLite and PostgreSQL
+            record_created(self.model, self.db, objs)
+        return objs
+
+
+def baseline_events(using='default', kind='baseline'):
+    """
+    One create event (of this kind) per existing member and node, so the log
+    replays to the state it started from. Written after a snapshot restore
+    and by `replay_events --baseline`.
+    """
+    from .models import MatrixNode, MemberProfile
+
+    for model in (MemberProfile, MatrixNode):
+        fields = _fields(model)
+        rows = []
+        for row in model.objects.using(using).order_by('pk').values('pk', *fields).iterator(chunk_size=BATCH_SIZE):
+            rows.append([[row.pop('pk')], row, {}])
+            if len(rows) == BATCH_SIZE:
+                _write(model, using, 'create', rows, kind=kind)
+                rows = []
+        if rows:
+            _write(model, using, 'create', rows, kind=kind)
+
+
+def record_reset(using='default'):
+    """
+    Marks where the log starts over: replay drops what came before the last
+    marker. restore_snapshot writes one, then the restored rows as events.
+    """
+    from .models import MatrixEvent
+    MatrixEvent.objects.using(using).create(kind='reset', target='member', op='reset', data={'rows': []})
+
+
+# --- Replay ---
+
+def _converters(model):
+    return {f.attname: f.to_python for f in model._meta.concrete_fields}
+
+
+def _drop_member(state, pk):
+    members, nodes = state['member'], state['node']
+    members.pop(pk, None)
+    for row in members.values():
+        for field in MEMBER_SET_NULL:
+            if row.get(field) == pk:
+                row[field] = None
+    for node_pk, row in list(nodes.items()):
+        if row.get('parent_profile_id') == pk:
+            del nodes[node_pk]
+        elif row.get('tree_root_id') == pk:
+            row['tree_root_id'] = None
+
+
+def apply_event(state, converters, target, op, data):
+    if op == 'reset':
+        for table in state.values():
+            table.clear()
+        return
+    table, convert = state[target], converters[target]
+    for ids, values, deltas in data['rows']:
+        if op == 'delete':
+            for pk in ids:
+                if target == 'member':
+                    _drop_member(state, pk)
+                else:
+                    table.pop(pk, None)
+            continue
+        values = {f: convert[f](v) for f, v in values.items()}
+        deltas = {f: convert[f](d) for f, d in deltas.items()}
+        for pk in ids:
+            if op == 'create':
+                table[pk] = dict(values)
+                continue
+            row = table.get(pk)
+            if row is None:
+                # The update matched a row that was never created (or was deleted)
+                continue
+            row.update(values)
+            for field, delta in deltas.items():
+                row[field] += delta
+
+
+def replay(using='default'):
+    """
+    Folds the event log, in order from the last reset marker (a snapshot
+    restore) or the start, into {'member': {pk: row}, 'node': {pk: row}};
+    rows hold every column but the pk. Returns (state, events folded).
+    """
+    from .models import MatrixEvent, MatrixNode, MemberProfile
+
+    converters = {'member': _converters(MemberProfile), 'node': _converters(MatrixNode)}
+    state = {'member': {}, 'node': {}}
+    count = 0
+    events = MatrixEvent.objects.using(using).order_by('pk')
+    reset = events.filter(op='reset').order_by('-pk').values_list('pk', flat=True).first()
+    if reset is not None:
+        events = events.filter(pk__gte=reset)
+    events = events.values_list('target', 'op', 'data')
+    for target, op, data in events.iterator(chunk_size=BATCH_SIZE):
+        apply_event(state, converters, target, op, data)
+        count += 1
+    return state, count
+
+
+def compare(state, using='default', limit=50):
+    """
+    Differences between a replayed state and the live tables:
+    [(target, pk, field, replayed, live)], field None for a missing/extra row.
+    Stops after `limit` of them.
+    """
+    from .models import MatrixNode, MemberProfile
+
+    diffs = []
+    for target, model in (('member', MemberProfile), ('node', MatrixNode)):
+        replayed = dict(state[target])
+        fields = _fields(model)
+        for row in model._base_manager.using(using).order_by('pk').values('pk', *fields).iterator(chunk_size=BATCH_SIZE):
+            pk = row.pop('pk')
+            expected = replayed.pop(pk, None)
+            if expected is None:
+                diffs.append((target, pk, None, None, 'row'))
+                continue
+            diffs.extend((target, pk, f, expected.get(f), row[f]) for f in fields if expected.get(f) != row[f])
+            if len(diffs) >= limit:
+                return diffs[:limit]
+        diffs.extend((target, pk, None, 'row', None) for pk in list(replayed)[:limit])
+    return diffs[:limit]
+
+
+def write_state(state, source, into):
+    """
+    Writes a replayed state into another (migrated, empty) database: the
+    users it needs copied from the source, then members, nodes and the event
+    log itself in batched inserts, so the copy keeps logging from there.
+    """
+    from .models import MatrixEvent, MatrixNode, MemberProfile
+
+    if MemberProfile.objects.using(into).exists() or MatrixEvent.objects.using(into).exists():
+        raise ValueError(f"Database '{into}' already has members or events; replay needs a fresh one")
+
+    with transaction.atomic(using=into):
+        user_ids = sorted({row['user_id'] for table in state.values() for row in table.values()})
+        present = set(User.objects.using(into).values_list('pk', flat=True))
+        wanted = [pk for pk in user_ids if pk not in present]
+        for start in range(0, len(wanted), BATCH_SIZE):
+            users = User.objects.using(source).filter(pk__in=wanted[start:start + BATCH_SIZE]).values()
+            User.objects.using(into).bulk_create([User(**row) for row in users])
+
+        # Plain querysets: these rows are not new events, the log is copied as is
+        for model, target in ((MemberProfile, 'member'), (MatrixNode, 'node')):
+            rows = sorted(state[target].items())
+            # bulk_create stamps auto_now(_add) columns with the current time; put the replayed ones back
+            stamped = [f.name for f in model._meta.concrete_fields if getattr(f, 'auto_now', False) or getattr(f, 'auto_now_add', False)]
+            for start in range(0, len(rows), BATCH_SIZE):
+                chunk = rows[start:start + BATCH_SIZE]
+                models.QuerySet(model, using=into).bulk_create([model(pk=pk, **row) for pk, row in chunk])
+                if stamped:
+                    models.QuerySet(model, using=into).bulk_update([model(pk=pk, **row) for pk, row in chunk], stamped)
+        events = MatrixEvent.objects.using(source).order_by('pk').values()
+        batch = []
+        for row in events.iterator(chunk_size=BATCH_SIZE):
+            batch.append(MatrixEvent(**row))
+            if len(batch) >= BATCH_SIZE:
+                MatrixEvent.objects.using(into).bulk_create(batch)
+                batch = []
+        MatrixEvent.objects.using(into).bulk_create(batch)
+
+        connection = connections[into]
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), [User, MemberProfile, MatrixNode, MatrixEvent]):
+                cursor.execute(sql)
@@ -0,0 +1,183 @@
+import traceback
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+from .models import MemberProfile, MatrixJob
+
+BATCH_SIZE = 50
+# A running job whose worker has not finished it after this long is claimed
+# again; run_jobs locks its claim, so the first worker's run is never repeated
+LEASE = timedelta(minutes=10)
+RETRY_BASE_SECONDS = 30
+
+
+def _run_activate(jobs):
+    from .activation import bulk_activate
+    bulk_activate(MemberProfile.objects.filter(pk__in=[job.profile_id for job in jobs]))
+
+
+def _fresh_profile(job):
+    # Jobs earlier in the batch may have filled the sponsor's slots since the claim
+    return MemberProfile.objects.select_related('sponser').get(pk=job.profile_id)
+
+
+def _run_place_in_matrix(job):
+    _fresh_profile(job).place_in_matrix(board_num=job.board)
+
+
+def _run_spillover(job):
+    from .logic import place_member_with_spillover
+    profile = _fresh_profile(job)
+    if profile.sponser:
+        place_member_with_spillover(profile, profile.sponser, job.board)
+
+
+# kind -> (handler, takes the whole run of consecutive jobs of this kind)
+HANDLERS = {
+    'activate': (_run_activate, True),
+    'place_in_matrix': (_run_place_in_matrix, False),
+    'spillover': (_run_spillover, False),
+}
+
+
+def placement_inline():
+    return getattr(settings, 'MATRIX_PLACEMENT_INLINE', False)
+
+
+def enqueue(kind, profile, board=1):
+    """
+    Queues placement work for the worker. With MATRIX_PLACEMENT_INLINE on
+    (local setups without a worker) it runs right away instead.
+    """
+    if placement_inline():
+        job = MatrixJob(kind=kind, profile=profile, board=board)
+        handler, grouped = HANDLERS[kind]
+        handler([job] if grouped else job)
+        return None
+    return MatrixJob.objects.create(kind=kind, profile=profile, board=board)
+
+
+def enqueue_many(kind, profiles, board=1):
+    if placement_inline():
+        jobs = [MatrixJob(kind=kind, profile=profile, board=board) for profile in profiles]
+        handler, grouped = HANDLERS[kind]
+        if grouped:
+            handler(jobs)
+        else:
+            for job in jobs:
+                handler(job)
+        return []
+    return MatrixJob.objects.bulk_create(
+        [MatrixJob(kind=kind, profile=profile, board=board) for profile in profiles], batch_size=500
+    )
+
+
+def claim_jobs(limit=BATCH_SIZE):
+    """Claims up to limit due jobs for this worker, oldest first."""
+    now = timezone.now()
+    due = Q(status='pending', run_after__lte=now) | Q(status='running', claimed_at__lt=now - LEASE)
+    candidates = list(MatrixJob.objects.filter(due).order_by('pk').values_list('pk', flat=True)[:limit])
+    if not candidates:
+        return []
+
+    # One UPDATE: if another worker took some of these first, the filter skips them
+    token = uuid.uuid4().hex
+    MatrixJob.objects.filter(due, pk__in=candidates).update(
+        status='running', claim_token=token, claimed_at=now, started_at=now
+    )
+    return list(MatrixJob.objects.filter(claim_token=token, status='running').order_by('pk'))
+
+
+def _finish(jobs):
+    MatrixJob.objects.filter(pk__in=[job.pk for job in jobs]).update(
+        status='done', finished_at=timezone.now(), last_error=''
+    )
+
+
+def _claimed(jobs):
+    """
+    The jobs still held by this claim, locked until the caller's transaction
+    ends. A worker claiming them again after the lease waits for the lock and
+    then finds them done; one that got in first changed the token, so they are
+    skipped here.
+    """
+    held = set(MatrixJob.objects.select_for_update().filter(
+        pk__in=[job.pk for job in jobs], claim_token=jobs[0].claim_token, status='running'
+    ).values_list('pk', flat=True))
+    return [job for job in jobs if job.pk in held]
+
+
+def _fail(jobs, error):
+    now = timezone.now()
+    for job in jobs:
+        attempts = job.attempts + 1
+        mine = MatrixJob.objects.filter(pk=job.pk, claim_token=job.claim_token, status='running')
+        if attempts >= job.max_attempts:
+            mine.update(status='failed', attempts=attempts, finished_at=now, last_error=error)
+        else:
+            # 30s, 60s, 120s, ...
+            mine.update(
+                status='pending', attempts=attempts, claim_token='',
+                run_after=now + timedelta(seconds=RETRY_BASE_SECONDS * 2 ** (attempts - 1)), last_error=error
+            )
+
+
+def run_jobs(jobs):
+    """
+    Runs claimed jobs in order; each job (or run of grouped jobs) in its own
+    transaction, together with marking it done. Jobs claimed again by another
+    worker in the meantime are skipped. Returns (done, failed).
+    """
+    done = failed = 0
+    i = 0
+    while i < len(jobs):
+        handler, grouped = HANDLERS[jobs[i].kind]
+        group = [jobs[i]]
+        if grouped:
+            while i + len(group) < len(jobs) and jobs[i + len(group)].kind == jobs[i].kind:
+                group.append(jobs[i + len(group)])
+        i += len(group)
+
+        try:
+            with transaction.atomic():
+                group = _claimed(group)
+                if group:
+                    handler(group if grouped else group[0])
+                    _finish(group)
+        except Exception:
+            _fail(group, traceback.format_exc())
+            failed += len(group)
+        else:
+            done += len(group)
+    return done, failed
+
+
+def queue_stats(window=timedelta(hours=1)):
+    """Queue depth and wait/run latency (seconds) of the jobs finished inside window."""
+    now = timezone.now()
+    stats = MatrixJob.objects.aggregate(
+        pending=Count('pk', filter=Q(status='pending')),
+        running=Count('pk', filter=Q(status='running')),
+        failed=Count('pk', filter=Q(status='failed')),
+        oldest=Min('created_at', filter=Q(status='pending')),
+    )
+
+    waits, runs = [], []
+    finished = MatrixJob.objects.filter(status='done', finished_at__gte=now - window).values_list(
+        'created_at', 'started_at', 'finished_at'
+    ).order_by('-finished_at')[:1000]
+    for created_at, started_at, finished_at in finished:
+        waits.append((started_at - created_at).total_seconds())
+        runs.append((finished_at - started_at).total_seconds())
+
+    oldest = stats.pop('oldest')
+    stats.update({
+        'oldest_wait': (now - oldest).total_seconds() if oldest else 0,
+        'avg_wait': sum(waits) / len(waits) if waits else 0,
+        'avg_run': sum(runs) / len(runs) if runs else 0,
+        'finished': len(runs),
+    })
+    return stats
@@ -0,0 +1,140 @@
+from datetime import timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .models import MemberProfile, Transaction, LedgerTotal, ReconciliationRun, BalanceDrift
+
+BATCH_SIZE = 500
+ZERO = Decimal('0.00')
+MONEY = DecimalField(max_digits=20, decimal_places=2)
+# Ledger rows that move nfg_balance; every other type moves balance and wallet together
+NFG_TYPES = ('AIRDROP',)
+
+
+def settle_seconds():
+    return getattr(settings, 'MATRIX_LEDGER_SETTLE_SECONDS', 300)
+
+
+def ledger_sums(queryset):
+    """Per-member cash / nfg sums and row counts of a Transaction queryset, one grouped query."""
+    return queryset.order_by().values('profile_id').annotate(
+        cash=Coalesce(Sum('amount', filter=~Q(tx_type__in=NFG_TYPES)), Value(ZERO), output_field=MONEY),
+        nfg=Coalesce(Sum('amount', filter=Q(tx_type__in=NFG_TYPES)), Value(ZERO), output_field=MONEY),
+        n=Count('pk'),
+    )
+
+
+def classify(balance_drift, wallet_drift, nfg_drift):
+    """BalanceDrift kind for a set of drifts (stored minus ledger), None when everything matches."""
+    if balance_drift or wallet_drift:
+        if balance_drift == wallet_drift:
+            return 'untracked_credit' if balance_drift > 0 else 'untracked_debit'
+        if not wallet_drift:
+            return 'balance_only'
+        if not balance_drift:
+            return 'wallet_only'
+        return 'split'
+    if nfg_drift:
+        return 'nfg'
+    return None
+
+
+def _fold(rows):
+    """Adds grouped ledger rows onto LedgerTotal, one read and one upsert per chunk. Returns rows read."""
+    rows, read = list(rows), 0
+    for start in range(0, len(rows), BATCH_SIZE):
+        chunk = rows[start:start + BATCH_SIZE]
+        known = LedgerTotal.objects.in_bulk([row['profile_id'] for row in chunk])
+        totals = []
+        for row in chunk:
+            total = known.get(row['profile_id']) or LedgerTotal(profile_id=row['profile_id'], cash=ZERO, nfg=ZERO)
+            total.cash += row['cash']
+            total.nfg += row['nfg']
+            total.transactions += row['n']
+            totals.append(total)
+            read += row['n']
+        LedgerTotal.objects.bulk_create(
+            totals, batch_size=BATCH_SIZE, update_conflicts=True,
+            unique_fields=['profile'], update_fields=['cash', 'nfg', 'transactions', 'updated_at']
+        )
+    return read
+
+
+def _drifts(run, cutoff, members):
+    """
+    Members (of the members queryset) whose balance / wallet / nfg_balance
+    differ from LedgerTotal plus the not yet settled rows after cutoff (those
+    are summed live, not folded).
+    """
+    unsettled = Transaction.objects.filter(timestamp__gt=cutoff)
+    tail = {row['profile_id']: row for row in ledger_sums(unsettled.filter(profile__in=members))}
+    cash = Coalesce(F('ledger_total__cash'), Value(ZERO), output_field=MONEY)
+    nfg = Coalesce(F('ledger_total__nfg'), Value(ZERO), output_field=MONEY)
+    candidates = members.annotate(ledger_cash=cash, ledger_nfg=nfg).filter(
+        ~Q(balance=F('ledger_cash')) | ~Q(wallet=F('ledger_cash')) | ~Q(nfg_balance=F('ledger_nfg'))
+        | Q(pk__in=unsettled.values('profile_id'))
+    ).values_list('pk', 'balance', 'wallet', 'nfg_balance', 'ledger_cash', 'ledger_nfg')
+
+    for pk, balance, wallet, nfg_balance, ledger_cash, ledger_nfg in candidates.iterator(chunk_size=2000):
+        if pk in tail:
+            ledger_cash += tail[pk]['cash']
+            ledger_nfg += tail[pk]['nfg']
+        drift = (balance - ledger_cash, wallet - ledger_cash, nfg_balance - ledger_nfg)
+        kind = classify(*drift)
+        if kind:
+            yield BalanceDrift(
+                run=run, profile_id=pk, kind=kind,
+                balance_drift=drift[0], wallet_drift=drift[1], nfg_drift=drift[2]
+            )
+
+
+@transaction.atomic
+def reconcile_ledger(full=False):
+    """
+    Folds the Transaction rows since the last run's high-water mark into
+    LedgerTotal (all of them when full, or on the first run), then writes a
+    BalanceDrift row for every member whose stored balances no longer match.
+    An incremental run only checks members with rows above the mark; a
+    balance changed without any ledger row is found by the next full run.
+    Rows younger than MATRIX_LEDGER_SETTLE_SECONDS stay above the mark, so a
+    write that commits late with an older timestamp is still picked up.
+    Returns the finished ReconciliationRun.
+    """
+    last = None
+    if not full:
+        last = ReconciliationRun.objects.filter(
+            finished_at__isnull=False, high_water__isnull=False
+        ).order_by('-high_water').values_list('high_water', flat=True).first()
+    full = last is None
+    run = ReconciliationRun.objects.create(full=full)
+    cutoff = run.started_at - timedelta(seconds=settle_seconds())
+
+    new = Transaction.objects.filter(timestamp__lte=cutoff)
+    members = MemberProfile.objects.all()
+    if full:
+        LedgerTotal.objects.all().delete()
+    else:
+        new = new.filter(timestamp__gt=last)
+        members = members.filter(pk__in=Transaction.objects.filter(timestamp__gt=last).values('profile_id'))
+        cutoff = max(cutoff, last)
+    run.transactions_read = _fold(ledger_sums(new))
+
+    drifts = list(_drifts(run, cutoff, members))
+    BalanceDrift.objects.bulk_create(drifts, batch_size=BATCH_SIZE)
+    run.high_water = cutoff
+    run.members_checked = members.count()
+    run.drifted = len(drifts)
+    run.finished_at = timezone.now()
+    run.save()
+    return run
+
+
+def drift_summary(run):
+    """{kind: (members, balance drift total, nfg drift total)} of a run."""
+    rows = run.drifts.values('kind').annotate(
+        members=Count('pk'), balance=Sum('balance_drift'), nfg=Sum('nfg_drift')
+    ).order_by('kind')
+    return {row['kind']: (row['members'], row['balance'], row['nfg']) for row in rows}
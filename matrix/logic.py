@@ -1,9 +1,16 @@
-from collections import deque
 from decimal import Decimal
 from django.db import transaction
 from django.db.models import Q, F
 from django.contrib.auth.models import User
 from .models import MemberProfile, AdminRevenue, Transaction, MatrixNode
+from .frontier import next_open_slot, record_fill, record_release
+from .board_index import place_node, detach_children, board_ancestors
+from .board_cache import count_field, child_fields, earned_field, record_cycle
+from .recount import recount_boards
+from .revenue import record_fee
+from .stats import cycle_recorded
+from .tracing import span, traced
+from . import cascade
 
 # --- Configurations ---
 BOARD_CONFIGS = {
@@ -14,31 +21,27 @@ BOARD_CONFIGS = {
     5: {"name": "Gold", "payout": Decimal('13600.00'), "base": Decimal('3400.00'), "next_fee": None},
 }
 FEE_RATE = Decimal('0.10')
+# NFG credited for completing (cycling out of) each board
+NFG_REWARDS = {1: 110, 2: 300, 3: 800, 4: 2200, 5: 6800}
 
 # --- Helper Functions ---
 
 def award_nfg_airdrop(profile, board_level):
-    rewards = {1: 110, 2: 300, 3: 800, 4: 2200, 5: 6800}
-    reward = rewards.get(board_level, 0)
+    reward = NFG_REWARDS.get(board_level, 0)
     if reward > 0:
-        MemberProfile.objects.filter(pk=profile.pk).update(nfg_balance=F('nfg_balance') + reward)
+        cascade.credit(profile, nfg_balance=reward)
         profile.add_transaction('AIRDROP', reward, f"NFG Reward for Board {board_level} Completion")
 
 def track_admin_fee(amount, board_level):
-    stats, _ = AdminRevenue.objects.get_or_create(id=1)
-    amount_dec = Decimal(str(amount))
-    stats.total_fees_collected += amount_dec
-    field = f'b{board_level}_fees'
-    if hasattr(stats, field):
-        setattr(stats, field, (getattr(stats, field) or 0) + amount_dec)
-    stats.save()
+    # F() increments on a revenue shard (no read-modify-write on one shared row)
+    record_fee(amount, board_level)
 
 def get_parent_of_member(member, board_level):
-    node = MatrixNode.objects.filter(user=member.user, board=board_level).first()
-    return node.parent_profile if node else None
+    return board_ancestors(member, board_level, levels=1)[0]
 
 # --- Core Logic ---
 
+@traced()
 @transaction.atomic
 def handle_cycle(profile, board_level):
     """Triggered when board_count reaches 6."""
@@ -49,36 +52,48 @@ def handle_cycle(profile, board_level):
     award_nfg_airdrop(profile, board_level)
     total_earned_on_payline = config['base'] * 4 
     admin_cut = total_earned_on_payline * FEE_RATE
-    track_admin_fee(admin_cut, board_level)
+    cascade.add_admin_fee(admin_cut, board_level)
 
     # 2. Financial Update (Deduction for upgrade)
     deduction = admin_cut + (next_fee if next_fee else 0)
     
-    MemberProfile.objects.filter(pk=profile.pk).update(
-        balance=F('balance') - deduction,
-        wallet=F('wallet') - deduction,
-        cycle_count=F('cycle_count') + 1
-    )
+    cascade.credit(profile, balance=-deduction, wallet=-deduction)
+    MemberProfile.objects.filter(pk=profile.pk).update(cycle_count=F('cycle_count') + 1)
+    cascade.count('cycles')
+    record_cycle(profile, board_level)
+    cycle_recorded()
     
     
-    Transaction.objects.create(
-        profile=profile,
+    cascade.record_transaction(
+        profile,
         amount=-deduction,
         tx_type='UPGRADE',
         detail=f"Board {board_level} Complete. Fee + Upgrade to Board {board_level + 1 if next_fee else board_level}"
     )
     
     # 4. Reset Current Board State
-    count_attr = f'board_{board_level}_count' if board_level > 1 else 'board_1_count_value'
+    count_attr = count_field(board_level)
+    left_attr, right_attr = child_fields(board_level)
+    left_id, right_id = MemberProfile.objects.filter(pk=profile.pk).values_list(
+        f'{left_attr}_id', f'{right_attr}_id'
+    ).get()
     MemberProfile.objects.filter(pk=profile.pk).update(**{
         count_attr: 0,
-        f'left_child_b{board_level}': None,
-        f'right_child_b{board_level}': None,
+        left_attr: None,
+        right_attr: None,
         'cycle_count': F('cycle_count') + 1
     })
+    cascade.touch(profile)
+    # Both slots are open again for every sponsor tree above this member
+    if left_id:
+        record_release(profile, 1, board_level)
+    if right_id:
+        record_release(profile, 2, board_level)
     
     # Delete Node so user can re-enter this board level later if needed
+    detach_children(profile, board_level)
     MatrixNode.objects.filter(user=profile.user, board=board_level).delete()
+    cascade.forget_placed(profile, board_level)
     
     profile.refresh_from_db()
     
@@ -96,129 +111,154 @@ def handle_cycle(profile, board_level):
         if target_sponser:
             place_member_with_spillover(profile, target_sponser, board_level + 1)
 
+@traced()
 @transaction.atomic
 def place_member_with_spillover(new_member, sponser, board_level):
-    """BFS Spillover Placement."""
+    """
+    BFS Spillover Placement (next open slot comes from the sponsor's frontier).
+    Runs as a cascade step: called while a cascade is running it is queued and
+    returns None, otherwise it returns the parent once the whole cascade is done.
+    """
+    return cascade.run(_place_member, new_member, sponser, board_level)
+
+@traced()
+def _place_member(new_member, sponser, board_level):
+    if cascade.placed_earlier(new_member, board_level):
+        return None
     if MatrixNode.objects.filter(user=new_member.user, board=board_level).exists():
         return None
 
-    left_attr = f'left_child_b{board_level}'
-    right_attr = f'right_child_b{board_level}'
-
-    queue = deque([sponser])
-    target_parent, position = None, None
-
-    while queue:
-        current = queue.popleft()
-        # Check Left
-        l_child = getattr(current, left_attr)
-        if not l_child:
-            target_parent, position = current, 1
-            break
-        queue.append(l_child)
-        # Check Right
-        r_child = getattr(current, right_attr)
-        if not r_child:
-            target_parent, position = current, 2
-            break
-        queue.append(r_child)
+    left_attr, right_attr = child_fields(board_level)
+
+    with span('frontier.next_open_slot', board=board_level):
+        target_parent, position = next_open_slot(sponser, board_level)
 
     if target_parent:
-        setattr(target_parent, (left_attr if position == 1 else right_attr), new_member)
-        target_parent.save()
+        # The superuser has no sponsor, so a cycle can send it back under itself.
+        # lock_position() below saves new_member and always wiped that slot again,
+        # so only record real fills.
+        if target_parent.pk != new_member.pk:
+            setattr(target_parent, (left_attr if position == 1 else right_attr), new_member)
+            target_parent.save()
+            record_fill(target_parent, position, new_member, board_level)
 
-        MatrixNode.objects.create(
-            user=new_member.user,
-            board=board_level,
-            parent_profile=target_parent,
-            position=position
-        )
+        place_node(new_member, target_parent, position, board_level)
+        cascade.mark_placed(new_member, board_level)
 
         new_member.lock_position()
-        update_ancestor_counts(new_member, board_level)
+        cascade.run(update_ancestor_counts, new_member, board_level)
         return target_parent
     return None
 
+@traced()
 def update_ancestor_counts(member, board_level):
     """The 2x2 Payout and Upgrade Engine."""
-    config = BOARD_CONFIGS.get(board_level)
-    reward_amount = config['base']
-    # Match the weird naming convention in your models.py
-    count_attr = f'board_{board_level}_count' if board_level > 1 else 'board_1_count_value'
+    if cascade.active() is None:
+        return cascade.run(update_ancestor_counts, member, board_level)
+
+    count_attr = count_field(board_level)
 
     # 1. Update Parent Count
-    parent = get_parent_of_member(member, board_level)
+    # Parent and grandparent come from the slot numbering in one lookup
+    parent, grandparent = board_ancestors(member, board_level)
     if parent:
         MemberProfile.objects.filter(pk=parent.pk).update(**{count_attr: F(count_attr) + 1})
         parent.refresh_from_db()
+        board_before = parent.current_board
+        # Queued first so it runs after anything the parent's check sets off
+        cascade.run(_update_grandparent, member, board_level, parent, grandparent, board_before)
         # This triggers the model-level checks for Level 1 children
         parent._check_and_cycle() 
 
-        # 2. Update Grandparent (The person on the Payline)
+@traced()
+def _update_grandparent(member, board_level, parent, grandparent, board_before):
+    config = BOARD_CONFIGS.get(board_level)
+    reward_amount = config['base']
+    count_attr = count_field(board_level)
+
+    # 2. Update Grandparent (The person on the Payline)
+    if parent.current_board != board_before:
+        # The parent upgraded and was placed again, which can reshape this board too
         grandparent = get_parent_of_member(parent, board_level)
-        if grandparent:
-            MemberProfile.objects.filter(pk=grandparent.pk).update(**{count_attr: F(count_attr) + 1})
-            grandparent.refresh_from_db()
-            
-            total_fill = getattr(grandparent, count_attr)
-            
-            # 3. Payline Bonus (Slots 3, 4, 5, 6)
-            # We pay the grandparent because 'member' is their Level 2 (payline)
-            if 3 <= total_fill <= 6:
-                MemberProfile.objects.filter(pk=grandparent.pk).update(
-                    wallet=F('wallet') + reward_amount,
-                    balance=F('balance') + reward_amount
-                )
-                Transaction.objects.create(
-                    profile=grandparent,
-                    tx_type='CYCLE',
-                    amount=reward_amount,
-                    detail=f"Board {board_level} payline bonus from {member.user.username}"
-                )
-
-            # 4. Trigger the Board Cycle/Upgrade
-            # This calls handle_cycle which deducts the upgrade fee and moves them
-            if total_fill >= 6:
-                handle_cycle(grandparent, board_level)
-            else:
-                # Still run this to update the visual board counts in the model
-                grandparent._check_and_cycle()
+    if grandparent:
+        MemberProfile.objects.filter(pk=grandparent.pk).update(**{count_attr: F(count_attr) + 1})
+        grandparent.refresh_from_db()
+        
+        total_fill = getattr(grandparent, count_attr)
+        
+        # 3. Payline Bonus (Slots 3, 4, 5, 6)
+        # We pay the grandparent because 'member' is their Level 2 (payline)
+        if 3 <= total_fill <= 6:
+            cascade.credit(grandparent, wallet=reward_amount, balance=reward_amount, **{earned_field(board_level): reward_amount})
+            cascade.record_transaction(
+                grandparent,
+                tx_type='CYCLE',
+                amount=reward_amount,
+                detail=f"Board {board_level} payline bonus from {member.user.username}"
+            )
+
+        # 4. Trigger the Board Cycle/Upgrade
+        # This calls handle_cycle which deducts the upgrade fee and moves them
+        if total_fill >= 6:
+            handle_cycle(grandparent, board_level)
+        else:
+            # Still run this to update the visual board counts in the model
+            grandparent._check_and_cycle()
+
+@traced()
+def get_board_trees(profile, boards=(1, 2, 3, 4, 5)):
+    """
+    The 2x2 structure of several boards at once, with usernames: the member and
+    its shoulders come in one query, every payline member in a second one.
+    Returns {board_level: tree} with the same shape as get_board_tree.
+    """
+    boards = list(boards)
+    shoulder_fields = [f'{side}_child_b{b}' for b in boards for side in ('left', 'right')]
+    root = MemberProfile.objects.select_related(
+        'user', *[f'{field}__user' for field in shoulder_fields]
+    ).get(pk=profile.pk)
+
+    def below(shoulder, side, board_level):
+        return getattr(shoulder, f'{side}_child_b{board_level}_id') if shoulder else None
+
+    payline_ids = [
+        below(getattr(root, f'{shoulder}_child_b{b}'), side, b)
+        for b in boards for shoulder in ('left', 'right') for side in ('left', 'right')
+    ]
+    payline_ids = [pk for pk in payline_ids if pk]
+    payline = MemberProfile.objects.select_related('user').in_bulk(payline_ids) if payline_ids else {}
+
+    trees = {}
+    for b in boards:
+        left = getattr(root, f'left_child_b{b}')
+        right = getattr(root, f'right_child_b{b}')
+        trees[b] = {
+            "level": b,
+            "root": root,
+            "shoulders": {
+                "left": left,
+                "right": right,
+            },
+            "payline": {
+                "ll": payline.get(below(left, 'left', b)),
+                "lr": payline.get(below(left, 'right', b)),
+                "rl": payline.get(below(right, 'left', b)),
+                "rr": payline.get(below(right, 'right', b)),
+            }
+        }
+    return trees
 
 def get_board_tree(profile, board_level):
     """
     Returns the visual structure of a 2x2 matrix for a user.
     """
-    left_attr = f'left_child_b{board_level}'
-    right_attr = f'right_child_b{board_level}'
-
-    left_child = getattr(profile, left_attr)
-    right_child = getattr(profile, right_attr)
-
-    return {
-        "level": board_level,
-        "root": profile,
-        "shoulders": {
-            "left": left_child,
-            "right": right_child,
-        },
-        "payline": {
-            "ll": getattr(left_child, left_attr) if left_child else None,
-            "lr": getattr(left_child, right_attr) if left_child else None,
-            "rl": getattr(right_child, left_attr) if right_child else None,
-            "rr": getattr(right_child, right_attr) if right_child else None,
-        }
-    }
+    return get_board_trees(profile, [board_level])[board_level]
 
+@traced()
 def sync_board_count(profile, board_level):
     """
-    Recalculates the count based on actual children in the database.
+    Recalculates the count from the child FK columns, the same fill that
+    _check_and_cycle, get_board_trees and recount_boards go by.
     """
-    tree = get_board_tree(profile, board_level)
-    actual_count = 0
-    if tree['shoulders']['left']: actual_count += 1
-    if tree['shoulders']['right']: actual_count += 1
-    actual_count += sum(1 for node in tree['payline'].values() if node)
-    
-    count_attr = f'board_{board_level}_count' if board_level > 1 else 'board_1_count_value'
-    setattr(profile, count_attr, actual_count)
-    profile.save()
\ No newline at end of file
+    recount_boards(MemberProfile.objects.filter(pk=profile.pk), boards=[board_level])
+    profile.refresh_from_db()
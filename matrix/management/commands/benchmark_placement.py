@@ -0,0 +1,40 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from matrix.benchmark import SHAPES, run_benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates synthetic sponsor networks, replays their activations through the placement "
+        "engine and reports throughput, queries and latency per tier as JSON. Everything is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='100,1000', help="Comma separated network sizes (default 100,1000).")
+        parser.add_argument('--shapes', default=','.join(SHAPES), help=f"Comma separated shapes out of {', '.join(SHAPES)}.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help="Write the JSON report to this file instead of stdout.")
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',') if size]
+        except ValueError:
+            raise CommandError("--sizes takes whole numbers, e.g. 100,1000")
+        shapes = [shape for shape in options['shapes'].split(',') if shape]
+        unknown = set(shapes) - set(SHAPES)
+        if unknown:
+            raise CommandError(f"Unknown shapes: {', '.join(sorted(unknown))}")
+
+        def progress(tier):
+            self.stderr.write(
+                f"{tier['shape']:>9} x {tier['size']:<7} {tier['placements_per_sec']} placements/s, "
+                f"{tier['queries_per_placement']} queries/placement, p99 {tier['latency_ms']['p99']} ms"
+            )
+
+        report = json.dumps(run_benchmark(sizes, shapes, options['seed'], progress), indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as out:
+                out.write(report + '\n')
+            self.stderr.write(self.style.SUCCESS(f"Report written to {options['output']}"))
+        else:
+            self.stdout.write(report)
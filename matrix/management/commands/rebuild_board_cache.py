@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from matrix.board_cache import rebuild_board_cache
+
+
+class Command(BaseCommand):
+    help = "Rewrites the board report cache (per-board count, slots, earnings, cycles) from the MemberProfile columns and BoardCycle rows."
+
+    def handle(self, *args, **options):
+        written = rebuild_board_cache()
+        self.stdout.write(self.style.SUCCESS(f"Board report cache rebuilt: {written} rows."))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from matrix.models import MemberProfile, BoardFrontier
+from matrix.frontier import rebuild_frontier
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the open-slot frontier of every sponsor tree from the left/right child columns."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--board', type=int, choices=[1, 2, 3, 4, 5], help="Only rebuild this board.")
+        parser.add_argument('--root', help="Only rebuild the tree of this ref_id.")
+
+    def handle(self, *args, **options):
+        boards = [options['board']] if options['board'] else range(1, 6)
+
+        if options['root']:
+            roots = MemberProfile.objects.filter(ref_id=options['root'])
+        else:
+            # Placement always starts from a sponsor (or the superuser fallback),
+            # other members get their frontier built the first time it is needed.
+            roots = MemberProfile.objects.filter(Q(referrals__isnull=False) | Q(user__is_superuser=True)).distinct()
+
+        for board_level in boards:
+            if not options['root']:
+                BoardFrontier.objects.filter(board=board_level).delete()
+            built = 0
+            for root in roots.iterator():
+                rebuild_frontier(root, board_level)
+                built += 1
+            self.stdout.write(f"Board {board_level}: rebuilt {built} sponsor trees.")
+
+        self.stdout.write(self.style.SUCCESS("Frontier rebuilt."))
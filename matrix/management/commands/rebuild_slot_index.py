@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from matrix.board_index import rebuild_slot_index
+
+
+class Command(BaseCommand):
+    help = "Re-numbers the board nodes (tree_root/slot_index) from their parent_profile/position links."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--board', type=int, choices=[1, 2, 3, 4, 5], help="Only renumber this board.")
+
+    def handle(self, *args, **options):
+        boards = [options['board']] if options['board'] else range(1, 6)
+
+        for board_level in boards:
+            numbered = rebuild_slot_index(board_level)
+            self.stdout.write(f"Board {board_level}: numbered {numbered} nodes.")
+
+        self.stdout.write(self.style.SUCCESS("Slot index rebuilt."))
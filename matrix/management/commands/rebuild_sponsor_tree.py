@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from matrix.sponsor_tree import rebuild_sponsor_links
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the sponsor closure table (SponsorLink) from the sponser column."
+
+    def handle(self, *args, **options):
+        written = rebuild_sponsor_links()
+        self.stdout.write(self.style.SUCCESS(f"Sponsor tree rebuilt: {written} links."))
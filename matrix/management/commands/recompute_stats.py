@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from matrix.stats import platform_stats, recompute_stats
+
+
+class Command(BaseCommand):
+    help = "Recounts the admin summary counters from the tables (the matrix worker also does this periodically)."
+
+    def handle(self, *args, **options):
+        before = platform_stats(use_cache=False)
+        exact = recompute_stats()
+        boards = {b: exact[f'board_{b}'] for b in range(1, 6)}
+        self.stdout.write(f"Active members per board: {boards} (counters said {before['boards']})")
+        self.stdout.write(
+            f"Pending withdrawals: {exact['pending_count']} / {exact['pending_sum']} "
+            f"(counters said {before['pending_withdrawals']} / {before['pending_withdrawals_total']})"
+        )
+        self.stdout.write(self.style.SUCCESS("Admin summary counters recomputed."))
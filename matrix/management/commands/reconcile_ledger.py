@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from matrix.ledger import reconcile_ledger, drift_summary
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares stored balances with the Transaction ledger and records the drift "
+        "(new ledger rows and the members they belong to only, unless --full)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help="Re-sum the whole ledger and check every member, instead of the rows since the last run.")
+
+    def handle(self, *args, **options):
+        run = reconcile_ledger(full=options['full'])
+        mode = "full" if run.full else "incremental"
+        self.stdout.write(
+            f"Run #{run.pk} ({mode}): {run.transactions_read} ledger rows folded up to {run.high_water:%Y-%m-%d %H:%M:%S}, "
+            f"{run.members_checked} members checked."
+        )
+        for kind, (members, balance, nfg) in drift_summary(run).items():
+            self.stdout.write(f"  {kind}: {members} members, balance {balance}, nfg {nfg}")
+        if run.drifted:
+            self.stdout.write(self.style.WARNING(f"{run.drifted} members drifted; see Balance drifts in the admin."))
+        else:
+            self.stdout.write(self.style.SUCCESS("Balances match the ledger."))
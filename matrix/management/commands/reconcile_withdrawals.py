@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from matrix.withdrawals import reconcile_pending_withdrawals
+
+
+class Command(BaseCommand):
+    help = "Checks every member's pending_withdrawals against the withdrawal requests (--fix corrects them)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help="Write the recomputed totals back.")
+
+    def handle(self, *args, **options):
+        rows = reconcile_pending_withdrawals(fix=options['fix'])
+        for pk, stored, recounted in rows:
+            self.stdout.write(f"profile {pk}: stored {stored}, requests say {recounted}")
+        if not rows:
+            self.stdout.write(self.style.SUCCESS("Pending withdrawal totals match the requests."))
+        elif options['fix']:
+            self.stdout.write(self.style.SUCCESS(f"Fixed {len(rows)} members."))
+        else:
+            self.stdout.write(self.style.WARNING(f"{len(rows)} members are off; run with --fix to correct them."))
@@ -0,0 +1,28 @@
+import time
+from django.core.management.base import BaseCommand
+from matrix.recount import recount_boards
+
+
+class Command(BaseCommand):
+    help = "Recounts level 1 + level 2 fill of every member on all boards from the child links and fixes stored counts."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Only report the counts that are off.")
+        parser.add_argument('--board', type=int, choices=range(1, 6), help="Only this board.")
+        parser.add_argument('--show', type=int, default=10, help="How many wrong counts to list per board.")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        boards = [options['board']] if options['board'] else range(1, 6)
+        report = recount_boards(boards=boards, dry_run=options['dry_run'])
+
+        for board_level, wrong in report.items():
+            self.stdout.write(f"Board {board_level}: {len(wrong)} wrong")
+            for pk, stored, actual in wrong[:options['show']]:
+                self.stdout.write(f"  profile {pk}: stored {stored}, actual {actual}")
+
+        total = sum(len(wrong) for wrong in report.values())
+        verb = "would fix" if options['dry_run'] else "fixed"
+        self.stdout.write(self.style.SUCCESS(
+            f"Recount done in {time.monotonic() - started:.2f}s, {verb} {total} counts."
+        ))
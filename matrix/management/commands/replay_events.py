@@ -0,0 +1,52 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from matrix.events import baseline_events, compare, record_reset, replay, write_state
+
+
+class Command(BaseCommand):
+    help = (
+        "Replays the matrix event log in order. By default the result is checked "
+        "against the live MemberProfile and MatrixNode tables; --into writes it to "
+        "another, freshly migrated database instead."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help="Database to read the event log from.")
+        parser.add_argument('--into', help="Empty database alias to rebuild members, nodes and the log in.")
+        parser.add_argument('--limit', type=int, default=50, help="Differences to show at most.")
+        parser.add_argument(
+            '--baseline', action='store_true',
+            help="Start the log over from the live tables (e.g. after switching MATRIX_EVENT_LOG on) instead of replaying."
+        )
+
+    def handle(self, *args, **options):
+        if options['baseline']:
+            with transaction.atomic(using=options['database']):
+                record_reset(options['database'])
+                baseline_events(options['database'])
+            self.stdout.write(self.style.SUCCESS("The event log starts from the live tables."))
+            return
+
+        started = time.perf_counter()
+        state, events = replay(using=options['database'])
+        seconds = time.perf_counter() - started
+        self.stdout.write(
+            f"Replayed {events} events in {seconds:.2f}s: "
+            f"{len(state['member'])} members, {len(state['node'])} nodes."
+        )
+
+        if options['into']:
+            try:
+                write_state(state, options['database'], options['into'])
+            except ValueError as error:
+                raise CommandError(str(error))
+            self.stdout.write(self.style.SUCCESS(f"Written to '{options['into']}'."))
+            return
+
+        diffs = compare(state, using=options['database'], limit=options['limit'])
+        for target, pk, field, replayed, live in diffs:
+            self.stdout.write(f"  {target} {pk} {field or ''}: replayed {replayed!r}, live {live!r}")
+        if diffs:
+            raise CommandError("The replayed state differs from the live tables.")
+        self.stdout.write(self.style.SUCCESS("The replayed state matches the live tables."))
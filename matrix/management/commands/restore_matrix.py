@@ -0,0 +1,25 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from matrix.snapshot import restore_snapshot
+
+
+class Command(BaseCommand):
+    help = "Bulk-loads a snapshot_matrix file into a database that has no members yet."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Snapshot file.")
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        try:
+            counts = restore_snapshot(options['path'], using=options['database'])
+        except ValueError as error:
+            raise CommandError(str(error))
+        rows = ", ".join(f"{count} {table}" for table, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f"Restored in {time.monotonic() - started:.2f}s: {rows}."))
+        # Only the snapshot tables were written; the rest is derived from them
+        self.stdout.write(
+            "Rebuild the derived tables next: rebuild_board_cache, rebuild_frontier, "
+            "recompute_stats (and reconcile_ledger --full)."
+        )
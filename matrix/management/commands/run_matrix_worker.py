@@ -0,0 +1,37 @@
+import os
+import time
+from django.core.management.base import BaseCommand
+from matrix.jobs import BATCH_SIZE, claim_jobs, run_jobs
+from matrix.stats import recompute_seconds, recompute_stats
+
+
+class Command(BaseCommand):
+    help = "Drains the matrix job queue (placements, cycles). Several workers can run at once."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', type=int, default=BATCH_SIZE, help="Jobs claimed per round.")
+        parser.add_argument('--sleep', type=float, default=2.0, help="Seconds to wait when the queue is empty.")
+        parser.add_argument('--once', action='store_true', help="Stop as soon as the queue is empty.")
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Matrix worker {os.getpid()} started.")
+        stats_due = time.monotonic()
+        try:
+            while True:
+                # Correct any drift in the admin summary counters now and then
+                if recompute_seconds() and time.monotonic() >= stats_due:
+                    recompute_stats()
+                    stats_due = time.monotonic() + recompute_seconds()
+
+                jobs = claim_jobs(options['batch'])
+                if not jobs:
+                    if options['once']:
+                        break
+                    time.sleep(options['sleep'])
+                    continue
+
+                done, failed = run_jobs(jobs)
+                self.stdout.write(f"Ran {len(jobs)} jobs: {done} done, {failed} failed.")
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS("Matrix worker stopped."))
@@ -0,0 +1,45 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from matrix.benchmark import SHAPES
+from matrix.simulation import MatrixSimulation, simulate_joins, verify
+
+
+class Command(BaseCommand):
+    help = (
+        "Loads the matrix into memory and simulates new members joining and activating, reporting "
+        "the board population and payouts as JSON. The database is not changed. With --verify, "
+        "checks the simulation against the ORM on a generated network instead (rolled back)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--joins', type=int, default=100000, help="Members to simulate joining (default 100000).")
+        parser.add_argument('--shape', default='random', choices=SHAPES, help="How the new members are sponsored.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--verify', type=int, metavar='SIZE', help="Compare with the ORM on a network of SIZE members.")
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--output', help="Write the JSON report to this file instead of stdout.")
+
+    def handle(self, *args, **options):
+        if options['verify']:
+            result = verify(options['verify'], options['shape'], options['seed'])
+            if result['differences']:
+                for difference in result['differences']:
+                    self.stderr.write(repr(difference))
+                raise CommandError(f"The simulation differs from the ORM ({len(result['differences'])} differences shown)")
+            self.stderr.write(self.style.SUCCESS(
+                f"{result['placements']} placements match the ORM "
+                f"({result['orm_seconds']}s through the ORM, {result['simulation_seconds']}s simulated)"
+            ))
+            return
+
+        if options['joins'] < 0:
+            raise CommandError("--joins can't be negative")
+        sim = MatrixSimulation.load(options['database'])
+        self.stderr.write(f"Loaded {len(sim)} members")
+        report = json.dumps(simulate_joins(sim, options['joins'], options['shape'], options['seed']), indent=2, default=str)
+        if options['output']:
+            with open(options['output'], 'w') as out:
+                out.write(report + '\n')
+            self.stderr.write(self.style.SUCCESS(f"Report written to {options['output']}"))
+        else:
+            self.stdout.write(report)
@@ -0,0 +1,52 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from matrix.tracing import read_traces, span_totals
+
+
+class Command(BaseCommand):
+    help = "Lists the slowest sampled traces from the trace log, with their span trees and per-span totals."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', default=getattr(settings, 'MATRIX_TRACE_FILE', None),
+                            help="Trace log to read (default MATRIX_TRACE_FILE).")
+        parser.add_argument('--limit', type=int, default=5, help="How many traces to show.")
+        parser.add_argument('--root', help="Only traces whose top-level span has this name.")
+        parser.add_argument('--depth', type=int, default=4, help="Deepest span level to print per trace.")
+
+    def handle(self, *args, **options):
+        if not options['file']:
+            raise CommandError("No trace file; pass --file or set MATRIX_TRACE_FILE.")
+        try:
+            with open(options['file']) as log:
+                records = list(read_traces(log))
+        except FileNotFoundError:
+            raise CommandError(f"{options['file']} does not exist yet (no sampled traces?).")
+        if options['root']:
+            records = [r for r in records if r['root'] == options['root']]
+        if not records:
+            self.stdout.write("No traces.")
+            return
+
+        records.sort(key=lambda r: r['ms'], reverse=True)
+        for record in records[:options['limit']]:
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"{record['root']}  {record['ms']:.1f} ms, {record['queries']} queries "
+                f"({record['db_ms']:.1f} ms in the DB)  trace {record['trace']} at {record['at']}"
+            ))
+            for entry in record['spans']:
+                if entry['depth'] > options['depth'] or 'ms' not in entry:
+                    continue
+                error = f"  !{entry['error']}" if 'error' in entry else ''
+                self.stdout.write(
+                    f"  {'  ' * entry['depth']}{entry['name']}  {entry['ms']:.1f} ms, {entry['queries']} q{error}"
+                )
+            if record.get('dropped'):
+                self.stdout.write(f"  ... {record['dropped']} more spans not recorded")
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f"Span totals over {len(records)} traces (by self time)"))
+        totals = sorted(span_totals(records).items(), key=lambda item: item[1]['self_ms'], reverse=True)
+        for name, total in totals:
+            self.stdout.write(
+                f"  {name:<45} {total['calls']:>6} calls  {total['ms']:>10.1f} ms  "
+                f"{total['self_ms']:>10.1f} ms self  {total['queries']:>7} q"
+            )
@@ -0,0 +1,17 @@
+import time
+from django.core.management.base import BaseCommand
+from matrix.snapshot import write_snapshot
+
+
+class Command(BaseCommand):
+    help = "Dumps members, matrix nodes, sponsor links and their users to a compact column file (restore_matrix loads it)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to write.")
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        counts = write_snapshot(options['path'], using=options['database'])
+        rows = ", ".join(f"{count} {table}" for table, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f"Snapshot written in {time.monotonic() - started:.2f}s: {rows}."))
@@ -0,0 +1,128 @@
+import threading
+import time
+from collections import defaultdict, deque
+from django.conf import settings
+from django.utils import timezone
+
+UNRESOLVED = '<unresolved>'
+
+_lock = threading.Lock()
+# view name -> deque of the latest (total ms, db ms, queries), this process only
+_windows = {}
+# samples since the last flush to RequestMetric
+_pending = defaultdict(list)
+_last_flush = [time.monotonic(), timezone.now()]
+
+
+def sample_rate():
+    return getattr(settings, 'MATRIX_METRICS_SAMPLE_RATE', 0.1)
+
+
+def window_size():
+    return getattr(settings, 'MATRIX_METRICS_WINDOW', 500)
+
+
+def flush_seconds():
+    return getattr(settings, 'MATRIX_METRICS_FLUSH_SECONDS', 0)
+
+
+class QueryTimer:
+    """connection.execute_wrapper hook counting queries and the time spent in them."""
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.queries += 1
+
+
+def percentile(ordered, q):
+    """Nearest-rank percentile of an already sorted list (None when empty)."""
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def record(view_name, total_ms, db_ms, queries):
+    sample = (total_ms, db_ms, queries)
+    with _lock:
+        window = _windows.get(view_name)
+        if window is None:
+            window = _windows[view_name] = deque(maxlen=window_size())
+        window.append(sample)
+        if flush_seconds():
+            _pending[view_name].append(sample)
+
+
+def summarize(view_name, samples):
+    total = sorted(s[0] for s in samples)
+    db = sorted(s[1] for s in samples)
+    queries = [s[2] for s in samples]
+    return {
+        'view': view_name,
+        'requests': len(samples),
+        'p50_ms': round(percentile(total, 50), 2),
+        'p95_ms': round(percentile(total, 95), 2),
+        'p99_ms': round(percentile(total, 99), 2),
+        'max_ms': round(total[-1], 2),
+        'db_p95_ms': round(percentile(db, 95), 2),
+        'queries_mean': round(sum(queries) / len(queries), 1),
+        'queries_max': max(queries),
+    }
+
+
+def view_stats(order_by='p95_ms'):
+    """One summary per view over its rolling window, worst first."""
+    with _lock:
+        windows = {view: list(window) for view, window in _windows.items()}
+    stats = [summarize(view, samples) for view, samples in windows.items() if samples]
+    return sorted(stats, key=lambda row: row[order_by], reverse=True)
+
+
+def top_offenders(limit=10):
+    """Views by p95 time and by query count (the N+1 suspects)."""
+    stats = view_stats()
+    return {
+        'slowest': stats[:limit],
+        'most_queries': sorted(stats, key=lambda row: row['queries_max'], reverse=True)[:limit],
+    }
+
+
+def reset():
+    with _lock:
+        _windows.clear()
+        _pending.clear()
+
+
+def flush_due():
+    seconds = flush_seconds()
+    return bool(seconds) and time.monotonic() - _last_flush[0] >= seconds
+
+
+def flush():
+    """Writes one RequestMetric row per view for the samples since the last flush."""
+    from .models import RequestMetric
+
+    with _lock:
+        pending = dict(_pending)
+        _pending.clear()
+        period_start = _last_flush[1]
+        _last_flush[:] = [time.monotonic(), timezone.now()]
+    period_end = _last_flush[1]
+    rows = []
+    for view, samples in pending.items():
+        summary = summarize(view, samples)
+        rows.append(RequestMetric(
+            period_start=period_start, period_end=period_end, view_name=view[:200],
+            requests=summary['requests'], p50_ms=summary['p50_ms'], p95_ms=summary['p95_ms'],
+            p99_ms=summary['p99_ms'], max_ms=summary['max_ms'], db_p95_ms=summary['db_p95_ms'],
+            queries_mean=summary['queries_mean'], queries_max=summary['queries_max'],
+        ))
+    RequestMetric.objects.bulk_create(rows)
+    return len(rows)
@@ -0,0 +1,40 @@
+import logging
+import random
+import time
+from django.db import connection
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class RequestMetricsMiddleware:
+    """
+    Times a sample of requests (MATRIX_METRICS_SAMPLE_RATE): total time, query
+    count and time spent in the database, recorded per URL name in the
+    in-process histogram (matrix.metrics). Unsampled requests cost one
+    random() call.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= metrics.sample_rate():
+            return self.get_response(request)
+
+        timer = metrics.QueryTimer()
+        started = time.perf_counter()
+        with connection.execute_wrapper(timer):
+            response = self.get_response(request)
+        total_ms = (time.perf_counter() - started) * 1000
+
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match else metrics.UNRESOLVED
+        metrics.record(view_name, total_ms, timer.seconds * 1000, timer.queries)
+        if metrics.flush_due():
+            try:
+                metrics.flush()
+            except Exception:
+                # Losing one period of metrics must never fail the request
+                logger.exception("Could not flush request metrics")
+        return response
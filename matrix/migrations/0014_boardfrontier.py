@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-17 19:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matrix', '0013_alter_matrixnode_unique_together_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BoardFrontier',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('board', models.IntegerField()),
+                ('position', models.IntegerField(choices=[(1, 'Left'), (2, 'Right')])),
+                ('slot_index', models.BigIntegerField()),
+                ('parent', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='open_slots', to='matrix.memberprofile')),
+                ('root', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='frontier_slots', to='matrix.memberprofile')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['board', 'parent', 'position'], name='matrix_boar_board_82d807_idx')],
+                'unique_together': {('root', 'board', 'slot_index')},
+            },
+        ),
+    ]
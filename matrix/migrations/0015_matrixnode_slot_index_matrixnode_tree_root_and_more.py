@@ -0,0 +1,77 @@
+# Generated by Django 5.2.6 on 2026-10-17 19:46
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Frozen copies of matrix.board_index.FRAME_LIMIT / BATCH_SIZE as of this migration
+FRAME_LIMIT = 2 ** 61
+BATCH_SIZE = 500
+
+
+def number_existing_nodes(apps, schema_editor):
+    MatrixNode = apps.get_model('matrix', 'MatrixNode')
+    for board_level in range(1, 6):
+        nodes = list(MatrixNode.objects.filter(board=board_level).order_by('pk').values_list(
+            'pk', 'user__memberprofile__id', 'parent_profile_id', 'position'
+        ))
+        node_of = {}
+        children = {}
+        for pk, profile_id, parent_id, position in nodes:
+            if profile_id is None or profile_id in node_of:
+                continue
+            node_of[profile_id] = pk
+            children.setdefault(parent_id, []).append((position, pk, profile_id))
+
+        numbered = {}
+        queue = []
+        for parent_id, kids in children.items():
+            for position, pk, profile_id in kids:
+                if parent_id is None or parent_id == profile_id:
+                    numbered[pk] = (profile_id, 1)
+                    queue.append((profile_id, profile_id, 1))
+            if parent_id is not None and parent_id not in node_of:
+                queue.append((parent_id, parent_id, 1))
+
+        while queue:
+            profile_id, root_id, index = queue.pop()
+            if index >= FRAME_LIMIT:
+                root_id, index = profile_id, 1
+            for position, pk, child_id in children.get(profile_id, []):
+                if pk in numbered or child_id == profile_id:
+                    continue
+                numbered[pk] = (root_id, 2 * index + position - 1)
+                queue.append((child_id, root_id, 2 * index + position - 1))
+
+        MatrixNode.objects.bulk_update(
+            [MatrixNode(pk=pk, tree_root_id=root_id, slot_index=slot_index) for pk, (root_id, slot_index) in numbered.items()],
+            ['tree_root', 'slot_index'],
+            batch_size=BATCH_SIZE
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matrix', '0014_boardfrontier'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='matrixnode',
+            name='slot_index',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='matrixnode',
+            name='tree_root',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='board_tree_nodes', to='matrix.memberprofile'),
+        ),
+        migrations.AddIndex(
+            model_name='matrixnode',
+            index=models.Index(fields=['board', 'tree_root', 'slot_index'], name='matrix_matr_board_277f2c_idx'),
+        ),
+        migrations.RunPython(number_existing_nodes, migrations.RunPython.noop),
+    ]
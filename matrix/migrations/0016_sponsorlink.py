@@ -0,0 +1,64 @@
+# Generated by Django 5.2.6 on 2026-10-17 19:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+BATCH_SIZE = 500
+
+
+def build_sponsor_links(apps, schema_editor):
+    SponsorLink = apps.get_model('matrix', 'SponsorLink')
+    MemberProfile = apps.get_model('matrix', 'MemberProfile')
+    sponser_of = dict(MemberProfile.objects.values_list('pk', 'sponser_id'))
+    referrals = {}
+    for member_id, sponser_id in sponser_of.items():
+        if sponser_id in sponser_of:
+            referrals.setdefault(sponser_id, []).append(member_id)
+
+    links = []
+    done = set()
+    # Start from the tops; members caught in a sponsor loop are left on their own
+    stack = [(member_id, []) for member_id, sponser_id in sponser_of.items() if sponser_id not in sponser_of]
+    while stack:
+        member_id, upline = stack.pop()
+        done.add(member_id)
+        links.append(SponsorLink(ancestor_id=member_id, descendant_id=member_id, depth=0))
+        for depth, ancestor_id in enumerate(reversed(upline), start=1):
+            links.append(SponsorLink(ancestor_id=ancestor_id, descendant_id=member_id, depth=depth))
+        for child_id in referrals.get(member_id, []):
+            stack.append((child_id, upline + [member_id]))
+
+        if len(links) >= BATCH_SIZE * 10:
+            SponsorLink.objects.bulk_create(links, batch_size=BATCH_SIZE)
+            links = []
+
+    links.extend(
+        SponsorLink(ancestor_id=member_id, descendant_id=member_id, depth=0)
+        for member_id in sponser_of if member_id not in done
+    )
+    SponsorLink.objects.bulk_create(links, batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matrix', '0015_matrixnode_slot_index_matrixnode_tree_root_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SponsorLink',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveIntegerField()),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_links', to='matrix.memberprofile')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_links', to='matrix.memberprofile')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['ancestor', 'depth'], name='matrix_spon_ancesto_8551f5_idx'), models.Index(fields=['descendant', 'depth'], name='matrix_spon_descend_148d92_idx')],
+                'unique_together': {('ancestor', 'descendant')},
+            },
+        ),
+        migrations.RunPython(build_sponsor_links, migrations.RunPython.noop),
+    ]
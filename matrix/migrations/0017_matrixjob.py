@@ -0,0 +1,37 @@
+# Generated by Django 5.2.6 on 2026-10-17 20:02
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matrix', '0016_sponsorlink'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MatrixJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('activate', 'Activate & Place'), ('place_in_matrix', 'Place Under Sponsor'), ('spillover', 'Spillover Placement')], max_length=20)),
+                ('board', models.IntegerField(default=1)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('attempts', models.IntegerField(default=0)),
+                ('max_attempts', models.IntegerField(default=5)),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now)),
+                ('claim_token', models.CharField(blank=True, default='', max_length=64)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='matrix_jobs', to='matrix.memberprofile')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'run_after'], name='matrix_matr_status_989606_idx')],
+            },
+        ),
+    ]
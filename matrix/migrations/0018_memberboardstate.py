@@ -0,0 +1,71 @@
+# Generated by Django 5.2.6 on 2026-10-17 20:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+BATCH_SIZE = 500
+
+
+def backfill_board_states(apps, schema_editor):
+    # A plain insert: the (profile, board) unique index isn't there yet while
+    # this runs, so an upsert against it can't be used
+    MemberBoardState = apps.get_model('matrix', 'MemberBoardState')
+    MemberProfile = apps.get_model('matrix', 'MemberProfile')
+    Transaction = apps.get_model('matrix', 'Transaction')
+
+    # Cycles before this table existed are only on record in the UPGRADE rows
+    # ("Board N Complete..."); from here on handle_cycle counts them.
+    cycles = {}
+    for b in range(1, 6):
+        cycled = Transaction.objects.filter(
+            tx_type='UPGRADE', detail__startswith=f"Board {b} Complete"
+        ).values('profile_id').annotate(cycles=models.Count('pk')).values_list('profile_id', 'cycles')
+        for profile_id, count in cycled:
+            cycles[profile_id, b] = count
+
+    columns = ['pk']
+    for b in range(1, 6):
+        count = 'board_1_count_value' if b == 1 else f'board_{b}_count'
+        columns += [count, f'left_child_b{b}_id', f'right_child_b{b}_id', f'board_{b}_earned']
+    states = []
+    for row in MemberProfile.objects.order_by('pk').values_list(*columns).iterator(chunk_size=BATCH_SIZE):
+        for i, b in enumerate(range(1, 6)):
+            count, left_id, right_id, earned = row[1 + 4 * i:5 + 4 * i]
+            states.append(MemberBoardState(
+                profile_id=row[0], board=b, count=max(count or 0, 0), left_child_id=left_id,
+                right_child_id=right_id, earned=earned, cycles=cycles.get((row[0], b), 0)
+            ))
+        if len(states) >= BATCH_SIZE:
+            MemberBoardState.objects.bulk_create(states, batch_size=BATCH_SIZE)
+            states = []
+    MemberBoardState.objects.bulk_create(states, batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matrix', '0017_matrixjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MemberBoardState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('board', models.PositiveSmallIntegerField()),
+                ('count', models.PositiveSmallIntegerField(default=0)),
+                ('earned', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('cycles', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('left_child', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='matrix.memberprofile')),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='board_states', to='matrix.memberprofile')),
+                ('right_child', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='matrix.memberprofile')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['board', 'count'], name='matrix_memb_board_f8921f_idx'), models.Index(condition=models.Q(('left_child__isnull', True), ('right_child__isnull', True), _connector='OR'), fields=['board', 'profile'], name='board_state_open_slots')],
+                'unique_together': {('profile', 'board')},
+            },
+        ),
+        migrations.RunPython(backfill_board_states, migrations.RunPython.noop),
+    ]
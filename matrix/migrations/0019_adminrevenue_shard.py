@@ -0,0 +1,31 @@
+# Generated by Django 5.2.6 on 2026-10-17 20:18
+
+from django.db import migrations, models
+
+
+def number_shards(apps, schema_editor):
+    # Existing rows (normally just pk=1) become shards 0, 1, ...
+    AdminRevenue = apps.get_model('matrix', 'AdminRevenue')
+    for shard, pk in enumerate(AdminRevenue.objects.order_by('pk').values_list('pk', flat=True)):
+        AdminRevenue.objects.filter(pk=pk).update(shard=shard)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matrix', '0018_memberboardstate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='adminrevenue',
+            name='shard',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.RunPython(number_shards, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='adminrevenue',
+            name='shard',
+            field=models.PositiveSmallIntegerField(default=0, unique=True),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.6 on 2026-10-17 20:20
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_pending_withdrawals(apps, schema_editor):
+    MemberProfile = apps.get_model('matrix', 'MemberProfile')
+    WithdrawalRequest = apps.get_model('matrix', 'WithdrawalRequest')
+    money = models.DecimalField(max_digits=12, decimal_places=2)
+    pending = WithdrawalRequest.objects.filter(
+        user_id=OuterRef('user_id'), status__iexact='pending'
+    ).order_by().values('user_id').annotate(total=Sum('amount')).values('total')
+    MemberProfile.objects.update(
+        pending_withdrawals=Coalesce(Subquery(pending, output_field=money), Value(Decimal('0.00')), output_field=money)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matrix', '0019_adminrevenue_shard'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='memberprofile',
+            name='pending_withdrawals',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.RunPython(backfill_pending_withdrawals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-17 20:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matrix', '0020_memberprofile_pending_withdrawals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='withdrawalrequest',
+            name='payout_batch',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=32),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.6 on 2026-10-17 20:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matrix', '0021_withdrawalrequest_payout_batch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LedgerTotal',
+            fields=[
+                ('profile', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='ledger_total', serialize=False, to='matrix.memberprofile')),
+                ('cash', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('nfg', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('transactions', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ReconciliationRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('full', models.BooleanField(default=False)),
+                ('high_water', models.DateTimeField(blank=True, null=True)),
+                ('transactions_read', models.IntegerField(default=0)),
+                ('members_checked', models.IntegerField(default=0)),
+                ('drifted', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='timestamp',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.CreateModel(
+            name='BalanceDrift',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('untracked_credit', 'Balance & wallet above ledger'), ('untracked_debit', 'Balance & wallet below ledger'), ('balance_only', 'Balance only'), ('wallet_only', 'Wallet only'), ('split', 'Balance & wallet off by different amounts'), ('nfg', 'NFG balance only')], max_length=20)),
+                ('balance_drift', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('wallet_drift', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('nfg_drift', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_drifts', to='matrix.memberprofile')),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='drifts', to='matrix.reconciliationrun')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['run', 'kind'], name='matrix_bala_run_id_a36ca6_idx')],
+            },
+        ),
+    ]
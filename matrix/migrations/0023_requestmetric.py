@@ -0,0 +1,33 @@
+# Generated by Django 5.2.6 on 2026-10-17 20:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matrix', '0022_ledger_reconciliation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestMetric',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period_start', models.DateTimeField()),
+                ('period_end', models.DateTimeField()),
+                ('view_name', models.CharField(max_length=200)),
+                ('requests', models.IntegerField(default=0)),
+                ('p50_ms', models.FloatField(default=0)),
+                ('p95_ms', models.FloatField(default=0)),
+                ('p99_ms', models.FloatField(default=0)),
+                ('max_ms', models.FloatField(default=0)),
+                ('db_p95_ms', models.FloatField(default=0)),
+                ('queries_mean', models.FloatField(default=0)),
+                ('queries_max', models.IntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['view_name', 'period_start'], name='matrix_requ_view_na_36d23e_idx')],
+            },
+        ),
+    ]
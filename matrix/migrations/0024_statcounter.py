@@ -0,0 +1,43 @@
+# Generated by Django 5.2.6 on 2026-10-17 20:42
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def backfill_stats(apps, schema_editor):
+    # Shard 0 starts at the exact values; cycles:<day> counters start with the
+    # first cycle recorded after this
+    StatCounter = apps.get_model('matrix', 'StatCounter')
+    MemberProfile = apps.get_model('matrix', 'MemberProfile')
+    WithdrawalRequest = apps.get_model('matrix', 'WithdrawalRequest')
+    values = MemberProfile.objects.aggregate(**{
+        f'board_{b}': Count('pk', filter=Q(is_active=True, current_board=b)) for b in range(1, 6)
+    })
+    pending = WithdrawalRequest.objects.filter(status__iexact='pending').aggregate(
+        pending_count=Count('pk'), pending_sum=Sum('amount')
+    )
+    values.update(pending_count=pending['pending_count'], pending_sum=pending['pending_sum'] or 0)
+    StatCounter.objects.bulk_create([StatCounter(name=name, shard=0, value=value) for name, value in values.items()])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matrix', '0023_requestmetric'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=40)),
+                ('shard', models.IntegerField(default=0)),
+                ('value', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+            ],
+            options={
+                'unique_together': {('name', 'shard')},
+            },
+        ),
+        migrations.RunPython(backfill_stats, migrations.RunPython.noop),
+    ]
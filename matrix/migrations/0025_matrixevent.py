@@ -0,0 +1,52 @@
+# Generated by Django 5.2.6 on 2026-10-17 20:55
+
+import datetime
+import django.utils.timezone
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+
+def baseline(apps, schema_editor):
+    # One create event per existing member and node, so the log replays to the
+    # state it started from (skipped while the log is off)
+    if not getattr(settings, 'MATRIX_EVENT_LOG', False):
+        return
+    MatrixEvent = apps.get_model('matrix', 'MatrixEvent')
+    using = schema_editor.connection.alias
+    for model, target in ((apps.get_model('matrix', 'MemberProfile'), 'member'), (apps.get_model('matrix', 'MatrixNode'), 'node')):
+        fields = [f.attname for f in model._meta.concrete_fields if not f.primary_key]
+        rows = []
+        for row in model.objects.using(using).order_by('pk').values('pk', *fields).iterator(chunk_size=BATCH_SIZE):
+            pk = row.pop('pk')
+            # Datetimes keep their microseconds (DjangoJSONEncoder cuts them to milliseconds)
+            rows.append([[pk], {f: v.isoformat() if isinstance(v, datetime.datetime) else v for f, v in row.items()}, {}])
+            if len(rows) == BATCH_SIZE:
+                MatrixEvent.objects.using(using).create(kind='baseline', target=target, op='create', data={'rows': rows})
+                rows = []
+        if rows:
+            MatrixEvent.objects.using(using).create(kind='baseline', target=target, op='create', data={'rows': rows})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matrix', '0024_statcounter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MatrixEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('kind', models.CharField(max_length=20)),
+                ('target', models.CharField(max_length=10)),
+                ('op', models.CharField(max_length=10)),
+                ('data', models.JSONField(encoder=DjangoJSONEncoder)),
+            ],
+        ),
+        migrations.RunPython(baseline, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,104 @@
+# Generated by Django 5.2.6 on 2026-10-17 23:00
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+BATCH_SIZE = 500
+
+
+def backfill_cycles(apps, schema_editor):
+    # Every cycle so far is on record as its "Board N Complete..." UPGRADE row
+    BoardCycle = apps.get_model('matrix', 'BoardCycle')
+    Transaction = apps.get_model('matrix', 'Transaction')
+    for b in range(1, 6):
+        cycled = Transaction.objects.filter(
+            tx_type='UPGRADE', detail__startswith=f"Board {b} Complete"
+        ).order_by('pk').values_list('profile_id', 'timestamp')
+        cycles = []
+        for profile_id, timestamp in cycled.iterator(chunk_size=BATCH_SIZE):
+            cycles.append(BoardCycle(profile_id=profile_id, board=b, created_at=timestamp))
+            if len(cycles) >= BATCH_SIZE:
+                BoardCycle.objects.bulk_create(cycles, batch_size=BATCH_SIZE)
+                cycles = []
+        BoardCycle.objects.bulk_create(cycles, batch_size=BATCH_SIZE)
+
+
+def fill_report_cache(apps, schema_editor):
+    BoardReportCache = apps.get_model('matrix', 'BoardReportCache')
+    BoardCycle = apps.get_model('matrix', 'BoardCycle')
+    MemberProfile = apps.get_model('matrix', 'MemberProfile')
+    cycles = {
+        (profile_id, board): count for profile_id, board, count in
+        BoardCycle.objects.values('profile_id', 'board').annotate(count=models.Count('pk')).values_list('profile_id', 'board', 'count')
+    }
+    columns = ['pk']
+    for b in range(1, 6):
+        count = 'board_1_count_value' if b == 1 else f'board_{b}_count'
+        columns += [count, f'left_child_b{b}_id', f'right_child_b{b}_id', f'board_{b}_earned']
+    reports = []
+    for row in MemberProfile.objects.order_by('pk').values_list(*columns).iterator(chunk_size=BATCH_SIZE):
+        for i, b in enumerate(range(1, 6)):
+            count, left_id, right_id, earned = row[1 + 4 * i:5 + 4 * i]
+            reports.append(BoardReportCache(
+                profile_id=row[0], board=b, count=max(count or 0, 0), left_child_id=left_id,
+                right_child_id=right_id, earned=earned, cycles=cycles.get((row[0], b), 0)
+            ))
+        if len(reports) >= BATCH_SIZE:
+            BoardReportCache.objects.bulk_create(reports, batch_size=BATCH_SIZE)
+            reports = []
+    BoardReportCache.objects.bulk_create(reports, batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matrix', '0025_matrixevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BoardCycle',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('board', models.PositiveSmallIntegerField()),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='board_cycles', to='matrix.memberprofile')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='BoardReportCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('board', models.PositiveSmallIntegerField()),
+                ('count', models.PositiveSmallIntegerField(default=0)),
+                ('earned', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('cycles', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('left_child', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='matrix.memberprofile')),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='board_reports', to='matrix.memberprofile')),
+                ('right_child', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='matrix.memberprofile')),
+            ],
+        ),
+        migrations.DeleteModel(
+            name='MemberBoardState',
+        ),
+        migrations.AddIndex(
+            model_name='boardcycle',
+            index=models.Index(fields=['profile', 'board'], name='matrix_boar_profile_e2c21e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='boardreportcache',
+            index=models.Index(fields=['board', 'count'], name='matrix_boar_board_51d2da_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='boardreportcache',
+            index=models.Index(condition=models.Q(('left_child__isnull', True), ('right_child__isnull', True), _connector='OR'), fields=['board', 'profile'], name='board_report_open_slots'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='boardreportcache',
+            unique_together={('profile', 'board')},
+        ),
+        migrations.RunPython(backfill_cycles, migrations.RunPython.noop),
+        migrations.RunPython(fill_report_cache, migrations.RunPython.noop),
+    ]
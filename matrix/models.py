@@ -1,12 +1,17 @@
 from django.db import models
 from django.contrib.auth.models import User
 import uuid
+from django.utils import timezone
 from django.db import transaction
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from decimal import Decimal
+from .tracing import span, traced
+from .events import LoggedQuerySet, record_deleted, record_saved, enabled as event_log_enabled
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db.models import F, Q
-from django.db.models.signals import post_delete
+from django.db.models.signals import post_delete, pre_delete, post_init
 from django.dispatch import receiver
 from django.db.models.signals import post_save
 from django.dispatch import receiver
@@ -34,6 +39,8 @@ class MemberProfile(models.Model):
     board_4_count = models.IntegerField(default=0)
     board_5_count = models.IntegerField(default=0)
     cycle_count = models.IntegerField(default=0)
+    # Sum of this member's Pending withdrawal requests
+    pending_withdrawals = models.DecimalField(max_digits=12, decimal_places=2, default=0)
 
     # --- Binary Connections (Keeping all 5 boards as requested) ---
     left_child_b1 = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='parent_l_b1')
@@ -59,11 +66,15 @@ class MemberProfile(models.Model):
     board_4_earned = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     board_5_earned = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
 
+    # Every write is appended to the matrix event log (events.py)
+    objects = LoggedQuerySet.as_manager()
+
     # --- Your Logic Methods (KEEPING THESE) ---
     def lock_position(self):
         self.is_position_locked = True
         self.save()
 
+    @traced()
     def add_reward_if_eligible(self):
         """Your logic to pay for the 3rd, 4th, 5th, and 6th person."""
         cb = self.current_board
@@ -93,6 +104,7 @@ class MemberProfile(models.Model):
                 )
                 self.add_transaction('CYCLE', total_reward, f"Level 2 Reward - Board {cb}")
 
+    @traced()
     def _check_and_cycle(self):
         BOARD_CONFIG = {
             1: {'fee': Decimal('50.00'), 'field': 'board_1_count_value'},
@@ -124,7 +136,10 @@ class MemberProfile(models.Model):
         # 2. UPDATE the count in the database
         conf = BOARD_CONFIG[cb]
         MemberProfile.objects.filter(pk=self.pk).update(**{conf['field']: total_fill})
-        self.refresh_from_db()
+        with span('refresh_from_db'):
+            self.refresh_from_db()
+        from . import cascade
+        cascade.touch(self)
 
 
         # 4. AUTO-UPGRADE (Uses the total_fill we just calculated)
@@ -136,15 +151,21 @@ class MemberProfile(models.Model):
             self.paid_referrals_count = 0 
             
             # Use F() to subtract so we don't accidentally ignore the rewards added just above
+            cascade.credit(self, wallet=-upgrade_fee, balance=-upgrade_fee)
             MemberProfile.objects.filter(pk=self.pk).update(
-                wallet=F('wallet') - upgrade_fee,
-                balance=F('balance') - upgrade_fee,
                 current_board=next_board,
                 paid_referrals_count=0
             )
-            self.refresh_from_db()
+            if self.is_active:
+                from .stats import members_moved
+                from .downline import forget_uplines
+                members_moved(left=cb, joined=next_board)
+                forget_uplines([self.pk])
+            with span('refresh_from_db'):
+                self.refresh_from_db()
+            cascade.count('upgrades')
             
-            AdminRevenue.update_revenue(upgrade_fee, next_board)
+            cascade.add_revenue(upgrade_fee, next_board)
             self.add_transaction('UPGRADE', -upgrade_fee, f"Upgraded to Board {next_board}")
                 
                 # Re-trigger placement for the new board level
@@ -164,9 +185,42 @@ class MemberProfile(models.Model):
         # Ensure status sync
         if self.is_active and self.payment_status == 'pending':
             self.payment_status = 'paid'
-        
-        super().save(*args, **kwargs)
+
+        # Taken before the post_save receivers, some of which refresh the instance
+        stats_before = None if self._state.adding else self._loaded_stats
+        stats_after = _stats_state(self)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and not {'is_active', 'current_board'} & set(update_fields):
+            stats_after = stats_before
+
+        # The row and its event log entry (log_member_saved) commit together
+        with transaction.atomic(using=kwargs.get('using'), savepoint=False):
+            super().save(*args, **kwargs)
+
+        # Admin summary counters for the save() paths (activation, admin edits,
+        # handle_cycle's move); the update() paths report to stats themselves
+        if stats_before != stats_after:
+            from .stats import members_moved
+            from .downline import forget_uplines
+            members_moved(left=stats_before, joined=stats_after)
+            forget_uplines([self.pk])
+        self._loaded_stats = stats_after
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        # The row is what counts now (see save)
+        if fields is None or {'is_active', 'current_board'} & set(fields):
+            self._loaded_stats = _stats_state(self)
+
+    def clean(self):
+        # A sponsor from inside this member's own team would loop the referral tree
+        if self.pk and self.sponser_id and (
+            self.sponser_id == self.pk or
+            SponsorLink.objects.filter(ancestor_id=self.pk, descendant_id=self.sponser_id).exists()
+        ):
+            raise ValidationError({'sponser': "This member is already in the selected member's upline."})
     
+    @traced()
     def place_in_matrix(self, board_num):
         """Finds the first available slot in the sponsor's 2x2 matrix for a specific board."""
         if not self.sponser:
@@ -176,12 +230,20 @@ class MemberProfile(models.Model):
         left_attr = f'left_child_b{board_num}'
         right_attr = f'right_child_b{board_num}'
 
+        from .frontier import record_fill
+        from .board_index import place_node
+        from . import cascade
+
         with transaction.atomic():
             # Level 1: Check sponsor's direct left/right
             if not getattr(target, left_attr):
                 MemberProfile.objects.filter(pk=target.pk).update(**{left_attr: self})
+                record_fill(target, 1, self, board_num)
+                place_node(self, target, 1, board_num)
             elif not getattr(target, right_attr):
                 MemberProfile.objects.filter(pk=target.pk).update(**{right_attr: self})
+                record_fill(target, 2, self, board_num)
+                place_node(self, target, 2, board_num)
             
             # Level 2: Spillover into sponsor's children's slots
             else:
@@ -192,9 +254,15 @@ class MemberProfile(models.Model):
                     if child and not placed:
                         if not getattr(child, left_attr):
                             MemberProfile.objects.filter(pk=child.pk).update(**{left_attr: self})
+                            cascade.touch(child)
+                            record_fill(child, 1, self, board_num)
+                            place_node(self, child, 1, board_num)
                             placed = True
                         elif not getattr(child, right_attr):
                             MemberProfile.objects.filter(pk=child.pk).update(**{right_attr: self})
+                            cascade.touch(child)
+                            record_fill(child, 2, self, board_num)
+                            place_node(self, child, 2, board_num)
                             placed = True
 
             # 2. Update Counts & Payouts for the Uplines
@@ -208,21 +276,29 @@ class MemberProfile(models.Model):
 
     @property
     def available_balance(self):
-        from django.db.models import Sum
-        # Aggregate returns a dict, e.g., {'amount__sum': 50.00}
-        pending = WithdrawalRequest.objects.filter(
-            user=self.user, 
-            status='Pending'
-        ).aggregate(Sum('amount'))['amount__sum'] or Decimal('0.00')
-    
-        return self.balance - pending
+        # pending_withdrawals is kept up to date by WithdrawalRequest.save/delete
+        # (see withdrawals.py for the bulk annotation and the reconciliation)
+        return self.balance - self.pending_withdrawals
                 
     def add_transaction(self, tx_type, amount, detail=""):
-        Transaction.objects.create(profile=self, tx_type=tx_type, amount=amount, detail=detail)  
+        # Written with the rest of the ledger at the end of a running cascade
+        from .cascade import record_transaction
+        record_transaction(self, tx_type, amount, detail)
     
     def __str__(self):
         return f"{self.full_name} ({self.ref_id})"
     
+@receiver(post_save, sender=MemberProfile)
+def log_member_saved(sender, instance, created, update_fields, using, **kwargs):
+    # Registered ahead of the other receivers so the save is logged before what they write
+    if event_log_enabled():
+        record_saved(instance, created, update_fields, using)
+
+@receiver(post_delete, sender=MemberProfile)
+def log_member_deleted(sender, instance, using, **kwargs):
+    if event_log_enabled():
+        record_deleted(instance, using)
+
 @receiver(post_save, sender=MemberProfile)
 def handle_new_paid_member(sender, instance, created, **kwargs):
     # Only run if they just became 'paid' and aren't in the matrix yet
@@ -230,7 +306,9 @@ def handle_new_paid_member(sender, instance, created, **kwargs):
        # Mark as placed so this signal doesn't run again on next save
         MemberProfile.objects.filter(pk=instance.pk).update(is_already_placed_in_b1=True)
         instance.refresh_from_db()
-        instance.place_in_matrix(board_num=1)
+        # The placement itself runs on the matrix worker
+        from .jobs import enqueue
+        enqueue('place_in_matrix', instance, board=1)
 
 class Transaction(models.Model):
     TX_TYPES = (('AIRDROP', 'Airdrop'), ('CYCLE', 'Cycle Payout'), ('UPGRADE', 'Upgrade'), ('DEBIT', 'Deduction'), ('WITHDRAWAL', 'Withdrawal'))
@@ -238,9 +316,12 @@ class Transaction(models.Model):
     tx_type = models.CharField(max_length=20, choices=TX_TYPES)
     amount = models.DecimalField(max_digits=12, decimal_places=2)
     detail = models.CharField(max_length=255)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(auto_now_add=True, db_index=True)
 
 class AdminRevenue(models.Model):
+    # Counters are spread over a few rows (shards) so concurrent fees don't all
+    # lock one row; the platform totals are the sum of all rows (revenue.py).
+    shard = models.PositiveSmallIntegerField(unique=True, default=0)
     total_fees_collected = models.DecimalField(max_digits=15, decimal_places=2, default=0.00)
     b1_fees = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     b2_fees = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
@@ -253,18 +334,11 @@ class AdminRevenue(models.Model):
     @classmethod
     def update_revenue(cls, amount, board_level):
         """Helper to update admin stats without manually fetching the record."""
-        # Usually, there's only one row for AdminRevenue (pk=1)
-        revenue, created = cls.objects.get_or_create(pk=1)
-        
-        fee_field = f'b{board_level}_fees'
-        # Use F() expressions to prevent conflicts
-        setattr(revenue, 'total_fees_collected', F('total_fees_collected') + amount)
-        setattr(revenue, fee_field, F(fee_field) + amount)
-        
-        revenue.save()
+        from .revenue import record_fee
+        record_fee(amount, board_level)
 
     def __str__(self):
-        return f"Total Revenue: ${self.total_fees_collected}"   
+        return f"Revenue shard {self.shard}: ${self.total_fees_collected}"
 
 class WithdrawalRequest(models.Model):
     STATUS_CHOICES = [
@@ -282,33 +356,56 @@ class WithdrawalRequest(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Pending')
     # FIX: Changed auto_auto_now_add to auto_now_add
     created_at = models.DateTimeField(auto_now_add=True)
+    # Set by approve_withdrawals(); the payout file of a batch is built from it
+    payout_batch = models.CharField(max_length=32, blank=True, default='', db_index=True)
     
     WITHDRAWAL_FEE_PERCENT = Decimal('10.0')  # example: 10%
 
+    @traced()
     def save(self, *args, **kwargs):
         if self.amount:
             self.fee = (self.amount * self.WITHDRAWAL_FEE_PERCENT) / 100
             self.net_amount = self.amount - self.fee
         
+        was_pending = Decimal('0.00')
+        was_counted = False
         if self.pk:
             try:  
-                old_status = WithdrawalRequest.objects.get(pk=self.pk).status
+                old = WithdrawalRequest.objects.get(pk=self.pk)
+                old_status = old.status
+                was_pending = old.pending_amount
+                was_counted = old.status.lower() == 'pending'
                 if old_status == 'Pending' and self.status == 'Paid':
                     profile = self.user.memberprofile
                     profile.balance -= self.amount
                     profile.wallet -= self.amount
-                    profile.save()
+                    # Only these two, so a stale profile can't undo other counters
+                    profile.save(update_fields=['balance', 'wallet'])
                     profile.add_transaction('WITHDRAWAL', -self.amount, f"Withdrawal Paid")
                     
-                    revenue, _ = AdminRevenue.objects.get_or_create(pk=1)
-                    revenue.total_withdrawals_processed = F('total_withdrawals_processed') + self.amount
-                    revenue.save()
+                    from .revenue import record_withdrawal
+                    record_withdrawal(self.amount)
             except WithdrawalRequest.DoesNotExist:
                 pass
 
         # IMPORTANT: Keep this here so it runs for BOTH new and old records
         super().save(*args, **kwargs)
 
+        # Created, approved, cancelled or re-amounted: move the member's pending total
+        delta = self.pending_amount - was_pending
+        if delta:
+            MemberProfile.objects.filter(user_id=self.user_id).update(
+                pending_withdrawals=F('pending_withdrawals') + delta
+            )
+        counted = self.status.lower() == 'pending'
+        if delta or counted != was_counted:
+            from .stats import pending_changed
+            pending_changed(int(counted) - int(was_counted), delta)
+
+    @property
+    def pending_amount(self):
+        return self.amount if self.status.lower() == 'pending' else Decimal('0.00')
+
     def __str__(self):
         return f"{self.user.username} - {self.amount}"
     
@@ -317,9 +414,90 @@ def create_user_profile(sender, instance, created, **kwargs):
    if created:
       MemberProfile.objects.get_or_create(user=instance)
 
+@receiver(post_init, sender=MemberProfile)
+def remember_loaded_sponser(sender, instance, **kwargs):
+    instance._loaded_sponser_id = instance.sponser_id
+
+def _stats_state(profile):
+    # The board an active member counts on in the admin stats, None if inactive
+    # (read from __dict__ so a deferred field is not fetched just for this)
+    if profile.__dict__.get('is_active'):
+        return profile.__dict__.get('current_board')
+    return None
+
+@receiver(post_init, sender=MemberProfile)
+def remember_loaded_stats(sender, instance, **kwargs):
+    instance._loaded_stats = _stats_state(instance)
+
+
+@receiver(post_delete, sender=MemberProfile)
+def uncount_member_stats(sender, instance, **kwargs):
+    if instance._loaded_stats is not None:
+        from .stats import members_moved
+        members_moved(left=instance._loaded_stats)
+
+@receiver(post_save, sender=MemberProfile)
+def sync_sponsor_tree(sender, instance, created, **kwargs):
+    # Only touch the closure table when the sponsor actually changed
+    if created or instance.sponser_id != instance._loaded_sponser_id:
+        from .sponsor_tree import link_to_sponser
+        from .downline import forget_uplines
+        link_to_sponser(instance)
+        # Old and new upline both see their downline change
+        forget_uplines([instance.pk])
+        forget_uplines([instance._loaded_sponser_id], include_self=True)
+        instance._loaded_sponser_id = instance.sponser_id
+
+@receiver(post_save, sender=MemberProfile)
+def forget_member_dashboard(sender, instance, **kwargs):
+    # Anything saved on the member can change its dashboard
+    from . import cascade
+    cascade.touch(instance)
+
+@receiver(post_delete, sender=WithdrawalRequest)
+def release_pending_withdrawal(sender, instance, **kwargs):
+    if instance.pending_amount:
+        MemberProfile.objects.filter(user_id=instance.user_id).update(
+            pending_withdrawals=F('pending_withdrawals') - instance.pending_amount
+        )
+        from .stats import pending_changed
+        pending_changed(-1, -instance.pending_amount)
+
+@receiver(post_save, sender=WithdrawalRequest)
+def drop_cached_dashboard(sender, instance, **kwargs):
+    from .dashboard import forget_dashboard
+    forget_dashboard(instance.user_id)
+
+@receiver(pre_delete, sender=MemberProfile)
+def remember_matrix_slots_on_delete(sender, instance, **kwargs):
+    """The SET_NULL on the child FKs runs before post_delete, so note which slots this member held first."""
+    # Same for the referrals: their sponser is nulled, so they leave the upline's teams
+    from .sponsor_tree import detach_team
+    from .downline import forget_uplines
+    forget_uplines([instance.pk])
+    detach_team(instance)
+
+    held = Q()
+    for i in range(1, 6):
+        held |= Q(**{f'left_child_b{i}': instance}) | Q(**{f'right_child_b{i}': instance})
+
+    from .board_index import renumber_orphans
+    renumber_orphans(instance)
+
+    instance._held_slots = []
+    for parent in MemberProfile.objects.filter(held):
+        for i in range(1, 6):
+            if getattr(parent, f'left_child_b{i}_id') == instance.pk:
+                instance._held_slots.append((parent.pk, 1, i))
+            if getattr(parent, f'right_child_b{i}_id') == instance.pk:
+                instance._held_slots.append((parent.pk, 2, i))
+
 @receiver(post_delete, sender=MemberProfile)
 def cleanup_matrix_on_delete(sender, instance, **kwargs):
     """Removes deleted member from all 5 board slots safely."""
+    from .frontier import record_release
+
+    held_slots = getattr(instance, '_held_slots', [])
     for i in range(1, 6):
         left_attr = f'left_child_b{i}'
         right_attr = f'right_child_b{i}'
@@ -330,12 +508,15 @@ def cleanup_matrix_on_delete(sender, instance, **kwargs):
         MemberProfile.objects.filter(**{right_attr: instance}).update(**{right_attr: None})
 
         # 2. Identify parents who need their counts recalculated
-        # We fetch them now to run the logic method
+        # (taken from pre_delete, the FKs are already NULL by now)
         affected_parents = MemberProfile.objects.filter(
-            Q(**{left_attr: instance}) | Q(**{right_attr: instance})
+            pk__in=[parent_pk for parent_pk, _, board in held_slots if board == i]
         )
 
         for parent in affected_parents:
+            for parent_pk, position, board in held_slots:
+                if parent_pk == parent.pk and board == i:
+                    record_release(parent, position, i)
             # We don't need parent.save() because update() handled the DB change
             parent.refresh_from_db()
             parent._check_and_cycle()
@@ -353,5 +534,258 @@ class MatrixNode(models.Model):
     position = models.IntegerField(choices=[(1, 'Left'), (2, 'Right')])
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Level-order number of this node inside the board tree that starts at
+    # tree_root (tree_root = 1, its left = 2, right = 3, next level 4..7, ...)
+    # so parent = slot_index // 2 and a member's payline is 4x..4x+3.
+    tree_root = models.ForeignKey(
+        'MemberProfile',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='board_tree_nodes'
+    )
+    slot_index = models.BigIntegerField(null=True, blank=True)
+
+    objects = LoggedQuerySet.as_manager()
+
+    class Meta:
+        indexes = [models.Index(fields=['board', 'tree_root', 'slot_index'])]
+
     def __str__(self):
-        return f"{self.user.username} - Board {self.board} ({'Left' if self.position == 1 else 'Right'})"            
\ No newline at end of file
+        return f"{self.user.username} - Board {self.board} ({'Left' if self.position == 1 else 'Right'})"
+
+@receiver(post_save, sender=MatrixNode)
+def log_node_saved(sender, instance, created, update_fields, using, **kwargs):
+    if event_log_enabled():
+        record_saved(instance, created, update_fields, using)
+
+@receiver(post_delete, sender=MatrixNode)
+def log_node_deleted(sender, instance, using, **kwargs):
+    if event_log_enabled():
+        record_deleted(instance, using)
+
+class BoardFrontier(models.Model):
+    """
+    One open left/right slot inside a sponsor's board tree.
+    slot_index is the breadth-first (heap) number of the slot counted from the
+    root (root = 1, its left = 2, right = 3, ...), so the lowest index is the
+    next slot place_member_with_spillover would pick.
+    """
+    root = models.ForeignKey(MemberProfile, on_delete=models.CASCADE, related_name='frontier_slots')
+    board = models.IntegerField()
+    parent = models.ForeignKey(MemberProfile, on_delete=models.CASCADE, related_name='open_slots')
+    position = models.IntegerField(choices=[(1, 'Left'), (2, 'Right')])
+    slot_index = models.BigIntegerField()
+
+    class Meta:
+        unique_together = ('root', 'board', 'slot_index')
+        indexes = [models.Index(fields=['board', 'parent', 'position'])]
+
+    def __str__(self):
+        return f"Board {self.board} slot {self.slot_index} under {self.root_id}"
+
+class SponsorLink(models.Model):
+    """
+    Closure table of the referral tree: one row for every member and each of
+    their sponsors up the chain (depth 1 = direct sponsor), plus a depth 0 row
+    for the member itself. "Everyone under X" is then ancestor=X.
+    """
+    ancestor = models.ForeignKey(MemberProfile, on_delete=models.CASCADE, related_name='descendant_links')
+    descendant = models.ForeignKey(MemberProfile, on_delete=models.CASCADE, related_name='ancestor_links')
+    depth = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = ('ancestor', 'descendant')
+        indexes = [
+            models.Index(fields=['ancestor', 'depth']),
+            models.Index(fields=['descendant', 'depth']),
+        ]
+
+    def __str__(self):
+        return f"{self.descendant_id} is {self.depth} below {self.ancestor_id}"
+
+class BoardCycle(models.Model):
+    """One row each time a member cycles out of a board (written by handle_cycle)."""
+    profile = models.ForeignKey(MemberProfile, on_delete=models.CASCADE, related_name='board_cycles')
+    board = models.PositiveSmallIntegerField()
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['profile', 'board'])]
+
+    def __str__(self):
+        return f"{self.profile_id} cycled board {self.board} at {self.created_at}"
+
+class BoardReportCache(models.Model):
+    """
+    Derived reporting rows, one per member and board: fill count, the two
+    slots, payline earnings and cycles. Placement never reads them; the board
+    state is the MemberProfile columns (and BoardCycle for cycles).
+    cascade.members_changed rewrites a member's rows in the same transaction
+    as any change to those, so board-wide report queries are one indexed query.
+    """
+    profile = models.ForeignKey(MemberProfile, on_delete=models.CASCADE, related_name='board_reports')
+    board = models.PositiveSmallIntegerField()
+    count = models.PositiveSmallIntegerField(default=0)
+    left_child = models.ForeignKey(MemberProfile, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    right_child = models.ForeignKey(MemberProfile, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    earned = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    cycles = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('profile', 'board')
+        indexes = [
+            # "Boards at count N" (nearly full, about to cycle)
+            models.Index(fields=['board', 'count']),
+            # Members with a free slot on a board
+            models.Index(
+                fields=['board', 'profile'], name='board_report_open_slots',
+                condition=Q(left_child__isnull=True) | Q(right_child__isnull=True)
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.profile_id} on board {self.board}: {self.count}/6"
+
+class MatrixJob(models.Model):
+    """
+    Queued placement/cycle work, drained by `manage.py run_matrix_worker`.
+    A worker claims rows by writing its claim token with a single UPDATE, so
+    several workers can run side by side.
+    """
+    KINDS = (
+        ('activate', 'Activate & Place'),
+        ('place_in_matrix', 'Place Under Sponsor'),
+        ('spillover', 'Spillover Placement'),
+    )
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    )
+    kind = models.CharField(max_length=20, choices=KINDS)
+    profile = models.ForeignKey(MemberProfile, on_delete=models.CASCADE, related_name='matrix_jobs')
+    board = models.IntegerField(default=1)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    claim_token = models.CharField(max_length=64, blank=True, default='')
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default='')
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'run_after'])]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} #{self.pk} ({self.status})"
+
+
+
+class LedgerTotal(models.Model):
+    """
+    Running per-member sums of the Transaction ledger up to a reconciliation
+    run's high-water mark, so the next run only has to add the newer rows.
+    cash is what balance and wallet should hold, nfg what nfg_balance should.
+    """
+    profile = models.OneToOneField(MemberProfile, on_delete=models.CASCADE, primary_key=True, related_name='ledger_total')
+    cash = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    nfg = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    transactions = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class ReconciliationRun(models.Model):
+    """One `manage.py reconcile_ledger` pass; high_water is the last Transaction.timestamp folded into LedgerTotal."""
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    full = models.BooleanField(default=False)
+    high_water = models.DateTimeField(null=True, blank=True)
+    transactions_read = models.IntegerField(default=0)
+    members_checked = models.IntegerField(default=0)
+    drifted = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"Reconciliation #{self.pk} ({self.drifted} drifted)"
+
+
+class BalanceDrift(models.Model):
+    """A member whose stored balances differ from the ledger at the end of a run (stored minus ledger)."""
+    KINDS = (
+        ('untracked_credit', 'Balance & wallet above ledger'),
+        ('untracked_debit', 'Balance & wallet below ledger'),
+        ('balance_only', 'Balance only'),
+        ('wallet_only', 'Wallet only'),
+        ('split', 'Balance & wallet off by different amounts'),
+        ('nfg', 'NFG balance only'),
+    )
+    run = models.ForeignKey(ReconciliationRun, on_delete=models.CASCADE, related_name='drifts')
+    profile = models.ForeignKey(MemberProfile, on_delete=models.CASCADE, related_name='balance_drifts')
+    kind = models.CharField(max_length=20, choices=KINDS)
+    balance_drift = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    wallet_drift = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    nfg_drift = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+
+    class Meta:
+        indexes = [models.Index(fields=['run', 'kind'])]
+
+
+class RequestMetric(models.Model):
+    """Per-view request timings of one process over one flush period (MATRIX_METRICS_FLUSH_SECONDS)."""
+    period_start = models.DateTimeField()
+    period_end = models.DateTimeField()
+    view_name = models.CharField(max_length=200)
+    requests = models.IntegerField(default=0)
+    p50_ms = models.FloatField(default=0)
+    p95_ms = models.FloatField(default=0)
+    p99_ms = models.FloatField(default=0)
+    max_ms = models.FloatField(default=0)
+    db_p95_ms = models.FloatField(default=0)
+    queries_mean = models.FloatField(default=0)
+    queries_max = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [models.Index(fields=['view_name', 'period_start'])]
+
+    def __str__(self):
+        return f"{self.view_name} @ {self.period_start:%Y-%m-%d %H:%M}"
+
+
+class StatCounter(models.Model):
+    """
+    Admin summary counters (matrix.stats), kept up to date by the member,
+    cycle and withdrawal events and spread over shards like AdminRevenue.
+    """
+    name = models.CharField(max_length=40)
+    shard = models.IntegerField(default=0)
+    value = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ('name', 'shard')
+
+    def __str__(self):
+        return f"{self.name}[{self.shard}] = {self.value}"
+
+
+class MatrixEvent(models.Model):
+    """
+    One write to MemberProfile or MatrixNode rows (placement, slot fill or
+    clear, count, bonus, cycle, upgrade, ...), appended in the writer's
+    transaction by events.py. data['rows'] is [[ids], {field: value},
+    {field: delta}]; replayed in pk order they rebuild the current state
+    (replay_events).
+    """
+    created_at = models.DateTimeField(default=timezone.now)
+    kind = models.CharField(max_length=20)
+    target = models.CharField(max_length=10)  # member / node
+    op = models.CharField(max_length=10)  # create / update / delete
+    data = models.JSONField(encoder=DjangoJSONEncoder)
+
+    def __str__(self):
+        return f"#{self.pk} {self.kind} ({self.target} {self.op})"
+
@@ -0,0 +1,68 @@
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Max
+from django.utils.functional import cached_property
+
+# Below this many rows an exact COUNT(*) is cheap enough
+EXACT_COUNT_BELOW = 10000
+# Filtered lists are counted up to this many matches (and paged that far)
+COUNT_LIMIT = 10000
+
+
+class LargeTablePaginator(Paginator):
+    """
+    Paginator for admin lists over very large tables:
+
+    - the unfiltered count is the planner's row estimate (PostgreSQL) or
+      MAX(pk) elsewhere instead of a COUNT(*) over the whole table;
+    - filtered/searched lists are counted up to COUNT_LIMIT;
+    - when the list is ordered by pk, a page is fetched by seeking to its
+      first pk (an index-only walk) and reading per_page rows from there, so
+      the annotated page query never scans the rows of earlier pages.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if queryset.query.where:
+            return queryset.order_by().values('pk')[:COUNT_LIMIT].count()
+
+        estimate = self._estimate(queryset)
+        if estimate < EXACT_COUNT_BELOW:
+            return queryset.count()
+        return estimate
+
+    def _estimate(self, queryset):
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                    [queryset.model._meta.db_table]
+                )
+                row = cursor.fetchone()
+            if row and row[0] > 0:
+                return row[0]
+        return queryset.order_by().aggregate(top=Max('pk'))['top'] or 0
+
+    def _seek_order(self):
+        ordering = tuple(self.object_list.query.order_by)
+        pk_name = self.object_list.model._meta.pk.name
+        if ordering in (('pk',), (pk_name,)):
+            return False
+        if ordering in (('-pk',), (f'-{pk_name}',)):
+            return True
+        return None
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        descending = self._seek_order()
+        if not bottom or descending is None:
+            return super().page(number)
+
+        first = list(self.object_list.values_list('pk', flat=True)[bottom:bottom + 1])
+        if not first:
+            return self._get_page([], number, self)
+        lookup = 'pk__lte' if descending else 'pk__gte'
+        return self._get_page(self.object_list.filter(**{lookup: first[0]})[:self.per_page], number, self)
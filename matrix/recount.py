@@ -0,0 +1,115 @@
+import numpy as np
+from django.db import transaction
+from .models import MemberProfile
+from .board_cache import BOARDS, count_field, child_fields
+from . import cascade
+
+CHUNK = 50000
+UPDATE_CHUNK = 500
+
+
+def _columns():
+    columns = ['pk']
+    for b in BOARDS:
+        left, right = child_fields(b)
+        columns += [f'{left}_id', f'{right}_id']
+    return columns + [count_field(b) for b in BOARDS]
+
+
+def _load(queryset):
+    """(pk, 10 child id columns, 5 stored counts) as one int64 array, sorted by pk; missing children are 0."""
+    chunks, rows = [], []
+    for row in queryset.order_by('pk').values_list(*_columns()).iterator(chunk_size=CHUNK):
+        rows.append(row)
+        if len(rows) == CHUNK:
+            chunks.append(np.array(rows, dtype=object))
+            rows = []
+    if rows:
+        chunks.append(np.array(rows, dtype=object))
+    if not chunks:
+        return np.zeros((0, 1 + 3 * len(BOARDS)), dtype=np.int64)
+    table = np.concatenate(chunks)
+    table[table == None] = 0  # noqa: E711 (elementwise on an object array)
+    return table.astype(np.int64)
+
+
+def _lookup(pks, ids):
+    """Row index of each id in the sorted pks, and whether it is really there."""
+    at = np.searchsorted(pks, ids)
+    at = np.minimum(at, len(pks) - 1)
+    return at, (ids > 0) & (pks[at] == ids)
+
+
+def board_fills(queryset=None):
+    """
+    Level 1 + level 2 fill of every member of queryset on all five boards,
+    from the child FK columns (what _check_and_cycle writes for the current
+    board). Returns (pks, fills, stored), each row of fills/stored holding
+    boards 1-5.
+
+    The stored count is the fill as of the member's last check, plus what
+    placements added since. It can trail the slots when a child cycles out of
+    the board: the child's slots are cleared (and may fill again) without the
+    member holding it being checked. A recount writes the slot fill, like the
+    old per-member sync did.
+    """
+    queryset = MemberProfile.objects.all() if queryset is None else queryset
+    table = _load(queryset)
+    pks = table[:, 0]
+    stored = table[:, 1 + 2 * len(BOARDS):]
+    fills = np.zeros_like(stored)
+    if not len(pks):
+        return pks, fills, stored
+
+    children = table[:, 1:1 + 2 * len(BOARDS)]
+    # Level 2 needs the children's own slots; fetch the ones outside the selection
+    known = set(pks.tolist())
+    outside = np.unique(children[children > 0])
+    outside = [pk for pk in outside.tolist() if pk not in known]
+    if outside:
+        extra = _load(MemberProfile.objects.filter(pk__in=outside))
+        everyone = np.concatenate([table, extra])
+        everyone = everyone[np.argsort(everyone[:, 0])]
+    else:
+        everyone = table
+    all_pks = everyone[:, 0]
+    all_children = everyone[:, 1:1 + 2 * len(BOARDS)]
+
+    for i, b in enumerate(BOARDS):
+        left, right = children[:, 2 * i], children[:, 2 * i + 1]
+        kids = (all_children[:, 2 * i] > 0).astype(np.int64) + (all_children[:, 2 * i + 1] > 0)
+        fill = (left > 0).astype(np.int64) + (right > 0)
+        for side in (left, right):
+            at, present = _lookup(all_pks, side)
+            fill += np.where(present, kids[at], 0)
+        fills[:, i] = fill
+    return pks, fills, stored
+
+
+def recount_boards(queryset=None, boards=BOARDS, dry_run=False):
+    """
+    Compares stored board counts with the recomputed fill and, unless dry_run,
+    writes the corrections (one UPDATE per board, value and chunk of pks).
+    Returns {board: [(pk, stored, actual), ...]} for the members that were off.
+    """
+    pks, fills, stored = board_fills(queryset)
+    report, changed = {}, set()
+    with transaction.atomic():
+        for i, b in enumerate(BOARDS):
+            if b not in boards:
+                continue
+            off = np.nonzero(fills[:, i] != stored[:, i])[0]
+            report[b] = list(zip(pks[off].tolist(), stored[off, i].tolist(), fills[off, i].tolist()))
+            if dry_run or not len(off):
+                continue
+            for value in np.unique(fills[off, i]).tolist():
+                targets = pks[off][fills[off, i] == value].tolist()
+                for start in range(0, len(targets), UPDATE_CHUNK):
+                    MemberProfile.objects.filter(pk__in=targets[start:start + UPDATE_CHUNK]).update(
+                        **{count_field(b): value}
+                    )
+            changed.update(pks[off].tolist())
+        if changed:
+            # Cached dashboards of the repaired members
+            cascade.touch_ids(changed)
+    return report
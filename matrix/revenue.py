@@ -0,0 +1,66 @@
+import random
+from decimal import Decimal
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Max, Sum
+from django.utils import timezone
+from .models import AdminRevenue
+
+TOTALS_KEY = 'matrix:revenue:totals'
+FEE_FIELDS = [f'b{b}_fees' for b in range(1, 6)]
+TOTAL_FIELDS = ['total_fees_collected', 'total_withdrawals_processed', *FEE_FIELDS]
+
+
+def shard_count():
+    return max(getattr(settings, 'MATRIX_REVENUE_SHARDS', 8), 1)
+
+
+def cache_seconds():
+    return getattr(settings, 'MATRIX_REVENUE_CACHE_SECONDS', 30)
+
+
+def _add(**amounts):
+    """
+    Adds amounts (field -> Decimal) to one AdminRevenue shard picked at random,
+    so concurrent fee writers rarely wait on the same row lock.
+    """
+    updates = {field: F(field) + Decimal(str(amount)) for field, amount in amounts.items() if amount}
+    if not updates:
+        return
+    shard = random.randrange(shard_count())
+    updates['last_updated'] = timezone.now()
+    if not AdminRevenue.objects.filter(shard=shard).update(**updates):
+        AdminRevenue.objects.get_or_create(shard=shard)
+        AdminRevenue.objects.filter(shard=shard).update(**updates)
+    transaction.on_commit(lambda: cache.delete(TOTALS_KEY))
+
+
+def record_fee(amount, board_level=None):
+    """Platform fee income, per board when board_level is given (upgrade fees, cycle admin cuts)."""
+    amounts = {'total_fees_collected': amount}
+    if board_level in range(1, 6):
+        amounts[f'b{board_level}_fees'] = amount
+    _add(**amounts)
+
+
+def record_withdrawal(amount):
+    _add(total_withdrawals_processed=amount)
+
+
+def revenue_totals(use_cache=True):
+    """
+    The shards summed up: TOTAL_FIELDS plus last_updated, or None before the
+    first fee. Cached until the next fee or withdrawal is committed, and for
+    at most MATRIX_REVENUE_CACHE_SECONDS.
+    """
+    totals = cache.get(TOTALS_KEY) if use_cache else None
+    if totals is None:
+        totals = AdminRevenue.objects.aggregate(
+            shards=Max('shard'), last_updated=Max('last_updated'),
+            **{field: Sum(field) for field in TOTAL_FIELDS}
+        )
+        if totals.pop('shards') is None:
+            totals = {}
+        cache.set(TOTALS_KEY, totals, cache_seconds())
+    return totals or None
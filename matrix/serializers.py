@@ -0,0 +1,14 @@
+from rest_framework import serializers
+
+
+class BoardNodeSerializer(serializers.Serializer):
+    """One member of a board subtree chunk (rows of board_index.board_subtree)."""
+    slot = serializers.IntegerField()
+    depth = serializers.IntegerField()
+    member = serializers.IntegerField(source='user__memberprofile__id')
+    username = serializers.CharField(source='user__username')
+    is_active = serializers.BooleanField(source='user__memberprofile__is_active')
+    current_board = serializers.IntegerField(source='user__memberprofile__current_board')
+    has_children = serializers.BooleanField(allow_null=True)
+    # Only on the chunk's deepest members that have (or may have) children
+    cursor = serializers.CharField(required=False)
@@ -0,0 +1,562 @@
+import random
+import time
+from array import array
+from decimal import Decimal
+import numpy as np
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Max, Sum
+from .models import AdminRevenue, MatrixNode, MemberProfile, Transaction
+from .benchmark import SHAPES, _Rollback, _sponsor_index, generate_network, replay_activations
+from .board_cache import BOARDS, child_fields, count_field, earned_field
+from .cascade import MAX_STEPS, CascadeLimitError
+from .frontier import MAX_SLOT_INDEX
+from .logic import BOARD_CONFIGS, FEE_RATE, NFG_REWARDS
+
+CHUNK = 50000
+# Slots deeper than this below a root get no slot_index (frontier.MAX_SLOT_INDEX)
+MAX_DEPTH = MAX_SLOT_INDEX.bit_length() - 2
+STATUSES = ('pending', 'paid')
+
+
+def _cents(amount):
+    return int(Decimal(amount).scaleb(2))
+
+
+def _money(cents):
+    return Decimal(cents).scaleb(-2)
+
+
+# The payouts of logic.py in cents. _check_and_cycle's upgrade fee for board
+# N is that board's base, the same table as BOARD_CONFIGS.
+BASE = {b: _cents(BOARD_CONFIGS[b]['base']) for b in BOARDS}
+NEXT_FEE = {b: _cents(BOARD_CONFIGS[b]['next_fee'] or 0) for b in BOARDS}
+ADMIN_CUT = {b: _cents(BOARD_CONFIGS[b]['base'] * 4 * FEE_RATE) for b in BOARDS}
+
+# Simulated MemberProfile columns: attribute -> model field (per board: attribute, field(b))
+MEMBER_COLUMNS = {
+    'board': 'current_board', 'cycle_count': 'cycle_count', 'paid_referrals': 'paid_referrals_count',
+    'active': 'is_active', 'status': 'payment_status', 'locked': 'is_position_locked',
+    'placed_b1': 'is_already_placed_in_b1', 'wallet': 'wallet', 'balance': 'balance', 'nfg': 'nfg_balance',
+}
+BOARD_COLUMNS = {
+    'count': count_field,
+    'left': lambda b: f'{child_fields(b)[0]}_id',
+    'right': lambda b: f'{child_fields(b)[1]}_id',
+    'earned': earned_field,
+}
+MONEY = {'wallet', 'balance', 'nfg', 'earned'}
+
+
+class MatrixSimulation:
+    """
+    The whole matrix in memory, one typed array per column (index 0 is
+    "nobody", money in integer cents). Member i's children on board b sit at
+    kids[b][2i] (left) and kids[b][2i + 1] (right); 2i + position - 1 is the
+    slot's key everywhere below. node[b][i] is the parent of i's MatrixNode
+    (0 for a top, -1 without a node). Instead of the BoardFrontier rows,
+    shallow[b][i] keeps how many levels below i its nearest open slot is,
+    which is all next_open_slot needs to walk down to the lowest one.
+
+    activate() runs activate_one's rules (place_member_with_spillover,
+    update_ancestor_counts, _check_and_cycle, handle_cycle,
+    award_nfg_airdrop) against the arrays, step for step and in the same
+    cascade order, so the results match the ORM path exactly.
+    """
+
+    def __init__(self):
+        self.pk = array('q', [0])
+        self.username = ['']
+        self.sponsor = array('q', [0])
+        self.admin = 0
+        for name in MEMBER_COLUMNS:
+            setattr(self, name, array('q', [0]))
+        self.board[0] = 1
+        for name in ('count', 'earned', 'holder', 'shallow'):
+            setattr(self, name, [None] + [array('q', [0]) for _ in BOARDS])
+        self.kids = [None] + [array('q', [0, 0]) for _ in BOARDS]
+        self.node = [None] + [array('q', [-1]) for _ in BOARDS]
+        # Rarely a member is held by a second slot (board reset by a lower
+        # board's cycle); holder keeps the lowest key, like _board_ancestors
+        self.more_holders = [None] + [{} for _ in BOARDS]
+        self.index = {}
+        self.ledger = None
+        self.steps = []
+        self.stats = self._empty_stats()
+
+    @staticmethod
+    def _empty_stats():
+        return {
+            'activations': 0, 'placements': 0, 'steps': 0, 'jobs': 0, 'nfg': 0,
+            'cycles': dict.fromkeys(BOARDS, 0), 'upgrades': dict.fromkeys(BOARDS, 0),
+            'bonuses': dict.fromkeys(BOARDS, 0), 'bonus_cents': dict.fromkeys(BOARDS, 0),
+            'fee_cents': dict.fromkeys(BOARDS, 0),
+        }
+
+    def __len__(self):
+        return len(self.pk) - 1
+
+    # --- Loading ---
+
+    @classmethod
+    def load(cls, using='default'):
+        """Every member and matrix node of the database."""
+        sim = cls()
+        fields = ['pk', 'user__username', 'sponser_id', *MEMBER_COLUMNS.values()]
+        for b in BOARDS:
+            fields += [column(b) for column in BOARD_COLUMNS.values()]
+        rows = list(MemberProfile.objects.using(using).order_by('pk').values_list(*fields).iterator(chunk_size=CHUNK))
+        sim.index = {row[0]: i for i, row in enumerate(rows, start=1)}
+        index = sim.index
+        columns = list(zip(*rows)) if rows else [()] * len(fields)
+
+        sim.pk.extend(columns[0])
+        sim.username.extend(columns[1])
+        sim.sponsor.extend(index.get(pk, 0) for pk in columns[2])
+        at = 3
+        for name in MEMBER_COLUMNS:
+            values = columns[at]
+            if name == 'status':
+                values = (STATUSES.index(v) if v in STATUSES else len(STATUSES) for v in values)
+            elif name in MONEY:
+                values = (_cents(v) for v in values)
+            getattr(sim, name).extend(values)
+            at += 1
+        size = len(rows) + 1
+        for b in BOARDS:
+            count, left, right, earned = columns[at:at + 4]
+            at += 4
+            sim.count[b].extend(count)
+            sim.earned[b].extend(_cents(v) for v in earned)
+            kids = sim.kids[b]
+            for pair in zip(left, right):
+                kids.extend(index.get(pk, 0) for pk in pair)
+            sim.holder[b].extend([0] * (size - 1))
+            sim.node[b].extend([-1] * (size - 1))
+            for key in range(2, 2 * size):
+                if kids[key]:
+                    sim._hold(b, key, kids[key])
+            sim._shallow_depths(b)
+
+        # Newest first, so the oldest node of a member wins (MatrixNode...first())
+        nodes = MatrixNode.objects.using(using).order_by('-pk').values_list('board', 'user__memberprofile__id', 'parent_profile_id')
+        for b, profile_id, parent_id in nodes.iterator(chunk_size=CHUNK):
+            if b in BOARDS and profile_id in index:
+                sim.node[b][index[profile_id]] = index.get(parent_id, 0)
+
+        admin = User.objects.using(using).filter(is_superuser=True).order_by('pk').values_list('memberprofile__id', flat=True).first()
+        sim.admin = index.get(admin, 0)
+        return sim
+
+    def add_members(self, sponsors):
+        """
+        New pending members, one per entry of sponsors (member index, 0 for
+        none; members of this same call may sponsor the later ones). Returns
+        their indexes.
+        """
+        first = len(self.pk)
+        count = len(sponsors)
+        added = range(first, first + count)
+        next_pk = self.pk[-1] + 1 if first > 1 else 1
+        self.pk.extend(range(next_pk, next_pk + count))
+        self.username.extend(f'sim-{i}' for i in added)
+        self.sponsor.extend(sponsors)
+        for name in MEMBER_COLUMNS:
+            getattr(self, name).extend(array('q', [1 if name == 'board' else 0]) * count)
+        for b in BOARDS:
+            for column, value in ((self.count, 0), (self.earned, 0), (self.holder, 0), (self.shallow, 1), (self.node, -1)):
+                column[b].extend(array('q', [value]) * count)
+            self.kids[b].extend(array('q', [0, 0]) * count)
+        self.index.update(zip(self.pk[first:], added))
+        return added
+
+    def add_member(self, sponsor=0):
+        """A new pending member under sponsor (index, 0 for none). Returns its index."""
+        return self.add_members([sponsor])[0]
+
+    # --- Open slots (what frontier.py's BoardFrontier rows answer) ---
+
+    def _hold(self, b, key, member):
+        holder = self.holder[b]
+        if not holder[member]:
+            holder[member] = key
+            return
+        others = self.more_holders[b].setdefault(member, set())
+        if key < holder[member]:
+            others.add(holder[member])
+            holder[member] = key
+        else:
+            others.add(key)
+
+    def _unhold(self, b, key, member):
+        holder = self.holder[b]
+        others = self.more_holders[b].get(member)
+        if holder[member] == key:
+            holder[member] = min(others) if others else 0
+            if others:
+                others.discard(holder[member])
+        elif others:
+            others.discard(key)
+
+    def _parents(self, b, member):
+        key = self.holder[b][member]
+        if not key:
+            return ()
+        return [key >> 1, *(other >> 1 for other in self.more_holders[b].get(member, ()))]
+
+    def _depth(self, b, member):
+        kids, shallow = self.kids[b], self.shallow[b]
+        left, right = kids[2 * member], kids[2 * member + 1]
+        if not left or not right:
+            return 1
+        return 1 + min(shallow[left], shallow[right])
+
+    def _shallow_depths(self, b):
+        """shallow[b] from scratch, children before parents (members caught in a loop stay at 1)."""
+        kids, size = self.kids[b], len(self.pk)
+        shallow = self.shallow[b] = array('q', [1]) * size
+        waiting = [(kids[2 * i] > 0) + (kids[2 * i + 1] > 0) for i in range(size)]
+        ready = [i for i in range(1, size) if not waiting[i]]
+        while ready:
+            member = ready.pop()
+            shallow[member] = self._depth(b, member)
+            for parent in self._parents(b, member):
+                waiting[parent] -= 1
+                if not waiting[parent]:
+                    ready.append(parent)
+
+    def _reshaped(self, b, member):
+        """member's slots changed: bring shallow up to date above it, as far as it changes."""
+        shallow = self.shallow[b]
+        todo = [member]
+        while todo:
+            member = todo.pop()
+            depth = self._depth(b, member)
+            if shallow[member] != depth:
+                shallow[member] = depth
+                todo.extend(self._parents(b, member))
+
+    def _next_open_slot(self, root, b):
+        """
+        next_open_slot: the key of the lowest open slot under root in BFS
+        order (shallowest first, then leftmost), 0 when every slot that would
+        still get a slot_index is taken.
+        """
+        kids, shallow = self.kids[b], self.shallow[b]
+        member = root
+        for _ in range(MAX_DEPTH):
+            left, right = kids[2 * member], kids[2 * member + 1]
+            if not left:
+                return 2 * member
+            if not right:
+                return 2 * member + 1
+            member = right if shallow[right] < shallow[left] else left
+        return 0
+
+    # --- The rules (activation.py, logic.py, MemberProfile) ---
+
+    def _saved(self, i):
+        """What MemberProfile.save() and handle_new_paid_member do to the row."""
+        if self.active[i] and self.status[i] == 0:
+            self.status[i] = 1
+        if self.status[i] == 1 and not self.placed_b1[i]:
+            # handle_new_paid_member queues a place_in_matrix job (not simulated)
+            self.placed_b1[i] = 1
+            self.stats['jobs'] += 1
+
+    def _record(self, i, kind, b, cents, source=0):
+        if self.ledger is not None:
+            self.ledger.append((i, kind, b, cents, source))
+
+    def _run(self, func, *args):
+        # cascade.run: last in, first out
+        steps = self.steps = [(func, args)]
+        done = 0
+        while steps:
+            func, args = steps.pop()
+            done += 1
+            if done > MAX_STEPS:
+                raise CascadeLimitError(f"Cascade stopped after {MAX_STEPS} steps")
+            func(*args)
+        self.stats['steps'] += done
+
+    def activate(self, i):
+        """activate_one for member i."""
+        self.status[i] = 1
+        self.active[i] = 1
+        self.placed_b1[i] = 1
+        self._saved(i)
+        self.stats['activations'] += 1
+        if self.sponsor[i]:
+            self._run(self._place, i, self.sponsor[i], 1)
+
+    def _place(self, member, root, b):
+        if self.node[b][member] >= 0:
+            return
+        key = self._next_open_slot(root, b)
+        if not key:
+            return
+        parent = key >> 1
+        status, placed_b1 = self.status, self.placed_b1
+        if parent != member:
+            self.kids[b][key] = member
+            self._hold(b, key, member)
+            if status[parent] != 1 or not placed_b1[parent]:
+                self._saved(parent)
+            self._reshaped(b, parent)
+        self.node[b][member] = parent
+        self.stats['placements'] += 1
+        self.locked[member] = 1
+        if status[member] != 1 or not placed_b1[member]:
+            self._saved(member)
+        self.steps.append((self._count_up, (member, b)))
+
+    def _count_up(self, member, b):
+        """update_ancestor_counts."""
+        node = self.node[b]
+        parent = node[member]
+        if parent <= 0:
+            return
+        grandparent = node[parent] if node[parent] > 0 else 0
+        self.count[b][parent] += 1
+        before = self.board[parent]
+        # _update_grandparent is queued ahead of whatever the check sets off
+        mark = len(self.steps)
+        self._check(parent)
+        self.steps.insert(mark, (self._pay_grandparent, (member, b, parent, grandparent, before, self.board[parent])))
+
+    def _pay_grandparent(self, member, b, parent, grandparent, before, board_seen):
+        """_update_grandparent (board_seen: the parent instance's current_board)."""
+        if board_seen != before:
+            up = self.node[b][parent]
+            grandparent = up if up > 0 else 0
+        if not grandparent:
+            return
+        self.count[b][grandparent] += 1
+        fill = self.count[b][grandparent]
+        if 3 <= fill <= 6:
+            bonus = BASE[b]
+            self.wallet[grandparent] += bonus
+            self.balance[grandparent] += bonus
+            self.earned[b][grandparent] += bonus
+            self.stats['bonuses'][b] += 1
+            self.stats['bonus_cents'][b] += bonus
+            self._record(grandparent, 'bonus', b, bonus, member)
+        if fill >= 6:
+            self._cycle(grandparent, b)
+        else:
+            self._check(grandparent)
+
+    def _check(self, i):
+        """MemberProfile._check_and_cycle: recount the current board, upgrade at 6."""
+        cb = self.board[i]
+        if cb not in BOARDS:
+            return
+        kids = self.kids[cb]
+        left, right = kids[2 * i], kids[2 * i + 1]
+        fill = 0
+        for child in (left, right):
+            if child:
+                fill += 1 + (kids[2 * child] > 0) + (kids[2 * child + 1] > 0)
+        self.count[cb][i] = fill
+        if fill >= 6 and cb < 5:
+            next_board = cb + 1
+            fee = BASE[next_board]
+            self.board[i] = next_board
+            self.paid_referrals[i] = 0
+            self.wallet[i] -= fee
+            self.balance[i] -= fee
+            self.stats['upgrades'][next_board] += 1
+            self.stats['fee_cents'][next_board] += fee
+            self._record(i, 'upgrade', next_board, -fee)
+            if self.sponsor[i]:
+                self.steps.append((self._place, (i, self.sponsor[i], next_board)))
+
+    def _cycle(self, i, b):
+        """handle_cycle."""
+        reward = NFG_REWARDS.get(b, 0)
+        if reward:
+            self.nfg[i] += reward * 100
+            self.stats['nfg'] += reward
+            self._record(i, 'airdrop', b, reward * 100)
+        cut, next_fee = ADMIN_CUT[b], NEXT_FEE[b]
+        self.stats['fee_cents'][b] += cut
+        self.balance[i] -= cut + next_fee
+        self.wallet[i] -= cut + next_fee
+        self.stats['cycles'][b] += 1
+        self._record(i, 'cycle', b, -(cut + next_fee))
+
+        kids, node = self.kids[b], self.node[b]
+        left, right = kids[2 * i], kids[2 * i + 1]
+        self.count[b][i] = 0
+        kids[2 * i] = kids[2 * i + 1] = 0
+        # cycle_count goes up twice, once with the fee and once with the reset
+        self.cycle_count[i] += 2
+        for side, child in ((0, left), (1, right)):
+            if child:
+                self._unhold(b, 2 * i + side, child)
+        # record_release: both slots are open again for everyone above
+        self._reshaped(b, i)
+        # detach_children, then the member's own node goes
+        for child in (left, right):
+            if child and node[child] == i:
+                node[child] = 0
+        node[i] = -1
+
+        if next_fee:
+            self.board[i] = b + 1
+            self._saved(i)
+            target = self.sponsor[i] or self.admin
+            if target:
+                self.steps.append((self._place, (i, target, b + 1)))
+
+    # --- Results ---
+
+    def columns(self):
+        """{model field: int64 array over the members} (children as member indexes, money in cents)."""
+        result = {field: np.frombuffer(getattr(self, name), dtype=np.int64)[1:] for name, field in MEMBER_COLUMNS.items()}
+        for b in BOARDS:
+            kids = np.frombuffer(self.kids[b], dtype=np.int64)
+            result[count_field(b)] = np.frombuffer(self.count[b], dtype=np.int64)[1:]
+            result[BOARD_COLUMNS['left'](b)] = kids[2::2]
+            result[BOARD_COLUMNS['right'](b)] = kids[3::2]
+            result[earned_field(b)] = np.frombuffer(self.earned[b], dtype=np.int64)[1:]
+        return result
+
+    def transactions(self):
+        """The ledger rows recorded since ledger was set to a list: (profile pk, tx_type, amount, detail)."""
+        for i, kind, b, cents, source in self.ledger or ():
+            if kind == 'bonus':
+                row = ('CYCLE', f"Board {b} payline bonus from {self.username[source]}")
+            elif kind == 'airdrop':
+                row = ('AIRDROP', f"NFG Reward for Board {b} Completion")
+            elif kind == 'cycle':
+                row = ('UPGRADE', f"Board {b} Complete. Fee + Upgrade to Board {b + 1 if NEXT_FEE[b] else b}")
+            else:
+                row = ('UPGRADE', f"Upgraded to Board {b}")
+            yield self.pk[i], row[0], _money(cents), row[1]
+
+    def summary(self):
+        """Board population and the payout figures of everything simulated so far (money as Decimal)."""
+        stats = self.stats
+        boards = np.frombuffer(self.board, dtype=np.int64)[1:]
+        active = np.frombuffer(self.active, dtype=np.int64)[1:] > 0
+        return {
+            'members': len(self),
+            'activations': stats['activations'],
+            'placements': stats['placements'],
+            'steps': stats['steps'],
+            'jobs_queued': stats['jobs'],
+            'active_per_board': {b: int(np.count_nonzero(active & (boards == b))) for b in BOARDS},
+            'cycles': dict(stats['cycles']),
+            'upgrades': dict(stats['upgrades']),
+            'payline_bonuses': dict(stats['bonuses']),
+            'payline_paid': {b: _money(c) for b, c in stats['bonus_cents'].items()},
+            'admin_fees': {b: _money(c) for b, c in stats['fee_cents'].items()},
+            'nfg_airdropped': stats['nfg'],
+        }
+
+
+def _fee_totals(using='default'):
+    totals = AdminRevenue.objects.using(using).aggregate(**{f'b{b}': Sum(f'b{b}_fees') for b in BOARDS})
+    return {b: _cents(totals[f'b{b}'] or 0) for b in BOARDS}
+
+
+def compare(sim, using='default', after_transaction=0, fees_before=None, limit=50):
+    """
+    Differences between a simulation and the database it was loaded from,
+    after both ran the same activations: [(target, pk, field, simulated, live)]
+    over members, nodes, ledger rows past after_transaction and the
+    per-board fees (when fees_before is given). Stops after `limit`.
+    """
+    live = MatrixSimulation.load(using)
+    diffs = []
+    if len(live) != len(sim):
+        return [('member', None, 'count', len(sim), len(live))]
+
+    pks = np.frombuffer(sim.pk, dtype=np.int64)[1:]
+    mine, theirs = sim.columns(), live.columns()
+    for field in mine:
+        for at in np.nonzero(mine[field] != theirs[field])[0][:limit].tolist():
+            diffs.append(('member', int(pks[at]), field, int(mine[field][at]), int(theirs[field][at])))
+    for b in BOARDS:
+        node, live_node = np.frombuffer(sim.node[b], dtype=np.int64), np.frombuffer(live.node[b], dtype=np.int64)
+        for at in np.nonzero(node != live_node)[0][:limit].tolist():
+            diffs.append(('node', int(sim.pk[at]), f'board {b}', int(node[at]), int(live_node[at])))
+        if len(diffs) >= limit:
+            return diffs[:limit]
+
+    ledger = list(sim.transactions())
+    stored = list(Transaction.objects.using(using).filter(pk__gt=after_transaction).order_by('pk').values_list(
+        'profile_id', 'tx_type', 'amount', 'detail'
+    ))
+    for n, (row, live_row) in enumerate(zip(ledger, stored)):
+        if row != live_row:
+            diffs.append(('transaction', n, None, row, live_row))
+    if len(ledger) != len(stored):
+        diffs.append(('transaction', None, 'count', len(ledger), len(stored)))
+
+    if fees_before is not None:
+        fees = _fee_totals(using)
+        for b in BOARDS:
+            if fees[b] - fees_before[b] != sim.stats['fee_cents'][b]:
+                diffs.append(('fees', None, f'board {b}', sim.stats['fee_cents'][b], fees[b] - fees_before[b]))
+    return diffs[:limit]
+
+
+def verify(size, shape='random', seed=0, limit=50):
+    """
+    Generates a network (benchmark.generate_network), activates it once
+    through the ORM (replay_activations) and once in a simulation loaded
+    before the activations, and compares the two. Everything is rolled back.
+    """
+    result = {'shape': shape, 'size': size}
+    try:
+        with transaction.atomic():
+            members = generate_network(size, shape, seed)
+            sim = MatrixSimulation.load()
+            sim.ledger = []
+            after = Transaction.objects.aggregate(last=Max('pk'))['last'] or 0
+            fees_before = _fee_totals()
+
+            result['orm_seconds'] = replay_activations(members[1:])['seconds']
+            started = time.perf_counter()
+            for member in members[1:]:
+                sim.activate(sim.index[member.pk])
+            result['simulation_seconds'] = round(time.perf_counter() - started, 4)
+            result['placements'] = sim.stats['placements']
+            result['differences'] = compare(sim, after_transaction=after, fees_before=fees_before, limit=limit)
+            raise _Rollback
+    except _Rollback:
+        pass
+    return result
+
+
+def simulate_joins(sim, joins, shape='random', seed=0):
+    """
+    Adds `joins` members to the simulation and activates them in join order,
+    each sponsored like benchmark.generate_network's shapes (flat, deep,
+    superuser, random) over everyone there before them, the first superuser
+    counted first. Returns the simulation's summary plus timing.
+    """
+    if shape not in SHAPES:
+        raise ValueError(f"Unknown shape {shape!r}, expected one of {', '.join(SHAPES)}")
+    rng = random.Random(seed)
+    # Everyone there before, the first superuser first (generate_network's member 0)
+    everyone = [i for i in range(1, len(sim) + 1) if i != sim.admin]
+    if sim.admin:
+        everyone.insert(0, sim.admin)
+    first = len(sim) + 1
+    everyone.extend(range(first, first + joins))
+    before = len(everyone) - joins
+    sponsors = [everyone[_sponsor_index(shape, i, rng)] if i else 0 for i in range(before, before + joins)]
+    joined = sim.add_members(sponsors)
+
+    started = time.perf_counter()
+    for i in joined:
+        sim.activate(i)
+    seconds = time.perf_counter() - started
+    summary = sim.summary()
+    summary['seconds'] = round(seconds, 4)
+    summary['placements_per_sec'] = round(summary['placements'] / seconds, 1) if seconds else None
+    return summary
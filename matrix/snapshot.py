@@ -0,0 +1,272 @@
+import datetime
+import json
+from contextlib import contextmanager
+from decimal import Decimal
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.management.color import no_style
+from django.db import connections, models, transaction
+from . import events
+from .models import MatrixNode, MemberProfile, SponsorLink
+
+MAGIC = b'MXSNAP01'
+ALIGN = 64
+CHUNK = 50000
+INSERT_BATCH = 10000
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+MICROSECOND = datetime.timedelta(microseconds=1)
+# Users come along so the members can be restored anywhere; no passwords,
+# restored accounts get an unusable one
+USER_FIELDS = ['id', 'username', 'is_staff', 'is_superuser', 'is_active', 'date_joined']
+
+
+def _tables():
+    """(name, model, fields) in restore order (a table's foreign keys point at earlier ones)."""
+    def every(model):
+        return [f.name for f in model._meta.concrete_fields]
+    return [
+        ('user', User, USER_FIELDS),
+        ('member', MemberProfile, every(MemberProfile)),
+        ('node', MatrixNode, every(MatrixNode)),
+        ('sponsor_link', SponsorLink, every(SponsorLink)),
+    ]
+
+
+def _kind(field):
+    if isinstance(field, models.BooleanField):
+        return 'bool'
+    if isinstance(field, models.DecimalField):
+        return 'decimal'
+    if isinstance(field, models.DateTimeField):
+        return 'datetime'
+    if isinstance(field, (models.CharField, models.TextField)):
+        return 'text'
+    if isinstance(field, (models.IntegerField, models.AutoField, models.ForeignKey)):
+        return 'int'
+    raise TypeError(f"{field.model.__name__}.{field.name} ({type(field).__name__}) has no snapshot column type")
+
+
+def _encode(field, kind, values):
+    """Python values of one column -> (fixed-width array, null mask or None)."""
+    nulls = None
+    if field.null:
+        nulls = np.array([v is None for v in values], dtype=np.bool_)
+    if kind == 'bool':
+        return np.array([bool(v) for v in values], dtype=np.bool_), nulls
+    if kind == 'int':
+        return np.array([0 if v is None else v for v in values], dtype=np.int64), nulls
+    if kind == 'decimal':
+        # Fixed point: the stored decimal places become an exact int64
+        return np.array([0 if v is None else int(v.scaleb(field.decimal_places)) for v in values], dtype=np.int64), nulls
+    if kind == 'datetime':
+        return np.array([0 if v is None else (v - EPOCH) // MICROSECOND for v in values], dtype=np.int64), nulls
+    encoded = [b'' if v is None else v.encode('utf-8') for v in values]
+    width = max((len(v) for v in encoded), default=0) or 1
+    return np.array(encoded, dtype=f'S{width}'), nulls
+
+
+def _decode(field, kind, array, nulls):
+    """A column back to the Python values the database adapters take."""
+    if kind == 'bool':
+        values = array.tolist()
+    elif kind == 'int':
+        values = array.tolist()
+    elif kind == 'decimal':
+        values = [Decimal(v).scaleb(-field.decimal_places) for v in array.tolist()]
+    elif kind == 'datetime':
+        values = [EPOCH + v * MICROSECOND for v in array.tolist()]
+    else:
+        values = [v.decode('utf-8') for v in array.tolist()]
+    if nulls is not None:
+        values = [None if null else v for v, null in zip(values, nulls.tolist())]
+    return values
+
+
+def _read_table(model, fields, using):
+    """Every row of the table, by pk, as {field: fixed-width array}, {field: null mask}."""
+    field_objs = [model._meta.get_field(name) for name in fields]
+    kinds = [_kind(f) for f in field_objs]
+    columns = [[] for _ in fields]
+    rows = model._base_manager.using(using).order_by('pk').values_list(*[f.attname for f in field_objs])
+    for row in rows.iterator(chunk_size=CHUNK):
+        for column, value in zip(columns, row):
+            column.append(value)
+    arrays, masks = {}, {}
+    for field, kind, values in zip(field_objs, kinds, columns):
+        arrays[field.name], masks[field.name] = _encode(field, kind, values)
+    return arrays, masks, len(columns[0]) if columns else 0
+
+
+def _pad(handle):
+    position = handle.tell()
+    if position % ALIGN:
+        handle.write(b'\0' * (ALIGN - position % ALIGN))
+
+
+def write_snapshot(path, using='default'):
+    """
+    Writes members, nodes, sponsor links and their users to one file: a JSON
+    header, then every column as a raw fixed-width array (64-byte aligned, so
+    read_snapshot can memory-map them). The same data always gives the same
+    bytes. Returns {table: rows}.
+    """
+    tables, blobs = {}, []
+    for name, model, fields in _tables():
+        arrays, masks, count = _read_table(model, fields, using)
+        columns = []
+        for field in fields:
+            entry = {'name': field, 'kind': _kind(model._meta.get_field(field)), 'dtype': arrays[field].dtype.str}
+            blobs.append((entry, 'offset', arrays[field]))
+            if masks[field] is not None:
+                blobs.append((entry, 'null_offset', masks[field]))
+            columns.append(entry)
+        tables[name] = {'rows': count, 'columns': columns}
+
+    # Offsets depend on the header length, which depends on the offsets: grow
+    # the header's slot until it fits
+    def header(base):
+        position = base
+        for entry, key, array in blobs:
+            entry[key] = position
+            position += -(-array.nbytes // ALIGN) * ALIGN
+        return json.dumps({'version': 1, 'tables': tables}, sort_keys=True).encode()
+
+    base = ALIGN
+    while True:
+        text = header(base)
+        needed = -(-(len(MAGIC) + 8 + len(text)) // ALIGN) * ALIGN
+        if needed <= base:
+            break
+        base = needed
+
+    with open(path, 'wb') as handle:
+        handle.write(MAGIC)
+        handle.write(len(text).to_bytes(8, 'little'))
+        handle.write(text)
+        handle.write(b'\0' * (base - handle.tell()))
+        for entry, key, array in blobs:
+            handle.write(array.tobytes())
+            _pad(handle)
+    return {name: table['rows'] for name, table in tables.items()}
+
+
+def read_snapshot(path):
+    """{table: (rows, {column: (entry, array, null mask)})} with every array memory-mapped from the file."""
+    with open(path, 'rb') as handle:
+        if handle.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a matrix snapshot")
+        length = int.from_bytes(handle.read(8), 'little')
+        meta = json.loads(handle.read(length))
+
+    def column(dtype, offset, rows):
+        if not rows:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(rows,))
+
+    tables = {}
+    for name, table in meta['tables'].items():
+        rows = table['rows']
+        tables[name] = (rows, {
+            entry['name']: (
+                entry,
+                column(entry['dtype'], entry['offset'], rows),
+                column(np.bool_, entry['null_offset'], rows) if 'null_offset' in entry else None,
+            )
+            for entry in table['columns']
+        })
+    return tables
+
+
+def _insert(connection, model, fields, columns, rows, extra=()):
+    """executemany INSERTs of INSERT_BATCH rows, straight from the decoded columns."""
+    names = [model._meta.get_field(name).column for name in fields] + [column for column, _ in extra]
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        connection.ops.quote_name(model._meta.db_table),
+        ', '.join(connection.ops.quote_name(name) for name in names),
+        ', '.join(['%s'] * len(names)),
+    )
+    constants = tuple(value for _, value in extra)
+    with connection.cursor() as cursor:
+        for start in range(0, rows, INSERT_BATCH):
+            batch = [column[start:start + INSERT_BATCH] for column in columns]
+            cursor.executemany(sql, [row + constants for row in zip(*batch)])
+
+
+@contextmanager
+def _indexes_dropped(connection, table):
+    """
+    Drops the table's secondary indexes for the load and builds them again
+    afterwards, which is much faster than keeping them up to date row by row
+    (SQLite and PostgreSQL; elsewhere the indexes stay).
+    """
+    if connection.vendor == 'sqlite':
+        query = "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = %s AND sql IS NOT NULL"
+    elif connection.vendor == 'postgresql':
+        # Indexes behind a constraint (primary key, unique) stay
+        query = (
+            "SELECT indexname, indexdef FROM pg_indexes WHERE tablename = %s "
+            "AND indexname NOT IN (SELECT conname FROM pg_constraint)"
+        )
+    else:
+        yield
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(query, [table])
+        indexes = cursor.fetchall()
+        for name, _ in indexes:
+            cursor.execute(f'DROP INDEX {connection.ops.quote_name(name)}')
+    yield
+    with connection.cursor() as cursor:
+        for _, sql in indexes:
+            cursor.execute(sql)
+
+
+def restore_snapshot(path, using='default'):
+    """
+    Loads a snapshot into a database without members, nodes or sponsor
+    links (users already there by pk are kept). Rows are inserted with raw
+    executemany batches, so no model is built and no signal runs; rebuild
+    the derived tables afterwards. The event log gets a reset marker and
+    the restored members and nodes as 'restore' events, so replay_events
+    starts from the snapshot. Returns {table: rows}.
+    """
+    tables = read_snapshot(path)
+    connection = connections[using]
+    for _, model, _ in _tables()[1:]:
+        if model._base_manager.using(using).exists():
+            raise ValueError(f"{model._meta.db_table} is not empty; restore needs a database without members")
+
+    restored = {}
+    # Like loaddata: foreign keys are checked once, after every table is in
+    with connection.constraint_checks_disabled(), transaction.atomic(using=using):
+        for name, model, _ in _tables():
+            rows, stored = tables[name]
+            fields = [column for column in stored]
+            decoded = []
+            for field_name in fields:
+                entry, array, nulls = stored[field_name]
+                field = model._meta.get_field(field_name)
+                values = _decode(field, entry['kind'], array, nulls)
+                if entry['kind'] == 'datetime':
+                    values = [connection.ops.adapt_datetimefield_value(v) for v in values]
+                decoded.append(values)
+
+            extra = ()
+            if model is User:
+                present = set(User.objects.using(using).values_list('pk', flat=True))
+                keep = [i for i, pk in enumerate(decoded[fields.index('id')]) if pk not in present]
+                decoded = [[values[i] for i in keep] for values in decoded]
+                rows = len(keep)
+                extra = (('password', '!'), ('first_name', ''), ('last_name', ''), ('email', ''))
+            with _indexes_dropped(connection, model._meta.db_table):
+                _insert(connection, model, fields, decoded, rows, extra)
+            restored[name] = rows
+
+        connection.check_constraints(table_names=[model._meta.db_table for _, model, _ in _tables()])
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), [model for _, model, _ in _tables()]):
+                cursor.execute(sql)
+        if events.enabled():
+            events.record_reset(using)
+            events.baseline_events(using, kind='restore')
+    return restored
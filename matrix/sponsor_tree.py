@@ -0,0 +1,141 @@
+from django.db import transaction
+from django.db.models import Count, IntegerField, Max, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from .models import MemberProfile, SponsorLink
+
+BATCH_SIZE = 500
+# A member has one link per sponsor above it, so the table holds the sum of all
+# sponsor depths: about n ln n rows for a random network, but n^2 / 2 for one
+# long chain (80k rows at 400 members). Team sizes count every level, so the
+# depth is not capped.
+
+
+@transaction.atomic
+def link_to_sponser(profile):
+    """
+    Moves profile (and everyone it sponsored) under profile.sponser in the
+    closure table. Safe to call again, it only rewrites rows that changed.
+    """
+    SponsorLink.objects.get_or_create(ancestor=profile, descendant=profile, defaults={'depth': 0})
+
+    current = SponsorLink.objects.filter(descendant=profile, depth=1).values_list('ancestor_id', flat=True).first()
+    if current == profile.sponser_id:
+        return
+
+    team = SponsorLink.objects.filter(ancestor=profile).values('descendant')
+    # Drop every link from the old upline into this branch
+    SponsorLink.objects.filter(descendant__in=team).exclude(ancestor__in=team).delete()
+
+    if profile.sponser_id is None:
+        return
+    subtree = list(SponsorLink.objects.filter(ancestor=profile).values_list('descendant_id', 'depth'))
+    if any(member_id == profile.sponser_id for member_id, _ in subtree):
+        # Sponsor sits inside this member's own team; linking it would make a loop
+        return
+
+    upline = SponsorLink.objects.filter(descendant_id=profile.sponser_id).values_list('ancestor_id', 'depth')
+    SponsorLink.objects.bulk_create([
+        SponsorLink(ancestor_id=ancestor_id, descendant_id=member_id, depth=above + below + 1)
+        for ancestor_id, above in upline
+        for member_id, below in subtree
+    ], batch_size=BATCH_SIZE)
+
+
+def detach_team(profile):
+    """Called before profile is deleted: its referrals lose their sponsor, so the upline loses their teams."""
+    below = SponsorLink.objects.filter(ancestor=profile, depth__gte=1).values('descendant')
+    team = SponsorLink.objects.filter(ancestor=profile).values('descendant')
+    SponsorLink.objects.filter(descendant__in=below).exclude(ancestor__in=team).delete()
+
+
+def team_counts(profile):
+    """
+    Directs and whole-team figures in one query: total, directs, max depth and
+    per-board counts (b1..b5 for the team, d1..d5 for the directs).
+    """
+    links = SponsorLink.objects.filter(ancestor=profile, depth__gte=1)
+    counts = {
+        'total': Count('pk'),
+        'directs': Count('pk', filter=Q(depth=1)),
+        'max_depth': Max('depth'),
+    }
+    for i in range(1, 6):
+        counts[f'b{i}'] = Count('pk', filter=Q(descendant__current_board=i))
+        counts[f'd{i}'] = Count('pk', filter=Q(depth=1, descendant__current_board=i))
+    result = links.aggregate(**counts)
+    result['max_depth'] = result['max_depth'] or 0
+    return result
+
+
+def team_by_depth(profile):
+    """{depth: members} for profile's whole team (1 = directs)."""
+    rows = SponsorLink.objects.filter(ancestor=profile, depth__gte=1).values('depth').annotate(members=Count('pk'))
+    return {row['depth']: row['members'] for row in rows.order_by('depth')}
+
+
+def team_by_board(profile):
+    """{board: members} for profile's whole team, by the board each member is on now."""
+    rows = SponsorLink.objects.filter(ancestor=profile, depth__gte=1).values('descendant__current_board').annotate(
+        members=Count('pk')
+    )
+    return {row['descendant__current_board']: row['members'] for row in rows}
+
+
+def sponsor_depth(profile):
+    """How many sponsors are above profile."""
+    return SponsorLink.objects.filter(descendant=profile, depth__gte=1).count()
+
+
+def _link_count(**lookups):
+    links = SponsorLink.objects.filter(ancestor=OuterRef('pk'), **lookups).order_by().values('ancestor').annotate(
+        members=Count('pk')
+    ).values('members')
+    return Coalesce(Subquery(links, output_field=IntegerField()), Value(0))
+
+
+def annotate_team(queryset):
+    """
+    Adds direct_count and team_size to a MemberProfile queryset. Both are
+    grouped subqueries on the (ancestor, depth) index, so only the rows that
+    are actually fetched (one admin page) get counted, no GROUP BY over the
+    whole table.
+    """
+    return queryset.annotate(direct_count=_link_count(depth=1), team_size=_link_count(depth__gte=1))
+
+
+@transaction.atomic
+def rebuild_sponsor_links():
+    """
+    Rebuilds the whole closure table from the sponser column. Returns how many
+    links were written.
+    """
+    sponser_of = dict(MemberProfile.objects.values_list('pk', 'sponser_id'))
+    referrals = {}
+    for member_id, sponser_id in sponser_of.items():
+        if sponser_id in sponser_of:
+            referrals.setdefault(sponser_id, []).append(member_id)
+
+    SponsorLink.objects.all().delete()
+    links = []
+    done = set()
+    # Start from the tops; members caught in a sponsor loop are left on their own
+    stack = [(member_id, []) for member_id, sponser_id in sponser_of.items() if sponser_id not in sponser_of]
+    while stack:
+        member_id, upline = stack.pop()
+        done.add(member_id)
+        links.append(SponsorLink(ancestor_id=member_id, descendant_id=member_id, depth=0))
+        for depth, ancestor_id in enumerate(reversed(upline), start=1):
+            links.append(SponsorLink(ancestor_id=ancestor_id, descendant_id=member_id, depth=depth))
+        for child_id in referrals.get(member_id, []):
+            stack.append((child_id, upline + [member_id]))
+
+        if len(links) >= BATCH_SIZE * 10:
+            SponsorLink.objects.bulk_create(links, batch_size=BATCH_SIZE)
+            links = []
+
+    links.extend(
+        SponsorLink(ancestor_id=member_id, descendant_id=member_id, depth=0)
+        for member_id in sponser_of if member_id not in done
+    )
+    SponsorLink.objects.bulk_create(links, batch_size=BATCH_SIZE)
+    return SponsorLink.objects.count()
@@ -0,0 +1,132 @@
+import random
+from collections import defaultdict
+from datetime import datetime, time as day_start, timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+from .models import BoardCycle, MemberProfile, StatCounter, WithdrawalRequest
+from .revenue import revenue_totals, shard_count
+
+SNAPSHOT_KEY = 'matrix:stats:snapshot'
+BOARDS = range(1, 6)
+# Active members per current board; their sum is the active member count
+BOARD_NAMES = [f'board_{b}' for b in BOARDS]
+PENDING_NAMES = ['pending_count', 'pending_sum']
+KEEP_DAYS = 7
+
+
+def cache_seconds():
+    return getattr(settings, 'MATRIX_STATS_CACHE_SECONDS', 30)
+
+
+def recompute_seconds():
+    return getattr(settings, 'MATRIX_STATS_RECOMPUTE_SECONDS', 3600)
+
+
+def cycles_name(day=None):
+    return f'cycles:{(day or timezone.localdate()).isoformat()}'
+
+
+def _add(**deltas):
+    """
+    Adds deltas (name -> number) to one shard picked at random, spread like
+    the revenue counters (MATRIX_REVENUE_SHARDS). Runs in the caller's transaction.
+    """
+    shard = random.randrange(shard_count())
+    for name, delta in deltas.items():
+        if not delta:
+            continue
+        if not StatCounter.objects.filter(name=name, shard=shard).update(value=F('value') + delta):
+            StatCounter.objects.get_or_create(name=name, shard=shard)
+            StatCounter.objects.filter(name=name, shard=shard).update(value=F('value') + delta)
+
+
+def members_moved(left=None, joined=None, count=1):
+    """count active members left board `left` and/or joined board `joined` (None = not active)."""
+    deltas = {}
+    if left in BOARDS:
+        deltas[f'board_{left}'] = -count
+    if joined in BOARDS:
+        deltas[f'board_{joined}'] = deltas.get(f'board_{joined}', 0) + count
+    _add(**deltas)
+
+
+def pending_changed(count, amount):
+    _add(pending_count=count, pending_sum=amount)
+
+
+def cycle_recorded():
+    _add(**{cycles_name(): 1})
+
+
+def platform_stats(use_cache=True):
+    """
+    The admin summary figures: active members, members per board, pending
+    withdrawals, cycles today and the revenue totals. One grouped query over
+    the counter rows (cached for MATRIX_STATS_CACHE_SECONDS), whatever the
+    number of members.
+    """
+    snapshot = cache.get(SNAPSHOT_KEY) if use_cache else None
+    if snapshot is None:
+        today = cycles_name()
+        sums = dict(
+            StatCounter.objects.filter(name__in=[*BOARD_NAMES, *PENDING_NAMES, today])
+            .values('name').annotate(total=Sum('value')).values_list('name', 'total')
+        )
+        boards = {b: int(sums.get(f'board_{b}', 0)) for b in BOARDS}
+        snapshot = {
+            'active_members': sum(boards.values()),
+            'boards': boards,
+            'pending_withdrawals': int(sums.get('pending_count', 0)),
+            'pending_withdrawals_total': sums.get('pending_sum') or Decimal('0.00'),
+            'cycles_today': int(sums.get(today, 0)),
+            'revenue': revenue_totals(),
+            'as_of': timezone.now(),
+        }
+        cache.set(SNAPSHOT_KEY, snapshot, cache_seconds())
+    return snapshot
+
+
+def exact_stats():
+    """{counter name: value} counted from the tables themselves (what recompute_stats brings the counters to)."""
+    members = MemberProfile.objects.aggregate(**{
+        f'board_{b}': Count('pk', filter=Q(is_active=True, current_board=b)) for b in BOARDS
+    })
+    pending = WithdrawalRequest.objects.filter(status__iexact='pending').aggregate(
+        pending_count=Count('pk'), pending_sum=Sum('amount')
+    )
+    midnight = timezone.make_aware(datetime.combine(timezone.localdate(), day_start.min))
+    cycles = BoardCycle.objects.filter(created_at__gte=midnight).count()
+    return {**members, 'pending_count': pending['pending_count'], 'pending_sum': pending['pending_sum'] or 0, cycles_name(): cycles}
+
+
+@transaction.atomic
+def recompute_stats():
+    """
+    Brings the counters to their exact values and drops day counters older
+    than KEEP_DAYS. Every (name, shard) row is created up front and locked, so
+    a concurrent increment waits on the lock instead of starting a row the
+    lock missed. Each counter then gets (exact - locked total) added to shard
+    0, so an increment applied after the lock stays on top instead of being
+    overwritten. Returns the exact values.
+    """
+    names = [*BOARD_NAMES, *PENDING_NAMES, cycles_name()]
+    StatCounter.objects.bulk_create(
+        [StatCounter(name=name, shard=shard) for name in names for shard in range(shard_count())],
+        ignore_conflicts=True
+    )
+    locked = defaultdict(Decimal)
+    for name, value in StatCounter.objects.select_for_update().filter(name__in=names).values_list('name', 'value'):
+        locked[name] += value
+    exact = exact_stats()
+    for name, value in exact.items():
+        delta = Decimal(value) - locked[name]
+        if delta:
+            StatCounter.objects.filter(name=name, shard=0).update(value=F('value') + delta)
+    oldest = cycles_name(timezone.localdate() - timedelta(days=KEEP_DAYS))
+    StatCounter.objects.filter(name__startswith='cycles:', name__lt=oldest).delete()
+    transaction.on_commit(lambda: cache.delete(SNAPSHOT_KEY))
+    return exact
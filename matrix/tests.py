@@ -1,3 +1,1151 @@
-from django.test import TestCase
+import io
+import json
+import os
+import tempfile
+from collections import deque
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import Count, F, Q
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import board_index, cascade, frontier, jobs, metrics, revenue, stats
+from .activation import activate_one, bulk_activate
+from .cascade import CascadeLimitError
+from .benchmark import generate_network, replay_activations, run_tier
+from .board_index import board_ancestors, place_node
+from .board_cache import BOARDS, child_fields, count_field, earned_field, nearly_full, open_slots, rebuild_board_cache
+from .dashboard import dashboard_key
+from .downline import downline_key, get_downline
+from .sponsor_tree import rebuild_sponsor_links, team_counts
+from .events import compare, replay
+from .frontier import next_open_slot, record_fill
+from .ledger import reconcile_ledger
+from .tracing import span
+from .logic import get_board_trees, sync_board_count
+from .models import AdminRevenue, BoardCycle, BoardFrontier, BoardReportCache, MatrixEvent, MatrixJob, MatrixNode, MemberProfile, RequestMetric, SponsorLink, Transaction, WithdrawalRequest
+from .revenue import record_fee, record_withdrawal, revenue_totals
+from .simulation import MatrixSimulation, simulate_joins, verify
+from .recount import board_fills, recount_boards
+from .snapshot import restore_snapshot, write_snapshot
+from .withdrawals import approve_withdrawals, payout_rows, reconcile_pending_withdrawals
+
+
+class FrontierTests(TestCase):
+    """The frontier must keep answering what a breadth-first walk of the FK columns finds."""
+
+    def bfs_open_slot(self, root_pk, board):
+        children = dict(
+            (pk, (left, right)) for pk, left, right in
+            MemberProfile.objects.values_list('pk', f'left_child_b{board}_id', f'right_child_b{board}_id')
+        )
+        queue, seen = deque([(root_pk, 1)]), {root_pk}
+        while queue:
+            pk, index = queue.popleft()
+            for position, child in enumerate(children[pk], start=1):
+                slot_index = 2 * index + position - 1
+                if child is None:
+                    return pk, position, slot_index
+                if child not in seen:
+                    seen.add(child)
+                    queue.append((child, slot_index))
+        return None
+
+    def assert_frontiers_match(self):
+        roots = set(BoardFrontier.objects.values_list('root_id', 'board'))
+        self.assertTrue(roots)
+        for root_pk, board in roots:
+            parent, position = next_open_slot(MemberProfile.objects.get(pk=root_pk), board)
+            first = BoardFrontier.objects.filter(root_id=root_pk, board=board).order_by('slot_index').first()
+            self.assertEqual((parent.pk, position, first.slot_index), self.bfs_open_slot(root_pk, board))
+
+    def test_matches_a_bfs_after_placements_cycles_and_deletes(self):
+        members = generate_network(80, 'random', seed=4, prefix='fr')
+        replay_activations(members[1:61])
+        # handle_cycle released slots (record_release) along the way
+        self.assertTrue(Transaction.objects.filter(tx_type='UPGRADE', detail__contains=' Complete').exists())
+        self.assert_frontiers_match()
+
+        User.objects.filter(username__in=['fr-3', 'fr-17', 'fr-30']).delete()
+        self.assert_frontiers_match()
+        replay_activations(members[61:])
+        self.assert_frontiers_match()
+
+    def test_slots_past_max_slot_index_are_left_out(self):
+        root, left, right = (User.objects.create(username=name).memberprofile for name in ('top', 'l', 'r'))
+        MemberProfile.objects.filter(pk=root.pk).update(left_child_b1=left)
+        with mock.patch.object(frontier, 'MAX_SLOT_INDEX', 4):
+            self.assertEqual(next_open_slot(root, 1), (root, 2))
+            MemberProfile.objects.filter(pk=root.pk).update(right_child_b1=right)
+            record_fill(root, 2, right, 1)
+            # Everything below the shoulders would be numbered 4 or higher
+            self.assertEqual(next_open_slot(root, 1), (None, None))
+        self.assertEqual(next_open_slot(root, 1), (left, 1))
+
+
+class BoardIndexTests(TestCase):
+    """board_ancestors (slot numbering) must agree with the stored parent links and the FK slots."""
+
+    def assert_ancestors_match(self):
+        checked = 0
+        for b in range(1, 6):
+            # The oldest node of a member counts, like _node_of
+            parents = dict(MatrixNode.objects.filter(board=b).order_by('-pk').values_list('user__memberprofile__id', 'parent_profile_id'))
+            held_by = {}
+            for pk, left, right in MemberProfile.objects.values_list('pk', f'left_child_b{b}_id', f'right_child_b{b}_id'):
+                held_by.update({child: pk for child in (left, right) if child})
+            for member_pk, parent_pk in parents.items():
+                if member_pk is None:
+                    continue
+                found = [a.pk if a else None for a in board_ancestors(MemberProfile.objects.get(pk=member_pk), b)]
+                self.assertEqual(found, [parent_pk, parents.get(parent_pk) if parent_pk else None])
+                if parent_pk != member_pk:  # a superuser placed under itself holds no slot
+                    self.assertEqual(held_by.get(member_pk), parent_pk)
+                checked += 1
+        self.assertGreater(checked, 40)
+
+    def activate_delete_activate(self, prefix):
+        members = generate_network(70, 'random', seed=4, prefix=prefix)
+        replay_activations(members[1:51])
+        self.assertTrue(Transaction.objects.filter(tx_type='UPGRADE', detail__contains=' Complete').exists())
+        self.assert_ancestors_match()
+        User.objects.filter(username__in=[f'{prefix}-3', f'{prefix}-17', f'{prefix}-30']).delete()
+        self.assert_ancestors_match()
+        # Cycled members re-enter their next board, deleted sponsors fall back to no one
+        replay_activations(members[51:])
+        self.assert_ancestors_match()
+
+    def test_after_cycles_re_entries_and_deletes(self):
+        self.activate_delete_activate('bi')
+
+    def test_reframed_trees(self):
+        with mock.patch.object(board_index, 'FRAME_LIMIT', 4):
+            self.activate_delete_activate('rf')
+            # Members numbered 4 or more number their children from themselves
+            reframed = MatrixNode.objects.filter(
+                tree_root__isnull=False, slot_index__in=[2, 3],
+                tree_root__user__matrix_positions__board=F('board'),
+                tree_root__user__matrix_positions__slot_index__gte=4,
+            )
+            self.assertTrue(reframed.exists())
+
+    def test_sync_board_count_goes_by_the_fk_slots(self):
+        # A member that cycled out of the board has no node there but keeps its parent's slot
+        root, left, right, below = (User.objects.create(username=name).memberprofile for name in ('top', 'l', 'r', 'll'))
+        MemberProfile.objects.filter(pk=root.pk).update(left_child_b2=left, right_child_b2=right, board_2_count=0)
+        MemberProfile.objects.filter(pk=left.pk).update(left_child_b2=below)
+        place_node(right, root, 2, 2)
+        sync_board_count(root, 2)
+        self.assertEqual(root.board_2_count, 3)
+
+
+class SponsorTreeTests(TestCase):
+    """The closure table must hold exactly the links the sponser column gives."""
+
+    def assert_links_match(self):
+        sponser_of = dict(MemberProfile.objects.values_list('pk', 'sponser_id'))
+        expected = set()
+        for member in sponser_of:
+            above, depth = member, 0
+            while above is not None:
+                expected.add((above, member, depth))
+                above, depth = sponser_of[above], depth + 1
+        self.assertEqual(set(SponsorLink.objects.values_list('ancestor_id', 'descendant_id', 'depth')), expected)
+
+    def test_insert_re_sponsor_and_delete(self):
+        members = {'root': User.objects.create(username='root').memberprofile}
+        for name, sponsor in (('a', 'root'), ('b', 'root'), ('a1', 'a'), ('a2', 'a'), ('a11', 'a1'), ('b1', 'b')):
+            members[name] = User.objects.create(username=name).memberprofile
+            members[name].sponser = members[sponsor]
+            members[name].save()
+        self.assert_links_match()
+        self.assertEqual(team_counts(members['a'])['total'], 3)
+
+        # a1 takes a11 along under b1
+        members['a1'].sponser = members['b1']
+        members['a1'].save()
+        self.assert_links_match()
+        self.assertEqual(team_counts(members['a'])['total'], 1)
+        self.assertEqual(team_counts(members['b'])['max_depth'], 3)
+
+        # a1 and a11 are left without an upline
+        members['b1'].user.delete()
+        self.assert_links_match()
+        self.assertEqual(team_counts(members['root'])['total'], 3)
+
+        links = SponsorLink.objects.count()
+        self.assertEqual(rebuild_sponsor_links(), links)
+        self.assert_links_match()
+
+
+class BulkActivationTests(TestCase):
+    """bulk_activate must leave exactly what activating the same members one by one leaves."""
+
+    def activated(self, activate):
+        """State of a generated network after activate(members), keyed by username; rolled back."""
+        with transaction.atomic():
+            members = generate_network(60, 'random', seed=5, prefix='ba')
+            result = activate(members[1:])
+            names = dict(MemberProfile.objects.values_list('pk', 'user__username'))
+            slots = [f'{field}_id' for b in BOARDS for field in child_fields(b)]
+            fields = [
+                'balance', 'wallet', 'nfg_balance', 'current_board', 'cycle_count', 'is_position_locked',
+                *[count_field(b) for b in BOARDS], *[earned_field(b) for b in BOARDS], *slots,
+            ]
+            state = {
+                row['user__username']: {field: names.get(row[field]) if field in slots else row[field] for field in fields}
+                for row in MemberProfile.objects.values('user__username', *fields)
+            }
+            ledger = [
+                (names[pk], tx_type, amount, detail) for pk, tx_type, amount, detail in
+                Transaction.objects.order_by('pk').values_list('profile_id', 'tx_type', 'amount', 'detail')
+            ]
+            transaction.set_rollback(True)
+        return state, ledger, result
+
+    def test_same_result_as_one_by_one(self):
+        state, ledger, _ = self.activated(lambda members: [activate_one(m) for m in members])
+        bulk_state, bulk_ledger, summaries = self.activated(
+            lambda members: bulk_activate(MemberProfile.objects.filter(pk__in=[m.pk for m in members]), batch_size=25)
+        )
+        self.assertEqual(bulk_state, state)
+        self.assertEqual(bulk_ledger, ledger)
+
+        # Both paths ran: planned placements and the activate_one fallback for cycles/upgrades
+        self.assertEqual(len(summaries), 3)
+        self.assertGreater(sum(s['planned'] for s in summaries), 0)
+        self.assertGreater(sum(s['one_by_one'] for s in summaries), 0)
+        self.assertGreater(sum(s['cycles'] for s in summaries), 0)
+
+
+class MatrixJobTests(TestCase):
+
+    def setUp(self):
+        self.profile = User.objects.create(username='queued').memberprofile
+        self.runs = []
+        handler = (lambda job: self.runs.append(job.pk), False)
+        self.enterContext(mock.patch.dict(jobs.HANDLERS, {'spillover': handler}))
+
+    def test_claims_due_jobs_once(self):
+        due = MatrixJob.objects.create(kind='spillover', profile=self.profile)
+        MatrixJob.objects.create(kind='spillover', profile=self.profile, run_after=timezone.now() + timedelta(minutes=1))
+        claimed = jobs.claim_jobs()
+        self.assertEqual([job.pk for job in claimed], [due.pk])
+        self.assertEqual(jobs.claim_jobs(), [])
+        self.assertEqual(jobs.run_jobs(claimed), (1, 0))
+        self.assertEqual(self.runs, [due.pk])
+        self.assertEqual(MatrixJob.objects.get(pk=due.pk).status, 'done')
+
+    def test_failures_back_off_then_give_up(self):
+        def boom(job):
+            raise RuntimeError('no slot')
+        job = MatrixJob.objects.create(kind='spillover', profile=self.profile, max_attempts=3)
+        with mock.patch.dict(jobs.HANDLERS, {'spillover': (boom, False)}):
+            for attempt, wait in ((1, 30), (2, 60)):
+                before = timezone.now()
+                self.assertEqual(jobs.run_jobs(jobs.claim_jobs()), (0, 1))
+                job.refresh_from_db()
+                self.assertEqual((job.status, job.attempts), ('pending', attempt))
+                self.assertIn('no slot', job.last_error)
+                self.assertGreaterEqual(job.run_after, before + timedelta(seconds=wait))
+                self.assertLess(job.run_after, before + timedelta(seconds=wait + 5))
+                self.assertEqual(jobs.claim_jobs(), [])
+                MatrixJob.objects.filter(pk=job.pk).update(run_after=timezone.now())
+            jobs.run_jobs(jobs.claim_jobs())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', 3))
+
+    def test_expired_lease_is_claimed_again_and_run_once(self):
+        job = MatrixJob.objects.create(kind='spillover', profile=self.profile)
+        first = jobs.claim_jobs()
+        MatrixJob.objects.filter(pk=job.pk).update(claimed_at=timezone.now() - jobs.LEASE - timedelta(seconds=1))
+        second = jobs.claim_jobs()
+        self.assertEqual([j.pk for j in second], [job.pk])
+
+        # The first worker lost its claim and leaves the job to the second one
+        self.assertEqual(jobs.run_jobs(first), (0, 0))
+        self.assertEqual(jobs.run_jobs(second), (1, 0))
+        self.assertEqual(self.runs, [job.pk])
+        self.assertEqual(jobs.claim_jobs(), [])
+
+
+class CascadeTests(TestCase):
+    """The work list must pay out exactly what the nested calls it replaced paid."""
+
+    # Sponsor of member i (index into root, m1, m2, ...) and what the recursive engine
+    # (before the work list) left after activating m1..m24 in order
+    SPONSORS = [0, 0, 1, 0, 0, 4, 0, 5, 0, 8, 3, 0, 1, 6, 6, 2, 7, 2, 17, 13, 1, 18, 3, 7]
+    # balance, wallet, nfg_balance, cycle_count, current_board; everyone else is untouched
+    MEMBERS = {
+        'root': ('180.00', '180.00', '110.00', 2, 2),
+        'm1': ('30.00', '30.00', '110.00', 2, 2),
+        'm2': ('30.00', '30.00', '110.00', 2, 2),
+        'm3': ('100.00', '100.00', '0.00', 0, 1),
+        'm4': ('50.00', '50.00', '0.00', 0, 1),
+        'm7': ('150.00', '150.00', '0.00', 0, 1),
+    }
+    LEDGER = [
+        ('root', 'CYCLE', '50.00', 'Board 1 payline bonus from m3'),
+        ('root', 'CYCLE', '50.00', 'Board 1 payline bonus from m4'),
+        ('root', 'CYCLE', '50.00', 'Board 1 payline bonus from m5'),
+        ('m1', 'CYCLE', '50.00', 'Board 1 payline bonus from m6'),
+        ('root', 'CYCLE', '50.00', 'Board 1 payline bonus from m7'),
+        ('root', 'AIRDROP', '110.00', 'NFG Reward for Board 1 Completion'),
+        ('root', 'UPGRADE', '-170.00', 'Board 1 Complete. Fee + Upgrade to Board 2'),
+        ('m2', 'CYCLE', '50.00', 'Board 1 payline bonus from m8'),
+        ('m1', 'CYCLE', '50.00', 'Board 1 payline bonus from m11'),
+        ('m1', 'CYCLE', '50.00', 'Board 1 payline bonus from m13'),
+        ('m4', 'CYCLE', '50.00', 'Board 1 payline bonus from m15'),
+        ('m2', 'CYCLE', '50.00', 'Board 1 payline bonus from m16'),
+        ('m2', 'CYCLE', '50.00', 'Board 1 payline bonus from m17'),
+        ('m2', 'CYCLE', '50.00', 'Board 1 payline bonus from m18'),
+        ('m2', 'AIRDROP', '110.00', 'NFG Reward for Board 1 Completion'),
+        ('m2', 'UPGRADE', '-170.00', 'Board 1 Complete. Fee + Upgrade to Board 2'),
+        ('m7', 'CYCLE', '50.00', 'Board 1 payline bonus from m19'),
+        ('m3', 'CYCLE', '50.00', 'Board 1 payline bonus from m20'),
+        ('m1', 'CYCLE', '50.00', 'Board 1 payline bonus from m21'),
+        ('m1', 'AIRDROP', '110.00', 'NFG Reward for Board 1 Completion'),
+        ('m1', 'UPGRADE', '-170.00', 'Board 1 Complete. Fee + Upgrade to Board 2'),
+        ('root', 'CYCLE', '150.00', 'Board 2 payline bonus from m1'),
+        ('m7', 'CYCLE', '50.00', 'Board 1 payline bonus from m22'),
+        ('m3', 'CYCLE', '50.00', 'Board 1 payline bonus from m23'),
+        ('m7', 'CYCLE', '50.00', 'Board 1 payline bonus from m24'),
+    ]
+
+    def test_recorded_activations(self):
+        members = [User.objects.create_superuser('root', password=None).memberprofile]
+        for i, sponsor in enumerate(self.SPONSORS, start=1):
+            profile = User.objects.create(username=f'm{i}').memberprofile
+            profile.sponser = members[sponsor]
+            profile.save()
+            members.append(profile)
+        for profile in members[1:]:
+            profile.refresh_from_db()
+            activate_one(profile)
+
+        ledger = [
+            (name, tx_type, str(amount), detail) for name, tx_type, amount, detail in
+            Transaction.objects.order_by('pk').values_list('profile__user__username', 'tx_type', 'amount', 'detail')
+        ]
+        self.assertEqual(ledger, self.LEDGER)
+        earned = {}
+        for name, tx_type, amount, detail in self.LEDGER:
+            if tx_type == 'CYCLE':
+                key = (name, int(detail.split()[1]))
+                earned[key] = earned.get(key, Decimal('0.00')) + Decimal(amount)
+
+        fields = ['balance', 'wallet', 'nfg_balance', 'cycle_count', 'current_board', *[earned_field(b) for b in BOARDS]]
+        for name, *values in MemberProfile.objects.values_list('user__username', *fields):
+            expected = self.MEMBERS.get(name, ('0.00', '0.00', '0.00', 0, 1))
+            self.assertEqual(
+                values,
+                [Decimal(v) for v in expected[:3]] + list(expected[3:]) + [earned.get((name, b), Decimal('0.00')) for b in BOARDS],
+                name
+            )
+
+    def test_runaway_cascade_is_stopped(self):
+        def again():
+            cascade.run(again)
+        with self.assertRaises(CascadeLimitError):
+            cascade.run(again)
+        self.assertIsNone(cascade.active())
+        self.assertEqual(cascade.last_stats()['steps'], cascade.MAX_STEPS + 1)
+
+    def test_failure_rolls_back_the_deferred_credits(self):
+        profile = User.objects.create(username='payee').memberprofile
+
+        def pay():
+            MemberProfile.objects.filter(pk=profile.pk).update(board_1_count_value=F('board_1_count_value') + 1)
+            cascade.credit(profile, wallet=Decimal('50.00'), balance=Decimal('50.00'))
+            cascade.record_transaction(profile, 'CYCLE', Decimal('50.00'), 'bonus')
+            cascade.run(fail)
+
+        def fail():
+            raise ValueError('broken tree')
+
+        with self.assertRaises(ValueError):
+            cascade.run(pay)
+        profile.refresh_from_db()
+        self.assertEqual((profile.wallet, profile.balance, profile.board_1_count_value), (0, 0, 0))
+        self.assertFalse(Transaction.objects.exists())
+        self.assertIsNone(cascade.active())
+
+
+class BoardTreeQueryTests(TestCase):
+    """The board tree pages must not go back to one query per slot."""
+
+    @classmethod
+    def setUpTestData(cls):
+        profiles = {}
+        for name in ('root', 'l', 'r', 'll', 'lr', 'rl', 'rr'):
+            profiles[name] = User.objects.create_user(name, password='pass').memberprofile
+        cls.root = profiles['root']
+
+        # Same full 2x2 on every board, wired straight into the FK columns
+        for b in range(1, 6):
+            for parent, left, right in (('root', 'l', 'r'), ('l', 'll', 'lr'), ('r', 'rl', 'rr')):
+                MemberProfile.objects.filter(pk=profiles[parent].pk).update(**{
+                    f'left_child_b{b}': profiles[left],
+                    f'right_child_b{b}': profiles[right],
+                })
+
+    def test_all_boards_load_in_two_queries(self):
+        with self.assertNumQueries(2):
+            trees = get_board_trees(self.root)
+            names = [
+                node.user.username
+                for tree in trees.values()
+                for node in [tree['root'], *tree['shoulders'].values(), *tree['payline'].values()]
+            ]
+        self.assertEqual(names[:7], ['root', 'l', 'r', 'll', 'lr', 'rl', 'rr'])
+        self.assertEqual(len(names), 35)
+
+    def test_empty_payline_skips_second_query(self):
+        lone = User.objects.create_user('lone', password='pass').memberprofile
+        with self.assertNumQueries(1):
+            tree = get_board_trees(lone, [1])[1]
+        self.assertIsNone(tree['shoulders']['left'])
+        self.assertIsNone(tree['payline']['rr'])
+
+    def test_member_tree_page_query_count(self):
+        self.client.force_login(self.root.user)
+        # session + user + profile, then the two tree queries
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse('matrix_tree'), {'board': '3'})
+        self.assertContains(response, 'rr')
+
+    def test_admin_matrix_view_query_count(self):
+        admin = User.objects.create_superuser('boss', password='pass')
+        self.client.force_login(admin)
+        # session + user + get_object, then the two tree queries for all five boards
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse('admin:member-matrix', args=[self.root.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Board 5')
+
+
+class DashboardCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.sponsor = User.objects.create_user('sponsor', password='pass').memberprofile
+        cls.member = User.objects.create_user('member', password='pass').memberprofile
+        cls.member.sponser = cls.sponsor
+        cls.member.save()
+        MemberProfile.objects.filter(pk=cls.sponsor.pk).update(left_child_b1=cls.member, board_1_count_value=1)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.sponsor.user)
+
+    def test_cached_dashboard_skips_matrix_queries(self):
+        # session + user, then the profile with its shoulders and the team aggregate
+        with self.assertNumQueries(4):
+            self.client.get(reverse('dashboard'))
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.context['d1'], 1)
+        self.assertEqual(response.context['nodes']['b1']['l'], self.member)
+
+    def test_events_drop_the_cached_dashboard(self):
+        self.client.get(reverse('dashboard'))
+        with self.captureOnCommitCallbacks(execute=True):
+            cascade.credit(self.sponsor, wallet=Decimal('50.00'))
+        self.assertIsNone(cache.get(dashboard_key(self.sponsor.user_id)))
+
+        self.client.get(reverse('dashboard'))
+        with self.captureOnCommitCallbacks(execute=True):
+            WithdrawalRequest.objects.create(user=self.sponsor.user, amount=Decimal('20.00'), wallet_address='x')
+        self.assertIsNone(cache.get(dashboard_key(self.sponsor.user_id)))
+
+        response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.context['profile'].wallet, Decimal('50.00'))
+
+
+class BoardReportCacheTests(TestCase):
+
+    def assertCacheMatchesProfiles(self):
+        reports = {(r.profile_id, r.board): r for r in BoardReportCache.objects.all()}
+        self.assertEqual(len(reports), MemberProfile.objects.count() * len(BOARDS))
+        cycles = {
+            (pk, board): count for pk, board, count in
+            BoardCycle.objects.values_list('profile_id', 'board').annotate(count=Count('pk'))
+        }
+        for profile in MemberProfile.objects.all():
+            for b in BOARDS:
+                report = reports[profile.pk, b]
+                left, right = child_fields(b)
+                self.assertEqual(report.count, getattr(profile, count_field(b)))
+                self.assertEqual(
+                    (report.left_child_id, report.right_child_id),
+                    (getattr(profile, f'{left}_id'), getattr(profile, f'{right}_id'))
+                )
+                self.assertEqual(report.earned, getattr(profile, earned_field(b)))
+                self.assertEqual(report.cycles, cycles.get((profile.pk, b), 0))
+
+    def test_kept_current_by_placement_without_a_rebuild(self):
+        members = generate_network(40, 'random', seed=3, prefix='bs')
+        replay_activations(members[1:])
+        self.assertCacheMatchesProfiles()
+
+        # One BoardCycle row per "Board N Complete" ledger row, written as the member cycled
+        completed = Transaction.objects.filter(tx_type='UPGRADE', detail__contains=' Complete')
+        self.assertTrue(completed.exists())
+        self.assertEqual(
+            sorted(BoardCycle.objects.values_list('profile_id', 'board')),
+            sorted((pk, int(detail.split()[1])) for pk, detail in completed.values_list('profile_id', 'detail'))
+        )
+        self.assertEqual(
+            set(open_slots(1).values_list('profile_id', flat=True)),
+            set(MemberProfile.objects.filter(Q(left_child_b1=None) | Q(right_child_b1=None)).values_list('pk', flat=True))
+        )
+
+    def test_saving_a_member_refreshes_its_rows(self):
+        profile = User.objects.create_user('saved').memberprofile
+        profile.board_2_count = 5
+        profile.save()
+        self.assertEqual(list(nearly_full(2).values_list('profile_id', flat=True)), [profile.pk])
+
+        # Writes that go around cascade.touch are picked up by a rebuild
+        MemberProfile.objects.filter(pk=profile.pk).update(board_2_count=3)
+        self.assertEqual(BoardReportCache.objects.get(profile=profile, board=2).count, 5)
+        rebuild_board_cache()
+        self.assertEqual(BoardReportCache.objects.get(profile=profile, board=2).count, 3)
+
+        self.client.force_login(profile.user)
+        self.assertEqual(self.client.get(reverse('matrix_data'), {'board': 2}).json()['count'], 3)
+
+
+class RevenueShardTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    @override_settings(MATRIX_REVENUE_SHARDS=4)
+    def test_fees_add_up_across_shards(self):
+        fees = [(Decimal('12.50'), 1), (Decimal('30.00'), 2), (Decimal('7.25'), 1), (Decimal('100.00'), 5), (Decimal('5.00'), None)]
+        shards = iter(range(len(fees) + 1))
+        with mock.patch.object(revenue.random, 'randrange', side_effect=lambda n: next(shards) % n):
+            for amount, board_level in fees:
+                record_fee(amount, board_level)
+            record_withdrawal(Decimal('40.00'))
+        self.assertEqual(AdminRevenue.objects.count(), 4)
+
+        totals = revenue_totals(use_cache=False)
+        self.assertEqual(totals['total_fees_collected'], Decimal('154.75'))
+        self.assertEqual(totals['total_withdrawals_processed'], Decimal('40.00'))
+        self.assertEqual(
+            [totals[f'b{b}_fees'] for b in range(1, 6)],
+            [Decimal('19.75'), Decimal('30.00'), 0, 0, Decimal('100.00')]
+        )
+
+    def test_a_committed_fee_drops_the_cached_totals(self):
+        self.assertIsNone(revenue_totals())
+        with self.captureOnCommitCallbacks(execute=True):
+            record_fee(Decimal('10.00'), 3)
+        self.assertEqual(revenue_totals()['b3_fees'], Decimal('10.00'))
+        with self.captureOnCommitCallbacks(execute=True):
+            record_fee(Decimal('2.50'), 3)
+        self.assertEqual(revenue_totals()['total_fees_collected'], Decimal('12.50'))
+
+
+class PendingWithdrawalTests(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user('withdrawer')
+        MemberProfile.objects.filter(user=user).update(balance=Decimal('500.00'), wallet=Decimal('500.00'))
+        self.user = User.objects.get(pk=user.pk)
+
+    def request(self, amount):
+        return WithdrawalRequest.objects.create(user=self.user, amount=Decimal(amount), wallet_address='addr')
+
+    def assert_pending(self, amount):
+        self.assertEqual(MemberProfile.objects.get(user=self.user).pending_withdrawals, Decimal(amount))
+        self.assertEqual(reconcile_pending_withdrawals(), [])
+
+    def test_pending_total_follows_the_requests(self):
+        paid, cancelled, deleted = self.request('100.00'), self.request('50.00'), self.request('20.00')
+        self.assert_pending('170.00')
+
+        paid.status = 'Paid'
+        paid.save()
+        self.assert_pending('70.00')
+        self.assertEqual(MemberProfile.objects.get(user=self.user).balance, Decimal('400.00'))
+
+        cancelled.amount = Decimal('60.00')
+        cancelled.save()
+        self.assert_pending('80.00')
+        cancelled.status = 'Cancelled'
+        cancelled.save()
+        self.assert_pending('20.00')
+
+        deleted.delete()
+        self.assert_pending('0.00')
+        paid.delete()
+        cancelled.delete()
+        self.assert_pending('0.00')
+
+    def test_reconcile_finds_and_repairs_a_mismatch(self):
+        self.request('30.00')
+        other = User.objects.create_user('other')
+        WithdrawalRequest.objects.create(user=other, amount=Decimal('10.00'), wallet_address='addr')
+        # Written behind the model's back: one total is off, one request changed status unseen
+        MemberProfile.objects.filter(user=self.user).update(pending_withdrawals=Decimal('999.00'))
+        WithdrawalRequest.objects.filter(user=other).update(status='Cancelled')
+
+        profile, other_profile = self.user.memberprofile, other.memberprofile
+        expected = [(profile.pk, Decimal('999.00'), Decimal('30.00')), (other_profile.pk, Decimal('10.00'), Decimal('0.00'))]
+        self.assertEqual(sorted(reconcile_pending_withdrawals()), expected)
+        self.assertEqual(MemberProfile.objects.get(pk=profile.pk).pending_withdrawals, Decimal('999.00'))
+
+        self.assertEqual(sorted(reconcile_pending_withdrawals(fix=True)), expected)
+        self.assert_pending('30.00')
+        self.assertEqual(MemberProfile.objects.get(pk=other_profile.pk).pending_withdrawals, Decimal('0.00'))
+
+
+class WithdrawalApprovalTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.alice = self.member('alice', '100.00')
+        self.bob = self.member('bob', '500.00')
+        now = timezone.now()
+        # alice's 60 came in after her 50 although it has the lower pk
+        self.late = self.request(self.alice, '60.00', now)
+        self.first = self.request(self.alice, '50.00', now - timedelta(minutes=2))
+        self.second = self.request(self.alice, '30.00', now - timedelta(minutes=1))
+        self.last = self.request(self.alice, '5.00', now + timedelta(minutes=1))
+        self.bobs = self.request(self.bob, '200.00', now)
+
+    def member(self, username, balance):
+        user = User.objects.create_user(username)
+        MemberProfile.objects.filter(user=user).update(balance=Decimal(balance), wallet=Decimal(balance))
+        return user
+
+    def request(self, user, amount, created_at):
+        withdrawal = WithdrawalRequest.objects.create(user=user, amount=Decimal(amount), wallet_address=f'{user.username}-addr')
+        WithdrawalRequest.objects.filter(pk=withdrawal.pk).update(created_at=created_at)
+        return withdrawal
+
+    def statuses(self):
+        return dict(WithdrawalRequest.objects.values_list('pk', 'status'))
+
+    def test_requests_are_approved_in_creation_order_until_the_balance_runs_out(self):
+        batch, approved, total, skipped = approve_withdrawals(WithdrawalRequest.objects.all())
+        self.assertEqual((approved, total), (3, Decimal('280.00')))
+        # 50 + 30 leave 20: the 60 is skipped, and so is the 5 that came after it
+        self.assertEqual(skipped, [(self.late.pk, 'alice', Decimal('60.00')), (self.last.pk, 'alice', Decimal('5.00'))])
+        self.assertEqual(self.statuses(), {
+            self.first.pk: 'Paid', self.second.pk: 'Paid', self.late.pk: 'Pending', self.last.pk: 'Pending', self.bobs.pk: 'Paid',
+        })
+
+        balances = dict(MemberProfile.objects.values_list('user__username', 'balance'))
+        self.assertEqual((balances['alice'], balances['bob']), (Decimal('20.00'), Decimal('300.00')))
+        self.assertEqual(MemberProfile.objects.get(user=self.alice).pending_withdrawals, Decimal('65.00'))
+        self.assertEqual(reconcile_pending_withdrawals(), [])
+        self.assertEqual(Transaction.objects.filter(tx_type='WITHDRAWAL').count(), 3)
+        self.assertEqual(revenue_totals(use_cache=False)['total_withdrawals_processed'], Decimal('280.00'))
+        self.assertEqual(len(list(payout_rows(batch))), 4)
+
+        # Nothing left that alice can cover
+        self.assertEqual(approve_withdrawals(WithdrawalRequest.objects.all())[1], 0)
+
+    def test_admin_action_reports_skips_and_links_the_payout_file(self):
+        admin_user = User.objects.create_superuser('staff', password='pass')
+        self.client.force_login(admin_user)
+        response = self.client.post(reverse('admin:matrix_withdrawalrequest_changelist'), {
+            'action': 'approve_withdrawal_action', '_selected_action': list(self.statuses()),
+        }, follow=True)
+        self.assertEqual(response.redirect_chain[-1][1], 302)
+        notices = [str(message) for message in response.context['messages']]
+        self.assertIn(f"Insufficient funds: alice (request #{self.late.pk}, $60.00) stays Pending", notices)
+        self.assertIn(f"Insufficient funds: alice (request #{self.last.pk}, $5.00) stays Pending", notices)
+
+        batch = WithdrawalRequest.objects.get(pk=self.bobs.pk).payout_batch
+        link = reverse('admin:withdrawal-payout-file', args=[batch])
+        self.assertTrue(any(link in notice for notice in notices))
+        lines = b''.join(self.client.get(link).streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'username,wallet_address,net_amount,fee')
+        self.assertEqual(sorted(line.split(',')[0] for line in lines[1:]), ['alice', 'alice', 'bob'])
+
+
+class RecountTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        replay_activations(generate_network(70, 'random', seed=11, prefix='rc')[1:])
+
+    def naive_fills(self):
+        """{(pk, board): children + grandchildren} walked one FK at a time."""
+        profiles = {p.pk: p for p in MemberProfile.objects.all()}
+        fills = {}
+        for pk, profile in profiles.items():
+            for b in BOARDS:
+                kids = [getattr(profile, f'{field}_id') for field in child_fields(b)]
+                kids = [kid for kid in kids if kid]
+                fills[pk, b] = len(kids) + sum(
+                    1 for kid in kids for field in child_fields(b) if getattr(profiles[kid], f'{field}_id')
+                )
+        return fills
+
+    def stored(self):
+        return {
+            (row[0], b): row[b] for row in
+            MemberProfile.objects.values_list('pk', *[count_field(b) for b in BOARDS])
+            for b in BOARDS
+        }
+
+    def test_counts_match_the_fk_slots(self):
+        fills, stored = self.naive_fills(), self.stored()
+        self.assertGreater(max(fills.values()), 2)
+        pks, counted = board_fills()[:2]
+        self.assertEqual({(pk, b): counted[i, b - 1] for i, pk in enumerate(pks.tolist()) for b in BOARDS}, fills)
+
+        report = recount_boards(dry_run=True)
+        drifted = {(pk, b): (was, now) for b, rows in report.items() for pk, was, now in rows}
+        self.assertEqual(drifted, {key: (stored[key], fills[key]) for key in fills if stored[key] != fills[key]})
+        # Counts only trail the slots under a child that has cycled out of the board
+        self.assertTrue(drifted)
+        on_board = set(MatrixNode.objects.values_list('user__memberprofile', 'board'))
+        for pk, b in drifted:
+            profile = MemberProfile.objects.get(pk=pk)
+            kids = [getattr(profile, f'{field}_id') for field in child_fields(b)]
+            self.assertTrue(any(kid and (kid, b) not in on_board for kid in kids), (pk, b))
+
+    def test_counts_are_repaired(self):
+        fills = self.naive_fills()
+        drifted = {pk for rows in recount_boards(dry_run=True).values() for pk, _, _ in rows}
+        first, second = MemberProfile.objects.exclude(pk__in=drifted).order_by('pk').values_list('pk', flat=True)[:2]
+        MemberProfile.objects.filter(pk=first).update(**{count_field(1): 5})
+        MemberProfile.objects.filter(pk=second).update(**{count_field(3): 4})
+
+        report = recount_boards(dry_run=True)
+        self.assertIn((first, 5, fills[first, 1]), report[1])
+        self.assertEqual(report[3], [(second, 4, fills[second, 3])])
+        self.assertEqual(self.stored()[first, 1], 5)
+
+        # Restricted to one member, only that member is written
+        self.assertEqual(recount_boards(MemberProfile.objects.filter(pk=second))[3], [(second, 4, fills[second, 3])])
+        self.assertEqual(self.stored()[first, 1], 5)
+        recount_boards()
+        self.assertEqual(recount_boards(dry_run=True), {b: [] for b in BOARDS})
+        self.assertEqual(self.stored(), fills)
+
+
+class MemberProfileChangelistTests(TestCase):
+
+    def test_changelist_queries_do_not_grow_with_members(self):
+        admin = User.objects.create_superuser('boss', password='pass')
+        self.client.force_login(admin)
+        url = reverse('admin:matrix_memberprofile_changelist')
+
+        def page_queries():
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            return len(queries)
+
+        for i in range(3):
+            User.objects.create(username=f'small{i}')
+        few = page_queries()
+        for i in range(40):
+            profile = User.objects.create(username=f'member{i}').memberprofile
+            profile.sponser = admin.memberprofile
+            profile.save()
+        self.assertEqual(page_queries(), few)
+
+    def test_search_matches_exact_ref_id_and_username_prefix(self):
+        admin = User.objects.create_superuser('boss', password='pass')
+        self.client.force_login(admin)
+        alice = User.objects.create(username='alice').memberprofile
+        User.objects.create(username='bob')
+        url = reverse('admin:matrix_memberprofile_changelist')
+
+        response = self.client.get(url, {'q': alice.ref_id})
+        self.assertEqual(list(response.context['cl'].result_list), [alice])
+        response = self.client.get(url, {'q': 'ali'})
+        self.assertEqual(list(response.context['cl'].result_list), [alice])
+
+
+class LedgerReconciliationTests(TestCase):
+
+    def setUp(self):
+        self.alice = User.objects.create(username='alice').memberprofile
+        self.bob = User.objects.create(username='bob').memberprofile
+
+    def pay(self, profile, tx_type, amount, **balances):
+        Transaction.objects.create(profile=profile, tx_type=tx_type, amount=Decimal(amount), detail='test')
+        MemberProfile.objects.filter(pk=profile.pk).update(**{f: Decimal(v) for f, v in balances.items()})
+
+    def drifts(self, run):
+        return {d.profile_id: (d.kind, d.balance_drift, d.wallet_drift, d.nfg_drift) for d in run.drifts.all()}
+
+    def test_drift_is_classified(self):
+        self.pay(self.alice, 'CYCLE', '150.00', balance='150.00', wallet='150.00')
+        self.pay(self.alice, 'AIRDROP', '110', nfg_balance='110')
+        # Upgrade fee taken from balance without a ledger row
+        self.pay(self.bob, 'CYCLE', '150.00', balance='50.00', wallet='150.00')
+
+        run = reconcile_ledger()
+        self.assertTrue(run.full)
+        self.assertEqual(self.drifts(run), {self.bob.pk: ('balance_only', Decimal('-100.00'), 0, 0)})
+
+    @override_settings(MATRIX_LEDGER_SETTLE_SECONDS=0)
+    def test_incremental_run_only_reads_new_rows(self):
+        self.pay(self.alice, 'CYCLE', '150.00', balance='150.00', wallet='150.00')
+        self.assertEqual(reconcile_ledger().transactions_read, 1)
+
+        # alice has a new row (and a wallet off by 5); bob was credited without one
+        self.pay(self.alice, 'WITHDRAWAL', '-50.00', balance='100.00', wallet='95.00')
+        MemberProfile.objects.filter(pk=self.bob.pk).update(balance=Decimal('20.00'), wallet=Decimal('20.00'))
+        run = reconcile_ledger()
+        self.assertFalse(run.full)
+        self.assertEqual((run.transactions_read, run.members_checked), (1, 1))
+        self.assertEqual(self.drifts(run), {self.alice.pk: ('wallet_only', 0, -5, 0)})
+
+        run = reconcile_ledger(full=True)
+        self.assertEqual((run.transactions_read, run.members_checked), (2, 2))
+        self.assertEqual(self.drifts(run), {
+            self.alice.pk: ('wallet_only', 0, -5, 0), self.bob.pk: ('untracked_credit', 20, 20, 0),
+        })
+
+
+class PlacementBenchmarkTests(TestCase):
+
+    def test_generated_shapes(self):
+        deep = generate_network(5, 'deep', prefix='deep')
+        self.assertEqual([m.sponser_id for m in deep[1:]], [m.pk for m in deep[:-1]])
+        flat = generate_network(20, 'flat', prefix='flat')
+        self.assertLessEqual(len({m.sponser_id for m in flat[1:]}), 5)
+
+    def test_tier_is_measured_and_rolled_back(self):
+        members = MemberProfile.objects.count()
+        tier = run_tier(12, 'random')
+        self.assertEqual(tier['activations'], 12)
+        self.assertGreaterEqual(tier['placements'], 12)
+        self.assertGreater(tier['queries_per_placement'], 0)
+        self.assertLessEqual(tier['latency_ms']['p50'], tier['latency_ms']['p99'])
+        self.assertEqual(MemberProfile.objects.count(), members)
+
+
+@override_settings(MATRIX_METRICS_SAMPLE_RATE=1)
+class RequestMetricsTests(TestCase):
+
+    def setUp(self):
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+        self.staff = User.objects.create(username='staff', is_staff=True)
+        self.client.force_login(self.staff)
+
+    def test_views_are_timed_by_url_name(self):
+        self.client.get(reverse('dashboard'))
+        self.client.get(reverse('dashboard'))
+        data = self.client.get(reverse('request_metrics_api')).json()
+        dashboard = next(row for row in data['views'] if row['view'] == 'dashboard')
+        self.assertEqual(dashboard['requests'], 2)
+        self.assertGreater(dashboard['queries_max'], 0)
+        self.assertLessEqual(dashboard['p50_ms'], dashboard['p99_ms'])
+        self.assertEqual(self.client.get(reverse('request_metrics')).status_code, 200)
+
+    @override_settings(MATRIX_METRICS_FLUSH_SECONDS=60)
+    def test_flush_writes_one_row_per_view(self):
+        metrics.record('dashboard', 12.0, 3.0, 4)
+        metrics.record('dashboard', 30.0, 5.0, 6)
+        metrics.record('matrix_data', 5.0, 1.0, 2)
+        self.assertEqual(metrics.flush(), 2)
+        row = RequestMetric.objects.get(view_name='dashboard')
+        self.assertEqual((row.requests, row.max_ms, row.queries_max), (2, 30.0, 6))
+        self.assertEqual(metrics.flush(), 0)
+
+
+class TracingTests(TestCase):
+
+    @override_settings(MATRIX_TRACE_SAMPLE_RATE=1)
+    def test_nested_spans_are_logged_as_one_trace(self):
+        with self.assertLogs('matrix.trace', 'INFO') as logs:
+            with span('outer', board=1):
+                User.objects.count()
+                with span('inner'):
+                    User.objects.count()
+                    User.objects.count()
+        record = json.loads(logs.records[0].getMessage())
+        outer, inner = record['spans']
+        self.assertEqual((outer['name'], outer['queries'], outer['tags']), ('outer', 3, {'board': 1}))
+        self.assertEqual((inner['parent'], inner['depth'], inner['queries']), (0, 1, 2))
+
+    @override_settings(MATRIX_TRACE_SAMPLE_RATE=0)
+    def test_unsampled_calls_log_nothing(self):
+        with self.assertNoLogs('matrix.trace'):
+            with span('outer'):
+                with span('inner'):
+                    User.objects.count()
+
+
+class BoardPollingTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='poller')
+        self.client.force_login(self.user)
+
+    def test_unchanged_boards_answer_304_without_matrix_queries(self):
+        url = reverse('matrix_data')
+        response = self.client.get(url, {'board': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['level_name'], "Basic Board ($150)")
+        etag = response['ETag']
+
+        # Session and user only
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {'board': 2}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            cascade.touch(self.user.memberprofile)
+        response = self.client.get(url, {'board': 2}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_all_boards_in_one_response(self):
+        response = self.client.get(reverse('matrix_boards_data'))
+        boards = response.json()['boards']
+        self.assertEqual([b['board'] for b in boards], [1, 2, 3, 4, 5])
+        self.assertEqual(boards[0]['count'], 0)
+        self.assertEqual(self.client.get(reverse('matrix_data'), {'board': 'x'}).status_code, 400)
+
+
+class AdminSummaryTests(TestCase):
+
+    def test_summary_is_counted_incrementally_in_constant_queries(self):
+        cache.clear()
+        staff = User.objects.create(username='staff', is_staff=True)
+        self.client.force_login(staff)
+        url = reverse('admin_api')
+
+        def summary():
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                data = self.client.get(url).json()
+            return data, len(queries)
+
+        for i in range(5):
+            profile = User.objects.create(username=f'member{i}').memberprofile
+            profile.is_active = True
+            profile.save()
+        WithdrawalRequest.objects.create(user=staff, amount=Decimal('20.00'), wallet_address='x')
+        data, few = summary()
+        self.assertEqual(data['active_members'], 5)
+        self.assertEqual(data['members_per_board']['board_1'], 5)
+        self.assertEqual((data['pending_withdrawals'], data['pending_withdrawals_total']), (1, '20.00'))
+
+        for i in range(30):
+            profile = User.objects.create(username=f'more{i}').memberprofile
+            profile.is_active = True
+            profile.current_board = 2
+            profile.save()
+        data, many = summary()
+        self.assertEqual(many, few)
+        self.assertEqual((data['active_members'], data['members_per_board']['board_2']), (35, 30))
+
+    def test_recompute_keeps_an_increment_that_lands_while_it_runs(self):
+        profile = User.objects.create(username='cycler').memberprofile
+        BoardCycle.objects.create(profile=profile, board=1)
+        for _ in range(3):
+            stats.cycle_recorded()
+
+        exact_stats = stats.exact_stats
+
+        def counted_then_incremented():
+            exact = exact_stats()
+            # Another member cycles after the rows were locked, too late for the exact count
+            stats.cycle_recorded()
+            return exact
+
+        with mock.patch.object(stats, 'exact_stats', side_effect=counted_then_incremented):
+            self.assertEqual(stats.recompute_stats()[stats.cycles_name()], 1)
+        self.assertEqual(stats.platform_stats(use_cache=False)['cycles_today'], 2)
+
+
+class DownlineTests(TestCase):
+
+    def member(self, username, sponser=None):
+        profile = User.objects.create(username=username).memberprofile
+        profile.sponser = sponser
+        profile.save()
+        return profile
+
+    def test_levels_are_one_query_and_dropped_when_the_downline_changes(self):
+        cache.clear()
+        root = self.member('root')
+        left, right = self.member('left', root), self.member('right', root)
+        for i in range(3):
+            self.member(f'under{i}', left)
+
+        with self.assertNumQueries(1):
+            downline = get_downline(root.pk)
+        self.assertEqual(downline['members'], 5)
+        self.assertEqual([level['members'] for level in downline['levels']], [2, 3])
+        with self.assertNumQueries(0):
+            get_downline(root.pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            joined = self.member('joined', right)
+        self.assertIsNone(cache.get(downline_key(root.pk)))
+        self.assertEqual(get_downline(root.pk)['pending'], 6)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            joined.is_active = True
+            joined.save()
+        self.assertIsNone(cache.get(downline_key(root.pk)))
+        self.assertEqual(get_downline(right.pk)['active'], 1)
+
+        self.client.force_login(root.user)
+        page = self.client.get(reverse('downline_data'), {'level': 2, 'limit': 2}).json()
+        self.assertEqual([row['username'] for row in page['page']], ['under0', 'under1'])
+        self.assertEqual(page['next_after'], page['page'][-1]['id'])
+        self.assertEqual(self.client.get(reverse('downline_data'), {'member': left.pk}).status_code, 403)
+
+
+class BoardSubtreeTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        # A full board-1 tree four levels deep, numbered through place_node
+        cls.members = [User.objects.create(username=f'm{i}').memberprofile for i in range(1, 32)]
+        for i, member in enumerate(cls.members[1:], start=2):
+            place_node(member, cls.members[i // 2 - 1], 1 + i % 2, 1)
+
+    def test_chunks_are_bounded_and_expand_through_cursors(self):
+        self.client.force_login(self.members[0].user)
+        url = reverse('board_subtree_data', args=[1])
+        # session + user + profile + own node + the chunk
+        with self.assertNumQueries(5):
+            data = self.client.get(url, {'depth': 2}).json()
+        self.assertEqual([n['username'] for n in data['nodes']], [f'm{i}' for i in range(1, 8)])
+        deepest = [n for n in data['nodes'] if n['depth'] == 2]
+        self.assertTrue(all(n['has_children'] and n['cursor'] for n in deepest))
+
+        deeper = self.client.get(url, {'cursor': deepest[-1]['cursor'], 'depth': 99}).json()
+        self.assertEqual(deeper['depth'], 4)
+        # m7's subtree has only two more levels: 1 + 2 + 4 members
+        self.assertEqual([n['username'] for n in deeper['nodes']], ['m7', 'm14', 'm15', 'm28', 'm29', 'm30', 'm31'])
+        self.assertFalse(any('cursor' in n for n in deeper['nodes']))
+
+    def test_cursors_belong_to_their_user(self):
+        self.client.force_login(self.members[0].user)
+        url = reverse('board_subtree_data', args=[1])
+        cursor = self.client.get(url, {'depth': 1}).json()['nodes'][1]['cursor']
+        self.client.force_login(self.members[5].user)
+        self.assertEqual(self.client.get(url, {'cursor': cursor}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'member': self.members[0].pk}).status_code, 403)
+
+
+@override_settings(MATRIX_EVENT_LOG=True)
+class MatrixEventLogTests(TestCase):
+
+    def test_replay_reproduces_the_live_state(self):
+        members = generate_network(40, 'random', seed=7, prefix='ev')
+        replay_activations(members[:30])
+        bulk_activate(MemberProfile.objects.filter(pk__in=[m.pk for m in members[30:]]))
+        paid = WithdrawalRequest.objects.create(user=members[3].user, amount=Decimal('10.00'), wallet_address='x')
+        paid.status = 'Paid'
+        paid.save()
+        members[12].user.delete()
+
+        kinds = set(MatrixEvent.objects.values_list('kind', flat=True))
+        self.assertTrue({'placement', 'slot_fill', 'count', 'bonus', 'member_removed'} <= kinds)
+        state, events = replay()
+        self.assertEqual(events, MatrixEvent.objects.count())
+        self.assertEqual(compare(state), [])
+
+    def test_pk_updates_are_logged_without_a_lookup(self):
+        profile = User.objects.create(username='solo').memberprofile
+        with self.assertNumQueries(2):
+            MemberProfile.objects.filter(pk=profile.pk).update(wallet=F('wallet') + 5)
+        self.assertEqual(MatrixEvent.objects.last().data['rows'], [[[profile.pk], {}, {'wallet': 5}]])
+
+    def test_baseline_starts_the_log_for_an_existing_matrix(self):
+        members = generate_network(30, 'random', seed=5, prefix='bl')
+        with self.settings(MATRIX_EVENT_LOG=False):
+            replay_activations(members[:15])
+        self.assertFalse(MatrixEvent.objects.filter(kind='placement').exists())
+
+        call_command('replay_events', '--baseline', stdout=io.StringIO())
+        replay_activations(members[15:])
+        self.assertEqual(compare(replay()[0]), [])
+
+
+
+class SnapshotTests(TestCase):
+
+    def test_restore_gives_back_the_same_bytes(self):
+        members = generate_network(30, 'random', seed=3, prefix='sn')
+        replay_activations(members[:20])
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        first, second = os.path.join(directory, 'a.snap'), os.path.join(directory, 'b.snap')
+        counts = write_snapshot(first)
+        self.assertEqual(counts['member'], 31)  # with the root
+
+        User.objects.filter(username__startswith='sn').delete()
+        self.assertFalse(MemberProfile.objects.exists() or MatrixNode.objects.exists() or SponsorLink.objects.exists())
+        self.assertEqual(restore_snapshot(first), counts)
+        write_snapshot(second)
+        with open(first, 'rb') as a, open(second, 'rb') as b:
+            self.assertEqual(a.read(), b.read())
+        self.assertFalse(User.objects.get(username='sn-1').has_usable_password())
+
+    @override_settings(MATRIX_EVENT_LOG=True)
+    def test_replay_after_restore_starts_from_the_snapshot(self):
+        members = generate_network(30, 'random', seed=4, prefix='sr')
+        replay_activations(members[:15])
+        path = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), 'a.snap')
+        write_snapshot(path)
+        User.objects.filter(username__startswith='sr').delete()
+
+        counts = restore_snapshot(path)
+        restored = MatrixEvent.objects.filter(kind='restore')
+        self.assertEqual(
+            sum(len(event.data['rows']) for event in restored),
+            MemberProfile.objects.count() + MatrixNode.objects.count()
+        )
+        state, events = replay()
+        self.assertEqual(events, restored.count() + 1)
+        self.assertEqual(len(state['member']), counts['member'])
+        self.assertEqual(compare(state), [])
+
+        # The log goes on from the restored state
+        replay_activations(list(MemberProfile.objects.filter(user__username__in=[m.user.username for m in members[15:]])))
+        self.assertEqual(compare(replay()[0]), [])
+
+    def test_restore_needs_an_empty_matrix(self):
+        User.objects.create(username='here')
+        path = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), 'a.snap')
+        write_snapshot(path)
+        with self.assertRaises(ValueError):
+            restore_snapshot(path)
+
+
+class SimulationTests(TestCase):
+
+    def test_matches_the_orm(self):
+        result = verify(40, 'random', seed=1)
+        self.assertGreaterEqual(result['placements'], 40)
+        self.assertEqual(result['differences'], [])
+        self.assertFalse(MemberProfile.objects.exists())
+
+    def test_joins_stay_in_memory(self):
+        generate_network(5, 'flat', prefix='sim')
+        sim = MatrixSimulation.load()
+        summary = simulate_joins(sim, 200, 'random')
+        self.assertEqual(summary['members'], 206)
+        self.assertEqual(summary['activations'], 200)
+        self.assertGreater(summary['cycles'][1], 0)
+        self.assertEqual(MemberProfile.objects.count(), 6)
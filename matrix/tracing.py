@@ -0,0 +1,169 @@
+import functools
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+logger = logging.getLogger('matrix.trace')
+_local = threading.local()
+MAX_SPANS = 1000
+
+
+def sample_rate():
+    return getattr(settings, 'MATRIX_TRACE_SAMPLE_RATE', 0)
+
+
+class _Trace:
+    """Spans of one sampled top-level call, plus the query counter shared by all of them."""
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex[:16]
+        self.started_at = timezone.now()
+        self.spans = []
+        self.stack = []
+        self.dropped = 0
+        self.queries = 0
+        self.db_seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper hook
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_seconds += time.perf_counter() - started
+            self.queries += 1
+
+    def record(self):
+        root = self.spans[0]
+        return {
+            'trace': self.id, 'root': root['name'], 'at': self.started_at.isoformat(),
+            'ms': root['ms'], 'queries': root['queries'], 'db_ms': root['db_ms'],
+            'dropped': self.dropped, 'spans': self.spans,
+        }
+
+
+def _open_span(trace, name, tags):
+    if len(trace.spans) >= MAX_SPANS:
+        trace.dropped += 1
+        return None
+    entry = {'name': name, 'depth': len(trace.stack), 'parent': trace.stack[-1] if trace.stack else None}
+    if tags:
+        entry['tags'] = tags
+    trace.stack.append(len(trace.spans))
+    trace.spans.append(entry)
+    return entry, time.perf_counter(), trace.queries, trace.db_seconds
+
+
+def _end_span(trace, opened, error=None):
+    entry, started, queries, db_seconds = opened
+    trace.stack.pop()
+    entry['ms'] = round((time.perf_counter() - started) * 1000, 3)
+    entry['queries'] = trace.queries - queries
+    entry['db_ms'] = round((trace.db_seconds - db_seconds) * 1000, 3)
+    if error is not None:
+        entry['error'] = type(error).__name__
+
+
+@contextmanager
+def span(name, **tags):
+    """
+    Times the block as a span of the current trace: wall time, queries and DB
+    time, nested under whatever span is open. The outermost span decides
+    (MATRIX_TRACE_SAMPLE_RATE) whether the whole call is traced; a sampled
+    trace is logged as one JSON line on the 'matrix.trace' logger.
+    """
+    trace = getattr(_local, 'trace', None)
+    if trace is None:
+        # Not inside a sampled trace: either an unsampled one or a new top-level call
+        outer = getattr(_local, 'unsampled', 0)
+        if outer or random.random() >= sample_rate():
+            _local.unsampled = outer + 1
+            try:
+                yield
+            finally:
+                _local.unsampled = outer
+            return
+        trace = _local.trace = _Trace()
+        try:
+            with connection.execute_wrapper(trace):
+                with _span(trace, name, tags):
+                    yield
+        finally:
+            _local.trace = None
+            logger.info(json.dumps(trace.record(), default=str))
+        return
+
+    with _span(trace, name, tags):
+        yield
+
+
+@contextmanager
+def _span(trace, name, tags):
+    opened = _open_span(trace, name, tags)
+    if opened is None:
+        yield
+        return
+    try:
+        yield
+    except BaseException as error:
+        _end_span(trace, opened, error)
+        raise
+    _end_span(trace, opened)
+
+
+def traced(name=None):
+    """Decorator form of span(); the name defaults to module.qualname."""
+    def decorate(func):
+        span_name = name or f"{func.__module__.rsplit('.', 1)[-1]}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def read_traces(lines):
+    """Trace records from log lines (anything that isn't a trace record is skipped)."""
+    for line in lines:
+        line = line.strip()
+        start = line.find('{')
+        if start < 0:
+            continue
+        try:
+            record = json.loads(line[start:])
+        except ValueError:
+            continue
+        if isinstance(record, dict) and 'trace' in record and 'spans' in record:
+            yield record
+
+
+def span_totals(records):
+    """
+    {span name: {calls, ms, self_ms, queries}} over many traces; self time is
+    the span's own time minus its direct children.
+    """
+    totals = {}
+    for record in records:
+        spans = record['spans']
+        child_ms = [0.0] * len(spans)
+        for entry in spans:
+            if entry.get('parent') is not None and 'ms' in entry:
+                child_ms[entry['parent']] += entry['ms']
+        for i, entry in enumerate(spans):
+            if 'ms' not in entry:
+                continue
+            total = totals.setdefault(entry['name'], {'calls': 0, 'ms': 0.0, 'self_ms': 0.0, 'queries': 0})
+            total['calls'] += 1
+            total['ms'] += entry['ms']
+            total['self_ms'] += entry['ms'] - child_ms[i]
+            total['queries'] += entry['queries']
+    return totals
@@ -14,12 +14,17 @@ urlpatterns = [
     # Dashboard & Matrix
     path('dashboard/', views.dashboard_view, name='dashboard'),
     path('api/matrix/', views.get_matrix_data, name='matrix_data'),
+    path('api/matrix/boards/', views.get_all_boards_data, name='matrix_boards_data'),
+    path('api/matrix/<int:board_level>/subtree/', views.board_subtree_data, name='board_subtree_data'),
+    path('api/downline/', views.downline_data, name='downline_data'),
     
     # Payments
     path('activate/', views.create_payment_invoice, name='pay_page'),
 
     path('system-admin/', views.admin_panel_page, name='admin_panel'), # The HTML page
     path('admin-summary-data/', views.admin_summary_view, name='admin_api'), # The Data API
+    path('system-admin/metrics/', views.request_metrics_page, name='request_metrics'),
+    path('admin-metrics-data/', views.request_metrics_data, name='request_metrics_api'),
  
     path('matrix-tree/', views.matrix_tree_view, name='matrix_tree'),
     path('withdrawals/', views.request_withdrawal, name='withdrawals'),
@@ -6,8 +6,14 @@ from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib import messages
 from django.db import transaction, IntegrityError
-from django.db.models import F
+from django.db.models import F, OuterRef, Subquery
 from django.http import JsonResponse
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+from django.core import signing
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
 from decimal import Decimal
 from django.db.models import Sum
 from .models import MemberProfile, Transaction, MatrixNode
@@ -16,8 +22,17 @@ import string
 import random
 import uuid
 
-from .models import MemberProfile, AdminRevenue, WithdrawalRequest 
-from .logic import place_member_with_spillover, get_board_tree
+from .models import MemberProfile, WithdrawalRequest, BoardReportCache
+from .board_cache import count_field, earned_field
+from .logic import get_board_tree
+from .dashboard import get_dashboard, forget_dashboard, board_version
+from .jobs import enqueue
+from .revenue import record_fee
+from .stats import members_moved, platform_stats
+from .downline import forget_uplines, get_downline, downline_members, PAGE_SIZE
+from .board_index import board_subtree
+from .serializers import BoardNodeSerializer
+from . import metrics
 
 def generate_unique_ref_id():
     chars = string.ascii_uppercase + string.digits
@@ -55,20 +70,22 @@ def upgrade_board(request):
                         balance=F('balance') - config['fee'],
                         current_board=target_board
                     )
+                    if profile.is_active:
+                        members_moved(left=profile.current_board, joined=target_board)
+                        forget_uplines([profile.pk])
+                    forget_dashboard(request.user.pk)
                     
                     # 3. Update Admin Stats
-                    revenue, _ = AdminRevenue.objects.get_or_create(id=1)
-                    revenue.total_fees_collected += config['fee']
-                    revenue.save()
+                    record_fee(config['fee'])
                     
                     # 4. PLACE IN THE NEW BOARD
-                    # Ensure place_member_with_spillover uses 'get_or_create' internally
-                    place_member_with_spillover(profile, profile.sponser, target_board)
+                    # Queued for the matrix worker (place_member_with_spillover skips existing nodes)
+                    enqueue('spillover', profile, board=target_board)
                     
                     # Refresh profile from DB to reflect changes
                     profile.refresh_from_db()
                     
-                    messages.success(request, f"Successfully upgraded to Board {target_board}!")
+                    messages.success(request, f"Successfully upgraded to Board {target_board}! Your placement is being processed.")
                     
             except Exception as e:
                 messages.error(request, f"Upgrade failed: {str(e)}")
@@ -88,10 +105,10 @@ def admin_activate_user(request, user_id):
             member.payment_status = 'paid'
             member.is_active = True
             member.save() 
-            # Place in Board 1
-            place_member_with_spillover(member, member.sponser, 1)
+            # Place in Board 1 (queued for the matrix worker)
+            enqueue('spillover', member, board=1)
             
-        messages.success(request, f"User {member.user.username} activated and placed.")
+        messages.success(request, f"User {member.user.username} activated and queued for placement.")
     return redirect('admin_panel')
 
 def register_view(request):
@@ -340,54 +357,15 @@ def login_view(request):
 
 @login_required
 def dashboard_view(request):
+    # Members reload this while waiting for their board to fill, so the whole
+    # context is cached per member (dropped again on placement, cycle, payouts...)
     try:
-        profile = request.user.memberprofile
+        context = get_dashboard(request.user)
     except MemberProfile.DoesNotExist:
         return render(request, 'matrix/error.html', {'message': 'Profile not found'})
 
-    # 1. Get total board counts (Total people in their 2x2 matrix)
-    counts = {
-        'b1': profile.board_1_count_value or 0,
-        'b2': profile.board_2_count or 0,
-        'b3': profile.board_3_count or 0,
-        'b4': profile.board_4_count or 0,
-        'b5': profile.board_5_count or 0,
-    }
-    
-    # 2. Calculate DIRECT Referrals per Board
-    # This filters the user's referrals based on their current progress
-    direct_referrals = {
-        'd1': profile.referrals.filter(current_board=1).count(),
-        'd2': profile.referrals.filter(current_board=2).count(),
-        'd3': profile.referrals.filter(current_board=3).count(),
-        'd4': profile.referrals.filter(current_board=4).count(),
-        'd5': profile.referrals.filter(current_board=5).count(),
-        'total_directs': profile.referrals.count()
-    }
-    
-    # 3. Progress percentages (Calculating how close they are to cycling)
-    # Since it's a 2x2 matrix, the goal is 6 people.
-    percents = {
-        f'{k}_percent': min((v / 6) * 100, 100) for k, v in counts.items()
-    }
-    
-    # 4. Prepare Context for Template
-    context = {
-        'profile': profile,
-        **counts,           # Expands b1, b2, etc.
-        **direct_referrals, # Expands d1, d2, etc.
-        **percents,         # Expands b1_percent, etc.
-        
-        # Tree Pointers for UI rendering (Shoulders)
-        'nodes': {
-            'b1': {'l': profile.left_child_b1, 'r': profile.right_child_b1},
-            'b2': {'l': profile.left_child_b2, 'r': profile.right_child_b2},
-            'b3': {'l': profile.left_child_b3, 'r': profile.right_child_b3},
-            'b4': {'l': profile.left_child_b4, 'r': profile.right_child_b4},
-            'b5': {'l': profile.left_child_b5, 'r': profile.right_child_b5},
-        }
-    }
-    
+    # The template reads user.memberprofile too; hand it the cached one
+    request.user.memberprofile = context['profile']
     return render(request, 'matrix/dashboard.html', context)
 
 @login_required
@@ -405,38 +383,164 @@ def payment_initiate(request):
     }
     return render(request, 'matrix/payment_page.html', context)
 
+# Key: board_level, Value: (Level Name, Payout)
+BOARD_LABELS = {
+    1: ("Starter Board ($50)", "200.00"),
+    2: ("Basic Board ($150)", "600.00"),
+    3: ("Bronze Board ($400)", "1,600.00"),
+    4: ("Silver Board ($1,100)", "4,400.00"),
+    5: ("Gold Board ($3,400)", "13,600.00"),
+}
+
+def _board_data(board_level, row):
+    name, payout = BOARD_LABELS[board_level]
+    row = row or {}
+    return {
+        "level_name": name,
+        "count": row.get(count_field(board_level)) or 0,
+        "target": 6,
+        "payout": payout,
+        "earned": str(row.get(earned_field(board_level), "0.00")),
+        "cycles": row.get(f'board_{board_level}_cycles') or 0,
+    }
+
+def _board_rows(user_id, boards):
+    # Count and earned are the live profile columns; cycles comes from the report cache
+    cycles = {
+        f'board_{b}_cycles': Subquery(
+            BoardReportCache.objects.filter(profile=OuterRef('pk'), board=b).values('cycles')[:1]
+        )
+        for b in boards
+    }
+    fields = [name for b in boards for name in (count_field(b), earned_field(b))]
+    return MemberProfile.objects.filter(user_id=user_id).annotate(**cycles).values(*fields, *cycles).first()
+
+# Polling answers 304 from the cached board version alone (no profile or board reads)
+def _board_etag(request):
+    return board_version(request.user.pk)[0]
+
+def _board_last_modified(request):
+    return board_version(request.user.pk)[1]
+
 @login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=_board_etag, last_modified_func=_board_last_modified)
 def get_matrix_data(request):
-    user_profile = request.user.memberprofile
     # Defaults to Board 1 if no level is specified
-    board_level = int(request.GET.get('board', 1)) 
-    
-    # Define the configuration for all 5 boards
-    # Key: board_level, Value: (Level Name, Payout, Count Field Name)
-    board_configs = {
-        1: ("Starter Board ($50)", "200.00", "board_1_count_value"),
-        2: ("Basic Board ($150)", "600.00", "board_2_count"),
-        3: ("Bronze Board ($400)", "1,600.00", "board_3_count"),
-        4: ("Silver Board ($1,100)", "4,400.00", "board_4_count"),
-        5: ("Gold Board ($3,400)", "13,600.00", "board_5_count"),
-    }
+    board = request.GET.get('board', '1')
+    if not board.isdigit() or int(board) not in BOARD_LABELS:
+        return JsonResponse({"error": "Invalid board level"}, status=400)
+    board_level = int(board)
 
-    # Fetch configuration for the requested level
-    if board_level in board_configs:
-        name, payout, count_attr = board_configs[board_level]
-        # Use getattr to dynamically fetch the count field from the profile
-        current_count = getattr(user_profile, count_attr, 0)
-        
-        tree = {
-            "level_name": name,
-            "count": current_count,
-            "target": 6,
-            "payout": payout
-        }
+    return JsonResponse(_board_data(board_level, _board_rows(request.user.pk, [board_level])))
+
+@login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=_board_etag, last_modified_func=_board_last_modified)
+def get_all_boards_data(request):
+    """All five boards in one response (one query), same validators as get_matrix_data."""
+    row = _board_rows(request.user.pk, list(BOARD_LABELS))
+    return JsonResponse({
+        "boards": [{"board": b, **_board_data(b, row)} for b in BOARD_LABELS]
+    })
+
+def _int_param(request, name, default=0):
+    value = request.GET.get(name, '')
+    return int(value) if value.isdigit() else default
+
+@login_required
+def downline_data(request):
+    """
+    The member's whole sponsor-tree downline (staff: any member via ?member=<id>):
+    cached totals and per-level figures, plus one page of the members
+    themselves (?level=, ?after=<last id>, ?limit=).
+    """
+    member = request.GET.get('member')
+    if member:
+        if not request.user.is_staff:
+            return JsonResponse({"error": "Unauthorized"}, status=403)
+        profile_id = _int_param(request, 'member')
+        if not MemberProfile.objects.filter(pk=profile_id).exists():
+            return JsonResponse({"error": "Unknown member"}, status=404)
     else:
-        return JsonResponse({"error": "Invalid board level"}, status=400)
+        profile_id = request.user.memberprofile.pk
+
+    limit = min(_int_param(request, 'limit', PAGE_SIZE) or PAGE_SIZE, 500)
+    page = downline_members(profile_id, _int_param(request, 'level') or None, _int_param(request, 'after'), limit)
+    return JsonResponse({
+        "member": profile_id,
+        **get_downline(profile_id),
+        "page": [{
+            "id": row['descendant_id'],
+            "depth": row['depth'],
+            "username": row['descendant__user__username'],
+            "sponsor": row['descendant__sponser__user__username'],
+            "is_active": row['descendant__is_active'],
+            "payment_status": row['descendant__payment_status'],
+            "current_board": row['descendant__current_board'],
+        } for row in page],
+        "next_after": page[-1]['descendant_id'] if len(page) == limit else None,
+    })
 
-    return JsonResponse(tree)
+SUBTREE_DEPTH = 3
+SUBTREE_MAX_DEPTH = 4
+SUBTREE_CURSOR_SALT = 'matrix.board-subtree'
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def board_subtree_data(request, board_level):
+    """
+    One chunk of a board tree: a member plus ?depth= levels below it (at most
+    SUBTREE_MAX_DEPTH, so 2 ** (depth + 1) - 1 nodes and a fixed number of
+    queries). Deeper members come with a cursor; ?cursor= fetches the chunk
+    under them. Members start at themselves, staff at any ?member=<id>.
+    """
+    if board_level not in BOARD_LABELS:
+        return Response({"error": "Invalid board"}, status=400)
+    depth = min(_int_param(request, 'depth', SUBTREE_DEPTH) or SUBTREE_DEPTH, SUBTREE_MAX_DEPTH)
+
+    if request.GET.get('cursor'):
+        # Cursors are signed for the user they were handed to, so a member can
+        # only walk down from places their own chunks led them
+        try:
+            cursor = signing.loads(request.GET['cursor'], salt=SUBTREE_CURSOR_SALT)
+        except signing.BadSignature:
+            return Response({"error": "Invalid cursor"}, status=400)
+        if cursor['u'] != request.user.pk or cursor['b'] != board_level:
+            return Response({"error": "Invalid cursor"}, status=400)
+        start = {'pk': cursor['m']}
+    elif request.GET.get('member'):
+        if not request.user.is_staff:
+            return Response({"error": "Unauthorized"}, status=403)
+        start = {'pk': _int_param(request, 'member')}
+    else:
+        start = {'user_id': request.user.pk}
+
+    profile = MemberProfile.objects.select_related('user').filter(**start).first()
+    if profile is None:
+        return Response({"error": "Unknown member"}, status=404)
+
+    nodes = [{
+        "slot": 1, "depth": 0, "user__memberprofile__id": profile.pk, "user__username": profile.user.username,
+        "user__memberprofile__is_active": profile.is_active,
+        "user__memberprofile__current_board": profile.current_board, "has_children": None,
+    }]
+    subtree = board_subtree(profile, board_level, depth)
+    nodes[0]["has_children"] = 2 in subtree or 3 in subtree
+    for slot, row in subtree.items():
+        node = {**row, "slot": slot}
+        if row["depth"] == depth and row["has_children"] is not False:
+            node["cursor"] = signing.dumps(
+                {"u": request.user.pk, "b": board_level, "m": row["user__memberprofile__id"]}, salt=SUBTREE_CURSOR_SALT
+            )
+        nodes.append(node)
+
+    return Response({
+        "board": board_level,
+        "board_name": BOARD_LABELS[board_level][0],
+        "depth": depth,
+        "nodes": BoardNodeSerializer(nodes, many=True).data,
+    })
 
 # --- ADMIN PANEL DATA ---
 
@@ -450,28 +554,18 @@ def matrix_tree_view(request):
     if board not in ['1', '2', '3', '4', '5']:
         board = '1'
         # --- Level 1 (Board 2) ---
-    left_field = f'left_child_b{board}'
-    right_field = f'right_child_b{board}'
-
-    # --- Level 1 ---
-    l1_left = getattr(p, left_field, None)
-    l1_right = getattr(p, right_field, None)
-
-    # --- Level 2 ---
-    # We look at the children of our Level 1 nodes
-    l2_ll = getattr(l1_left, left_field, None) if l1_left else None
-    l2_lr = getattr(l1_left, right_field, None) if l1_left else None
-    l2_rl = getattr(l1_right, left_field, None) if l1_right else None
-    l2_rr = getattr(l1_right, right_field, None) if l1_right else None    
+    # Member, shoulders and payline (usernames included) in two queries
+    tree = get_board_tree(p, int(board))
     
     context = {
-        'head': p,
-        'l1_left': l1_left,
-        'l1_right': l1_right,
-        'l2_ll': l2_ll,
-        'l2_lr': l2_lr,
-        'l2_rl': l2_rl,
-        'l2_rr': l2_rr,
+        'head': tree['root'],
+        'l1_left': tree['shoulders']['left'],
+        'l1_right': tree['shoulders']['right'],
+        'l2_ll': tree['payline']['ll'],
+        'l2_lr': tree['payline']['lr'],
+        'l2_rl': tree['payline']['rl'],
+        'l2_rr': tree['payline']['rr'],
+        'boards': [tree],
         'current_board': board
     }
     return render(request, 'matrix/matrix_tree.html', context)
@@ -487,28 +581,65 @@ def admin_summary_view(request):
     if not request.user.is_staff:
         return JsonResponse({"error": "Unauthorized"}, status=403)
 
-    stats = AdminRevenue.objects.first() 
-    active_count = MemberProfile.objects.filter(is_active=True).count()
-    
+    # Counters kept up to date by the member/cycle/withdrawal events, cached for a few seconds
+    snapshot = platform_stats()
+    stats = snapshot['revenue']
+    summary = {
+        "active_members": snapshot['active_members'],
+        "members_per_board": {f"board_{b}": count for b, count in snapshot['boards'].items()},
+        "pending_withdrawals": snapshot['pending_withdrawals'],
+        "pending_withdrawals_total": "{:.2f}".format(snapshot['pending_withdrawals_total']),
+        "cycles_today": snapshot['cycles_today'],
+        "as_of": snapshot['as_of'].isoformat(),
+    }
+
     if not stats:
         return JsonResponse({
             "platform_profit": "0.00",
-            "active_members": active_count,
+            **summary,
             "status": "No revenue data yet"
         })
 
     data = {
-        "platform_profit": "{:.2f}".format(stats.total_fees_collected),
-        "board_1_rev": "{:.2f}".format(stats.b1_fees),
-        "board_2_rev": "{:.2f}".format(stats.b2_fees),
-        "board_3_rev": "{:.2f}".format(stats.b3_fees), # Add these
-        "board_4_rev": "{:.2f}".format(stats.b4_fees),
-        "board_5_rev": "{:.2f}".format(stats.b5_fees),
-        "active_members": active_count,
+        "platform_profit": "{:.2f}".format(stats['total_fees_collected']),
+        "board_1_rev": "{:.2f}".format(stats['b1_fees']),
+        "board_2_rev": "{:.2f}".format(stats['b2_fees']),
+        "board_3_rev": "{:.2f}".format(stats['b3_fees']), # Add these
+        "board_4_rev": "{:.2f}".format(stats['b4_fees']),
+        "board_5_rev": "{:.2f}".format(stats['b5_fees']),
+        **summary,
         "vault_health": "STABLE"
     }
     return JsonResponse(data) 
 
+@login_required
+def request_metrics_page(request):
+    if not request.user.is_staff:
+        return redirect('dashboard')
+    return render(request, 'matrix/request_metrics.html', {
+        'offenders': metrics.top_offenders(limit=15),
+        'sample_rate': metrics.sample_rate(),
+        'window': metrics.window_size(),
+    })
+
+@login_required
+def request_metrics_data(request):
+    if not request.user.is_staff:
+        return JsonResponse({"error": "Unauthorized"}, status=403)
+
+    # Rolling per-view timings of the process serving this request
+    order = request.GET.get('order')
+    if order not in ('p50_ms', 'p95_ms', 'p99_ms', 'queries_max', 'requests'):
+        order = 'p95_ms'
+    limit = request.GET.get('limit', '')
+    data = {
+        "sample_rate": metrics.sample_rate(),
+        "window": metrics.window_size(),
+        "views": metrics.view_stats(order_by=order),
+    }
+    data.update(metrics.top_offenders(limit=int(limit) if limit.isdigit() else 10))
+    return JsonResponse(data)
+
 # views.py
 def confirm_payment_view(request, profile_id):
     profile = get_object_or_404(MemberProfile, id=profile_id)
@@ -519,7 +650,7 @@ def confirm_payment_view(request, profile_id):
     profile.is_active = True
     profile.save() # Step 1: Save the status
     
-    place_member_with_spillover(profile, profile.sponser, 1)
+    enqueue('spillover', profile, board=1)
 
     return redirect('dashboard')
 
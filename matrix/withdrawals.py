@@ -0,0 +1,146 @@
+import csv
+import uuid
+from collections import defaultdict
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.http import StreamingHttpResponse
+from .models import MemberProfile, Transaction, WithdrawalRequest
+from .dashboard import invalidate_dashboards
+from .revenue import record_withdrawal
+from .stats import pending_changed
+from .tracing import traced
+
+MONEY = DecimalField(max_digits=12, decimal_places=2)
+
+
+def annotate_available_balance(queryset):
+    """Adds available_balance (balance minus pending withdrawals) to a MemberProfile queryset, no extra queries."""
+    return queryset.annotate(available=F('balance') - F('pending_withdrawals'))
+
+
+def pending_from_requests():
+    """Subquery: the member's Pending withdrawal amounts summed from the request table (0 if none)."""
+    pending = WithdrawalRequest.objects.filter(
+        user_id=OuterRef('user_id'), status__iexact='pending'
+    ).order_by().values('user_id').annotate(total=Sum('amount')).values('total')
+    return Coalesce(Subquery(pending, output_field=MONEY), Value(Decimal('0.00')), output_field=MONEY)
+
+
+def pending_mismatches(queryset=None):
+    """Members whose maintained pending_withdrawals differs from their requests, annotated with the recomputed `recounted`."""
+    queryset = MemberProfile.objects.all() if queryset is None else queryset
+    return queryset.annotate(recounted=pending_from_requests()).filter(
+        ~Q(pending_withdrawals=F('recounted'))
+    )
+
+
+def reconcile_pending_withdrawals(fix=False):
+    """
+    Recomputes every member's pending total from the withdrawal table. Returns
+    [(profile pk, stored, recounted)] for the ones that were off; with fix=True
+    they are corrected in one UPDATE.
+    """
+    rows = list(pending_mismatches().values_list('pk', 'pending_withdrawals', 'recounted'))
+    if fix and rows:
+        MemberProfile.objects.filter(pk__in=[pk for pk, _, _ in rows]).update(
+            pending_withdrawals=pending_from_requests()
+        )
+    return rows
+
+
+BATCH_SIZE = 500
+
+
+def _case(amounts):
+    return Case(*[When(pk=pk, then=Value(amount)) for pk, amount in amounts.items()], output_field=MONEY)
+
+
+@traced()
+@transaction.atomic
+def approve_withdrawals(queryset):
+    """
+    Approves the Pending requests of queryset as one batch. Each member's
+    requests are taken in creation order while their balance covers them;
+    from the first one it can't cover, the rest of that member's requests
+    stay Pending. Balances are read in one query; deductions, pending
+    totals, revenue, status and the WITHDRAWAL ledger rows are written
+    set-based. Returns (batch token, approved count, total amount, skipped
+    [(request pk, username, amount)]).
+    """
+    requests = list(
+        queryset.filter(status__iexact='pending').select_for_update(of=('self',))
+        .order_by('created_at', 'pk').values_list('pk', 'user_id', 'amount', 'user__username')
+    )
+    profiles = MemberProfile.objects.filter(user_id__in={user_id for _, user_id, _, _ in requests})
+    profile_of, left = {}, {}
+    for pk, user_id, balance in profiles.values_list('pk', 'user_id', 'balance'):
+        profile_of[user_id], left[user_id] = pk, balance
+
+    approved, skipped = [], []
+    for pk, user_id, amount, username in requests:
+        if user_id in left and left[user_id] >= amount:
+            left[user_id] -= amount
+            approved.append((pk, user_id, amount))
+        else:
+            # Later requests of this member don't jump the queue
+            left.pop(user_id, None)
+            skipped.append((pk, username, amount))
+
+    batch = uuid.uuid4().hex
+    if not approved:
+        return batch, 0, Decimal('0.00'), skipped
+
+    debits = defaultdict(Decimal)
+    for _, user_id, amount in approved:
+        debits[profile_of[user_id]] += amount
+    pks = list(debits)
+    for start in range(0, len(pks), BATCH_SIZE):
+        chunk = {pk: debits[pk] for pk in pks[start:start + BATCH_SIZE]}
+        debit = _case(chunk)
+        MemberProfile.objects.filter(pk__in=list(chunk)).update(
+            balance=F('balance') - debit,
+            wallet=F('wallet') - debit,
+            pending_withdrawals=F('pending_withdrawals') - debit,
+        )
+
+    # Straight UPDATE: WithdrawalRequest.save() would deduct a second time
+    request_pks = [pk for pk, _, _ in approved]
+    for start in range(0, len(request_pks), BATCH_SIZE):
+        WithdrawalRequest.objects.filter(pk__in=request_pks[start:start + BATCH_SIZE]).update(
+            status='Paid', payout_batch=batch
+        )
+    Transaction.objects.bulk_create([
+        Transaction(profile_id=profile_of[user_id], tx_type='WITHDRAWAL', amount=-amount, detail="Withdrawal Paid")
+        for _, user_id, amount in approved
+    ], batch_size=BATCH_SIZE)
+
+    total = sum(debits.values(), Decimal('0.00'))
+    record_withdrawal(total)
+    pending_changed(-len(approved), -total)
+    invalidate_dashboards(pks)
+    return batch, len(approved), total, skipped
+
+
+class _Echo:
+    # csv.writer target that hands each row straight back
+    def write(self, value):
+        return value
+
+
+def payout_rows(batch):
+    """CSV lines (header first) of a payout batch: username, address, net amount, fee."""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(['username', 'wallet_address', 'net_amount', 'fee'])
+    rows = WithdrawalRequest.objects.filter(payout_batch=batch).order_by('pk').values_list(
+        'user__username', 'wallet_address', 'net_amount', 'fee'
+    )
+    for row in rows.iterator(chunk_size=2000):
+        yield writer.writerow(row)
+
+
+def payout_csv_response(batch):
+    response = StreamingHttpResponse(payout_rows(batch), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="payouts-{batch}.csv"'
+    return response